@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""意味解析器 (各解析器を順に実行/FusedAnalyzer) の差分検査と処理時間の計測
+
+samples_* と生成したプログラム, 生成したプログラムの識別子をランダムに
+入れ替えてエラーを起こすようにしたものについて, 両方の方法が同じ構文木,
+同じエラー/警告 (数とメッセージ) を出力することを確認してから計測する
+
+$ python benchmarks/analyzer.py [-n 5000] [-r 3]
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import glob
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import program
+from tinyc import analyzer
+from tinyc.parser import Parser
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class MessageHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def chain(nasm):
+    analyzers = [
+        analyzer.SymbolAnalyzer(),
+        analyzer.SymbolReplaceAnalyzer(),
+        analyzer.FunctionAnalyzer(),
+    ]
+    if nasm:
+        analyzers.append(analyzer.ParameterAnalyzer())
+        analyzers.append(analyzer.RegisterAnalyzer())
+    return analyzers
+
+
+def fused(nasm):
+    return [analyzer.FusedAnalyzer(nasm=nasm)]
+
+
+def analyze(factory, parser, data, nasm=True):
+    """構文木, エラー/警告の数, 出力されたメッセージを返す"""
+    handler = MessageHandler()
+    logger = logging.getLogger()
+    logger.addHandler(handler)
+    try:
+        ast = parser.parse(data)
+        errors = warnings = 0
+        try:
+            for a in factory(nasm):
+                a.analyze(ast)
+                errors += a.errors
+                warnings += a.warnings
+        except Exception as e:
+            # 既存の解析器が例外を送出する入力は, 同じ例外になることを確認する
+            return type(e).__name__, handler.messages
+        text = analyzer.PrintAnalyzer().analyze(ast)
+    finally:
+        logger.removeHandler(handler)
+    return text, errors, warnings, handler.messages
+
+
+def mutate(data, seed):
+    """識別子をいくつかランダムに入れ替えたプログラムを返す"""
+    r = random.Random(seed)
+    names = sorted(set(re.findall(r'\b[fgpv]\d+\b', data))) + ['u0']
+    matches = list(re.finditer(r'\b[fgpv]\d+\b', data))
+    replaced = dict((m.start(), m) for m in r.sample(matches, min(5, len(matches))))
+    result = []
+    last = 0
+    for start in sorted(replaced):
+        result.append(data[last:start])
+        result.append(r.choice(names))
+        last = replaced[start].end()
+    result.append(data[last:])
+    return ''.join(result)
+
+
+def differential(parser, sources):
+    failures = 0
+    for name, data in sources:
+        for nasm in (True, False):
+            if analyze(chain, parser, data, nasm) != analyze(fused, parser, data, nasm):
+                failures += 1
+                print('MISMATCH: {0} (nasm={1})'.format(name, nasm))
+    return failures
+
+
+def measure(factory, parser, data, repeat):
+    best = None
+    for i in range(repeat):
+        ast = parser.parse(data)
+        start = time.time()
+        for a in factory(True):
+            a.analyze(ast)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    parser = Parser(engine='rd', lexer='regex')
+    parser.build()
+
+    sources = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'samples_*', '*.tc'))):
+        with open(path) as f:
+            sources.append((os.path.relpath(path, ROOT), f.read()))
+    for seed in range(args.programs):
+        data = program(20, seed=seed)
+        sources.append(('generated (seed={0})'.format(seed), data))
+        sources.append(('mutated (seed={0})'.format(seed), mutate(data, seed)))
+    failures = differential(parser, sources)
+    print('differential: {0} programs, {1} mismatches'.format(
+        len(sources), failures))
+    if failures:
+        return 1
+
+    data = program(args.n)
+    print('input: {0} functions'.format(args.n))
+    for name, factory in (('chain', chain), ('fused', fused)):
+        elapsed = measure(factory, parser, data, args.r)
+        print('{0}: {1:.3f} s'.format(name, elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=5000,
+                        help='Number of functions in the timed program')
+    parser.add_argument('-r', type=int, default=3, help='Number of runs')
+    parser.add_argument('-p', '--programs', type=int, default=100,
+                        help='Number of generated programs to compare')
+    sys.exit(main(parser.parse_args()))
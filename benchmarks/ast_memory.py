@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""構文木のメモリ使用量を計測する (関数 10000 個あたりのバイト数)
+
+生成したプログラムを構文解析し, 意味解析とコード生成 (NASM) で属性を
+追加した後の構文木から到達できるオブジェクト (ノード, リスト, 属性の
+辞書, 文字列, 整数) の大きさを sys.getsizeof で合計する.
+共有されているオブジェクト (同じ名前の文字列, 同じ値の定数など) は 1 回だけ数える.
+Python 2 には tracemalloc がないため, 最後にプロセスの最大 RSS も表示する
+
+$ python benchmarks/ast_memory.py [-n 10000] [--parser rd]
+"""
+
+from __future__ import division, print_function, unicode_literals
+import argparse
+import logging
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import program
+from tinyc import analyzer, generator, token
+from tinyc.parser import Parser
+
+
+LEAVES = (bytes, type(''), int, long, float)
+
+
+def deep_size(root):
+    """root から到達できる構文木のオブジェクトの大きさの合計とノード数を返す"""
+    seen = set()
+    stack = [root]
+    size = 0
+    nodes = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, token.Node):
+            nodes += 1
+            size += sys.getsizeof(obj)
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for klass in type(obj).__mro__:
+                for name in klass.__dict__.get('__slots__', ()):
+                    value = getattr(obj, name, None)
+                    if value is not None:
+                        stack.append(value)
+        elif isinstance(obj, dict):
+            # 属性の辞書 (キーは intern された属性名なので数えない)
+            size += sys.getsizeof(obj)
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            size += sys.getsizeof(obj)
+            stack.extend(obj)
+        elif isinstance(obj, LEAVES):
+            size += sys.getsizeof(obj)
+        # シンボルテーブル, ラベルなど構文木以外のオブジェクトは数えない
+    return size, nodes
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    data = program(args.n, seed=args.seed)
+
+    parser = Parser(engine=args.parser, lexer=args.lexer)
+    parser.build()
+    start = time.time()
+    ast = parser.parse(data)
+    del data
+    for a in (analyzer.SymbolAnalyzer(), analyzer.SymbolReplaceAnalyzer(),
+              analyzer.FunctionAnalyzer(), analyzer.ParameterAnalyzer(),
+              analyzer.RegisterAnalyzer()):
+        a.analyze(ast)
+    generator.NASMx86Generator().analyze(ast, format='elf')
+    elapsed = time.time() - start
+
+    size, nodes = deep_size(ast)
+    scale = 10000 / args.n
+    print('input: {0} functions, {1} nodes ({2:.3f} s)'.format(
+        args.n, nodes, elapsed))
+    print('AST: {0:.1f} MiB per 10k functions, {1:.1f} bytes per node'.format(
+        size * scale / 2 ** 20, size / nodes))
+    print('max RSS: {0:.1f} MiB'.format(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=10000,
+                        help='Number of functions in the input program')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--parser', choices=Parser.engines, default='rd')
+    parser.add_argument('--lexer', default='regex')
+    sys.exit(main(parser.parse_args()))
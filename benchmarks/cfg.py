@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""制御フローグラフ (tinyc.cfg) の作成時間が命令数にほぼ比例することを確認する
+
+生成したプログラムと, while ループを深く入れ子にした関数をコンパイルした
+コードについて, 基本ブロックへの分割, 支配木, ループの入れ子を求める時間を計測する
+
+$ python benchmarks/cfg.py [-f 300 3000] [-d 100 1000 3000]
+"""
+
+from __future__ import division, print_function, unicode_literals
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import program
+from tinyc import analyzer, cfg, generator
+from tinyc.code import CodeList
+from tinyc.parser import Parser
+
+
+def nested(depth):
+    """while ループが depth 段入れ子になった関数を返す"""
+    lines = ['int f(int a) {', 'int i;', 'i = a;']
+    lines += ['while (i < {0}) {{'.format(d) for d in range(depth)]
+    lines += ['i = i + 1; }'] * depth
+    lines += ['return i;', '}']
+    return '\n'.join(lines) + '\n'
+
+
+def compiled(parser, data):
+    ast = parser.parse(data)
+    for a in (analyzer.SymbolAnalyzer(), analyzer.SymbolReplaceAnalyzer(),
+              analyzer.FunctionAnalyzer(), analyzer.ParameterAnalyzer(),
+              analyzer.RegisterAnalyzer()):
+        a.analyze(ast)
+    gen = generator.NASMx86Generator()
+    gen.analyze(ast, format='elf', optimize=True)
+    return CodeList(gen.code)
+
+
+def measure(label, code):
+    start = time.time()
+    graphs = cfg.build(code)
+    elapsed = time.time() - start
+    blocks = sum(len(g.blocks) for g in graphs)
+    loops = sum(len(g.loops) for g in graphs)
+    depth = max([l.depth for g in graphs for l in g.loops] + [0])
+    print('{0:>24}: {1:>8} lines, {2:>7} blocks, {3:>6} loops '
+          '(depth {4:>4}): {5:7.3f} s, {6:.2f} us/line'.format(
+              label, len(code), blocks, loops, depth, elapsed,
+              elapsed / len(code) * 1e6))
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    # 入れ子の深いループを再帰せずに解析できるように PLY を用いる
+    parser = Parser(engine='ply', lexer='regex')
+    parser.build()
+    for n in args.f:
+        measure('{0} functions'.format(n), compiled(parser, program(n)))
+    for d in args.d:
+        measure('{0} nested loops'.format(d), compiled(parser, nested(d)))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-f', type=int, nargs='+', default=[300, 3000],
+                        help='Number of functions in the generated programs')
+    parser.add_argument('-d', type=int, nargs='+', default=[100, 1000, 3000],
+                        help='Depth of the nested loops')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""深い構文木 (n 項の加算式) の意味解析とコード生成の処理時間を計測する
+
+return a + a + ... + a; の構文木は深さが n 程度になるが, 解析器は
+明示的なスタックで走査するため, 再帰の上限を変更せずに処理できることを確認する
+
+$ python benchmarks/deep.py [-n 100000]
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tinyc import analyzer, generator
+from tinyc.parser import Parser
+
+
+def program(n):
+    return 'int f(int a) {{ return {0}; }}\n'.format(' + '.join(['a'] * n))
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    data = program(args.n)
+    print('input: {0} terms, recursion limit {1}'.format(
+        args.n, sys.getrecursionlimit()))
+
+    for engine in Parser.engines:
+        parser = Parser(engine=engine, lexer='regex')
+        parser.build()
+        start = time.time()
+        ast = parser.parse(data, optimize=False)
+        parsed = time.time()
+        for a in (analyzer.SymbolAnalyzer(), analyzer.SymbolReplaceAnalyzer(),
+                  analyzer.FunctionAnalyzer(), analyzer.ParameterAnalyzer(),
+                  analyzer.RegisterAnalyzer()):
+            a.analyze(ast)
+        analyzed = time.time()
+        gen = generator.NASMx86Generator()
+        gen.analyze(ast, format='elf', optimize=False)
+        generated = time.time()
+        print('{0:>3}: parse {1:.3f} s, analyze {2:.3f} s, '
+              'generate {3:.3f} s ({4} instructions)'.format(
+                  engine, parsed - start, analyzed - parsed,
+                  generated - analyzed, len(gen.code)))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=100000,
+                        help='Number of terms in the expression')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""スタックフレームの大きさの計測
+
+samples_nasm のプログラムと生成したプログラムについて, コード生成器が
+確保したスタックフレーム, レジスタ割り付け後 (StackSlotOptimizer の前),
+StackSlotOptimizer で縮めた後のバイト数の合計を出力する
+
+$ python benchmarks/frames.py [-f 300 3000]
+"""
+
+from __future__ import division, print_function, unicode_literals
+import argparse
+import glob
+import logging
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cfg import compiled
+from generate import program
+from tinyc import optimizer
+from tinyc.code import Code, Registers
+from tinyc.parser import Parser
+
+
+def generated_frames(code):
+    """コード生成器が確保したスタックフレームのバイト数の合計を返す"""
+    total = 0
+    previous = None
+    for line in code:
+        if not isinstance(line, Code):
+            continue
+        if (line.op == 'sub' and line.args[0] == Registers.esp
+                and previous is not None and previous.op == 'mov'
+                and list(previous.args) == [Registers.ebp, Registers.esp]):
+            total += int(line.args[1])
+        previous = line
+    return total
+
+
+def measure(label, code):
+    generated = generated_frames(code)
+    o = optimizer.PeepholeOptimizer()
+    o.optimize(code)
+    before = sum(f[1] for f in o.frames)
+    after = sum(f[2] for f in o.frames)
+    print('{0:>24}: generated {1:>7} bytes, allocated {2:>7} bytes, '
+          'coloured {3:>7} bytes ({4:.1f}%)'.format(
+              label, generated, before, after,
+              100 * after / generated if generated else 100.0))
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    parser = Parser(engine='ply', lexer='regex')
+    parser.build()
+    for path in sorted(glob.glob(os.path.join(ROOT, 'samples_nasm', '*.tc'))):
+        name = os.path.basename(path)
+        if name == 'err.tc':
+            continue
+        with open(path) as f:
+            measure(name, compiled(parser, f.read()))
+    for n in args.f:
+        measure('{0} functions'.format(n), compiled(parser, program(n)))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-f', type=int, nargs='+', default=[300, 3000],
+                        help='Number of functions in the generated programs')
+    sys.exit(main(parser.parse_args()))
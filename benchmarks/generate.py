@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ベンチマーク用に Tiny C のプログラムを生成するモジュール
+
+生成するプログラムは意味解析でエラーにならない (宣言済みの変数と,
+定義済みの関数を正しい引数の数で呼び出す) ことを保証する
+
+$ python benchmarks/generate.py [-n 100] [-s seed] > random.tc
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import random
+
+
+BINARY = ('+', '-', '*', '/', '<', '<=', '>', '>=', '==', '!=', '&&', '||')
+
+
+class ProgramGenerator(object):
+    def __init__(self, seed=0, max_depth=3):
+        self.random = random.Random(seed)
+        self.max_depth = max_depth
+
+    def program(self, functions=10, globals_=3):
+        self.globals = ['g{0}'.format(i) for i in range(globals_)]
+        self.functions = []
+        lines = []
+        if self.globals:
+            lines.append('int {0};'.format(', '.join(self.globals)))
+        for i in range(functions):
+            lines.append(self.function('f{0}'.format(i)))
+        return '\n'.join(lines) + '\n'
+
+    def function(self, name):
+        r = self.random
+        self.params = ['p{0}'.format(i) for i in range(r.randint(0, 3))]
+        self.scopes = [list(self.globals) + self.params]
+        self.nlocal = 0
+        params = ', '.join('int ' + p for p in self.params)
+        body = self.compound(1)
+        self.functions.append((name, len(self.params)))
+        return 'int {0}({1}) {2}'.format(name, params, body)
+
+    def _variables(self):
+        return [v for scope in self.scopes for v in scope]
+
+    def compound(self, depth):
+        r = self.random
+        names = []
+        for i in range(r.randint(0, 3)):
+            names.append('v{0}'.format(self.nlocal))
+            self.nlocal += 1
+        self.scopes.append(names)
+        indent = '    ' * depth
+        lines = ['{']
+        if names:
+            lines.append(indent + 'int {0};'.format(', '.join(names)))
+        for i in range(r.randint(1, 4)):
+            lines.append(indent + self.statement(depth))
+        lines.append('    ' * (depth - 1) + '}')
+        self.scopes.pop()
+        return '\n'.join(lines)
+
+    def statement(self, depth):
+        r = self.random
+        kind = r.randint(0, 9 if depth < self.max_depth else 5)
+        if kind <= 3:
+            return self.assignment() + ';'
+        elif kind == 4:
+            return 'return {0};'.format(self.expr(2))
+        elif kind == 5:
+            return self.expr(2) + ';'
+        elif kind == 6:
+            return 'if ({0}) {1}'.format(self.expr(2), self.compound(depth + 1))
+        elif kind == 7:
+            return 'if ({0}) {1} else {2}'.format(
+                self.expr(2), self.compound(depth + 1),
+                self.compound(depth + 1))
+        elif kind == 8:
+            return 'while ({0} < {1}) {2}'.format(
+                self.expr(1), self.expr(1), self.compound(depth + 1))
+        return self.compound(depth + 1)
+
+    def assignment(self):
+        r = self.random
+        variables = self._variables()
+        if not variables:
+            return self.expr(2)
+        name = r.choice(variables)
+        kind = r.randint(0, 5)
+        if kind == 0:
+            return '++' + name
+        elif kind == 1:
+            return '--' + name
+        op = r.choice(('=', '=', '+=', '-='))
+        return '{0} {1} {2}'.format(name, op, self.expr(3))
+
+    def expr(self, depth):
+        r = self.random
+        variables = self._variables()
+        if depth <= 0 or r.random() < 0.3:
+            if variables and r.random() < 0.6:
+                return r.choice(variables)
+            return str(r.randint(0, 100))
+        kind = r.randint(0, 9)
+        if kind <= 5:
+            op = r.choice(BINARY)
+            right = self.expr(depth - 1)
+            if op == '/':
+                # 定数計算でゼロ除算にならないように, 除数は 0 でない定数にする
+                right = str(r.randint(1, 9))
+            return '({0} {1} {2})'.format(self.expr(depth - 1), op, right)
+        elif kind == 6:
+            return '(-{0})'.format(self.expr(depth - 1))
+        elif kind == 7 and self.functions:
+            name, nparams = r.choice(self.functions)
+            args = ', '.join(self.expr(depth - 1) for i in range(nparams))
+            return '{0}({1})'.format(name, args)
+        return self.expr(depth - 1)
+
+
+def program(functions=10, seed=0, **kwargs):
+    """関数を functions 個含むプログラムを生成する"""
+    return ProgramGenerator(seed=seed, **kwargs).program(functions)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a Tiny C program')
+    parser.add_argument('-n', type=int, default=100,
+                        help='Number of functions')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(program(args.n, args.seed), end='')
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""字句解析器 (PLY/Scanner) の差分検査と処理速度 (tokens/s) の計測
+
+すべての samples_* と生成したプログラム, 長い空白やコメントの並びで
+終わる (または不正な文字が続く) 入力について, 両方の字句解析器が同じ
+トークン列 (種類, 値, 行番号, 位置) とエラーの数を返すことを確認し,
+後者の処理時間を出力してから計測する
+
+$ python benchmarks/lexer.py [-n 5000] [-r 3] [-b 10000]
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import program
+from tinyc.lexer import Lexer
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def tokenize(engine, data):
+    lexer = Lexer()
+    lexer.build(engine=engine)
+    lexer.lexer.input(data)
+    tokens = []
+    while True:
+        tok = lexer.lexer.token()
+        if tok is None:
+            return tokens, lexer.errors
+        tokens.append((tok.type, tok.value, tok.lineno, tok.lexpos))
+
+
+def runs(length):
+    """空白, 改行, コメントの長い並びで終わる入力 (名前, 入力) のリスト
+
+    読み飛ばしの正規表現にあいまいさがあると, 後にトークンが続かない
+    並びで照合のやり直しが指数的に増える
+    """
+    head = 'int main() { return 0; }'
+    blanks = [('spaces', ' ' * length), ('tabs', '\t' * length),
+              ('newlines', '\n' * length), ('mixed', ' \t\n' * length),
+              ('comments', '/* c */ ' * length)]
+    cases = []
+    for name, blank in blanks:
+        cases.append(('{0} at EOF'.format(name), head + blank))
+        cases.append(('{0} before an illegal character'.format(name),
+                      head + blank + '@ ' + blank))
+    return cases
+
+
+def throughput(engine, data, repeat):
+    best = None
+    for i in range(repeat):
+        lexer = Lexer()
+        lexer.build(engine=engine)
+        token = lexer.lexer.token
+        start = time.time()
+        lexer.lexer.input(data)
+        n = 0
+        while token() is not None:
+            n += 1
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return n, best
+
+
+def main(args):
+    sources = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'samples_*', '*.tc'))):
+        with open(path) as f:
+            sources.append((os.path.relpath(path, ROOT), f.read()))
+    for seed in range(args.programs):
+        sources.append(('generated (seed={0})'.format(seed),
+                        program(20, seed=seed)))
+
+    failures = 0
+    for name, data in sources:
+        if tokenize('ply', data) != tokenize('regex', data):
+            failures += 1
+            print('MISMATCH: {0}'.format(name))
+    print('differential: {0} programs, {1} mismatches'.format(
+        len(sources), failures))
+
+    logging.disable(logging.CRITICAL)
+    for name, data in runs(args.blank):
+        start = time.time()
+        tokens = tokenize('regex', data)
+        elapsed = time.time() - start
+        if tokens != tokenize('ply', data):
+            failures += 1
+            print('MISMATCH: {0}'.format(name))
+        print('{0:>36}: {1:.3f} s'.format(name, elapsed))
+    logging.disable(logging.NOTSET)
+    if failures:
+        return 1
+
+    data = program(args.n)
+    print('input: {0} functions, {1} bytes'.format(args.n, len(data)))
+    for engine in Lexer.engines:
+        n, elapsed = throughput(engine, data, args.r)
+        print('{0:>5}: {1:.3f} s, {2:.0f} tokens/s'.format(
+            engine, elapsed, n / elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=5000,
+                        help='Number of functions in the timed program')
+    parser.add_argument('-r', type=int, default=3, help='Number of runs')
+    parser.add_argument('-p', '--programs', type=int, default=50,
+                        help='Number of generated programs to compare')
+    parser.add_argument('-b', '--blank', type=int, default=10000,
+                        help='Length of the whitespace/comment runs')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ループ内のジャンプ命令の数の比較
+
+samples_nasm のプログラムを最適化レベルごとにコンパイルし, 制御フローグラフ
+(tinyc.cfg) の自然ループに含まれる無条件ジャンプ (jmp) と条件ジャンプの数,
+ループの外に出る命令の数, 16 バイト境界にそろえたループのヘッダの数を出力する.
+ループを反転すると, 1 回の繰り返しで実行するジャンプは末尾の条件ジャンプ 1 つになる
+
+$ python benchmarks/loops.py [while.tc gcd.tc ss.tc]
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import logging
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tinyc import analyzer, cfg, generator, optimizer
+from tinyc.code import Align, CodeList
+from tinyc.parser import Parser
+
+
+def compiled(parser, data, level):
+    ast = parser.parse(data)
+    for a in (analyzer.SymbolAnalyzer(), analyzer.SymbolReplaceAnalyzer(),
+              analyzer.FunctionAnalyzer(), analyzer.ParameterAnalyzer(),
+              analyzer.RegisterAnalyzer()):
+        a.analyze(ast)
+    gen = generator.NASMx86Generator()
+    gen.analyze(ast, format='elf', optimize=level > 0)
+    code = CodeList(gen.code)
+    if level > 0:
+        optimizer.PeepholeOptimizer(layout=level > 1).optimize(code)
+    return code
+
+
+def measure(name, code, level):
+    loops = jmp = jcc = exits = 0
+    for graph in cfg.build(code):
+        for loop in graph.loops:
+            loops += 1
+            for block in loop.blocks:
+                last = block.terminator
+                if last is None:
+                    continue
+                if last.op == 'jmp':
+                    jmp += 1
+                elif last.op in cfg.CONDITIONAL_JUMPS:
+                    jcc += 1
+                exits += sum(1 for s in block.successors if s not in loop)
+    aligned = sum(1 for line in code if isinstance(line, Align))
+    print('{0:>12} -O{1}: {2:>3} loops {3:>4} jmp {4:>4} jcc {5:>4} exits '
+          '{6:>3} aligned'.format(name, level, loops, jmp, jcc, exits,
+                                  aligned))
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    parser = Parser(engine='ply', lexer='regex')
+    parser.build()
+    for name in args.files:
+        with open(os.path.join(ROOT, 'samples_nasm', name)) as f:
+            data = f.read()
+        for level in range(3):
+            measure(name, compiled(parser, data, level), level)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='*',
+                        default=['while.tc', 'gcd.tc', 'ss.tc'],
+                        help='Programs in samples_nasm')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""覗き穴最適化 (NASM) の走査量と処理時間の計測
+
+各最適化器が書き換える命令 (重複/未使用のラベル, 直後へのジャンプ,
+ジャンプ後の命令, add R, 0, ストア直後のロード, mov R, 0 など) を含む
+関数を並べたコードと, 生成したプログラムをコンパイルしたコードについて,
+以前の方法 (6 つの最適化器を変更がなくなるまで最大 5 回繰り返す) と
+PeepholeOptimizer (作業リストで変更の近傍だけを再検査する) を比較する.
+worklist はデータフロー解析を用いる最適化器を省いた作業リストの処理だけを,
+dataflow はそれらを含めた -O1 と同じ最適化全体を計測する.
+走査量は検査した行の数で, 以前の方法は各最適化器がコード全体を
+少なくとも 1 回走査するものとして, dataflow は解析を用いる最適化器も
+それぞれ 1 回走査するものとして数える
+
+$ python benchmarks/optimizer.py [-n 10000 100000] [-f 300]
+"""
+
+from __future__ import division, print_function, unicode_literals
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import program as generated
+from tinyc import analyzer, generator, optimizer
+from tinyc.parser import Parser
+from tinyc.code import (
+    Code, CodeList, Comment, Common, Data, Extern, Global, Label, Memory,
+    Registers, Section)
+
+
+def function(i):
+    """最適化の対象を含む関数 1 つ分のコードを返す"""
+    name = Label('f{0}'.format(i), glob=True)
+    callee = Label('g{0}'.format(i % 10), glob=True)
+    ret = Label('L{0}_return'.format(i))
+    skip = Label('L{0}_skip'.format(i))
+    dup = Label('L{0}_dup'.format(i))
+    unused = Label('L{0}_unused'.format(i))
+    return [
+        Global(name),
+        '',
+        name,
+        Code('push', Registers.ebp),
+        Code('mov', Registers.ebp, Registers.esp),
+        Code('sub', Registers.esp, 8),
+        Code('mov', Registers.eax, Memory(Registers.ebp, 8), comment='id'),
+        Code('mov', Memory(Registers.ebp, -4), Registers.eax, comment='store'),
+        Code('mov', Registers.eax, Memory(Registers.ebp, -4), comment='load'),
+        Code('add', Registers.eax, 0, comment='add'),
+        Code('imul', Registers.eax, 1, comment='mult'),
+        Code('mov', Memory(Registers.ebp, -8), Registers.eax, comment='store'),
+        Code('mov', Registers.eax, 0, comment='constant'),
+        Code('inc', Registers.eax, comment='increment'),
+        Code('cmp', Registers.eax, Data(name), comment='compare'),
+        Code('je', dup),
+        Code('jmp', skip),
+        Code('mov', Registers.eax, 1, comment='dead'),
+        skip,
+        dup,
+        unused,
+        Comment('call'),
+        Extern(callee),
+        Code('push', Registers.eax, comment='argument 1'),
+        Code('call', callee),
+        Code('add', Registers.esp, 4, comment='Release argument stack'),
+        ret,
+        Code('mov', Registers.esp, Registers.ebp),
+        Code('pop', Registers.ebp),
+        Code('ret'),
+    ]
+
+
+def program(n):
+    """命令数が n 程度のコードを返す"""
+    code = [Global(Label('g0', glob=True)), Common(Label('g0', glob=True)),
+            '', Section('text')]
+    i = 0
+    while len(code) < n:
+        code.extend(function(i))
+        i += 1
+    return code
+
+
+def compiled(n):
+    """n 個の関数を持つ生成したプログラムをコンパイルしたコードを返す"""
+    parser = Parser(engine='rd', lexer='regex')
+    parser.build()
+    ast = parser.parse(generated(n))
+    for a in (analyzer.SymbolAnalyzer(), analyzer.SymbolReplaceAnalyzer(),
+              analyzer.FunctionAnalyzer(), analyzer.ParameterAnalyzer(),
+              analyzer.RegisterAnalyzer()):
+        a.analyze(ast)
+    gen = generator.NASMx86Generator()
+    gen.analyze(ast, format='elf', optimize=True)
+    return gen.code
+
+
+def rounds(code):
+    """以前の Compiler._optimize_nasm と同じく, 最大 5 回繰り返す"""
+    optimized = scanned = 0
+    for i in range(5):
+        temp = optimized
+        for o in (optimizer.LabelOptimizer(),
+                  optimizer.GlobalExternOptimizer(),
+                  optimizer.JumpOptimizer(),
+                  optimizer.UnnecessaryCodeOptimizer(),
+                  optimizer.ReplaceCodeOptimizer(),
+                  optimizer.StackPointerOptimzier()):
+            scanned += len(code)
+            code = o.optimize(code)
+            optimized += o.optimized
+        if optimized == temp:
+            break
+    return code, optimized, scanned
+
+
+def worklist(code, dataflow=False):
+    o = optimizer.PeepholeOptimizer(dataflow=dataflow)
+    code = o.optimize(code)
+    return code, o.optimized, o.scanned + o.examined
+
+
+def measure(make):
+    # 最適化器は行をその場で書き換えるため, 方法ごとにコードを作成する
+    for name, strategy in (
+            ('rounds', rounds), ('worklist', worklist),
+            ('dataflow', lambda code: worklist(code, dataflow=True))):
+        code = CodeList(make())
+        count = len(code)
+        start = time.time()
+        code, optimized, scanned = strategy(code)
+        elapsed = time.time() - start
+        print('  {0:>8}: {1:>8} -> {2:>8} lines ({3:>7} optimized), '
+              '{4:>9} lines scanned ({5:.1f}/line), {6:7.3f} s'.format(
+                  name, count, len(code), optimized, scanned,
+                  scanned / count, elapsed))
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    for n in args.n:
+        print('synthetic ({0} lines):'.format(n))
+        measure(lambda: program(n))
+    for n in args.f:
+        print('generated ({0} functions):'.format(n))
+        measure(lambda: compiled(n))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, nargs='+',
+                        default=[10000, 100000],
+                        help='Number of lines in the synthetic code')
+    parser.add_argument('-f', type=int, nargs='+', default=[300],
+                        help='Number of functions in the generated programs')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""構文解析器 (PLY/再帰下降) の差分検査と処理速度 (tokens/s) の計測
+
+すべての samples_* と生成したプログラム, 深い入れ子 (else if の連鎖, 括弧,
+代入の連鎖など) のプログラムについて, 両方の構文解析器が同じ構文木,
+同じエラー数, 同じ定数計算の回数を返すことを確認してから計測する
+
+$ python benchmarks/parser.py [-n 2000] [-r 3] [-d 5000]
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import program
+from tinyc import token
+from tinyc.analyzer import PrintAnalyzer
+from tinyc.lexer import Lexer
+from tinyc.parser import Parser
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse(engine, data, optimize):
+    parser = Parser(engine=engine)
+    parser.build()
+    ast = parser.parse(data, optimize=optimize)
+    text = PrintAnalyzer().analyze(ast) if ast is not None else ''
+    return text, parser.errors, parser.optimized
+
+
+def structure(ast):
+    """構文木を (クラス名, 属性の値, ...) を前順に並べたリストにする
+
+    PrintAnalyzer の出力は入れ子の深さに応じて字下げするため, 深い入れ子の
+    比較ではこちらを用いる (明示的なスタックで走査する)
+    """
+    result = []
+    stack = [ast]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, token.Node):
+            result.append(item.__class__.__name__)
+            values = []
+            for cls in item.__class__.__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    values.append(getattr(item, name, None))
+            stack.extend(reversed(values))
+        elif isinstance(item, list):
+            result.append(len(item))
+            stack.extend(reversed(item))
+        else:
+            result.append(item)
+    return result
+
+
+def parse_structure(engine, data, optimize):
+    parser = Parser(engine=engine)
+    parser.build()
+    ast = parser.parse(data, optimize=optimize)
+    return structure(ast), parser.errors, parser.optimized
+
+
+def nested(depth):
+    """入れ子の深さが depth のプログラム (名前, ソースコード) のリスト"""
+    head = 'int f(int x) {{ int y; {0} }}\n'
+    return [
+        ('else if ladder', head.format(''.join(
+            'if (x == {0}) return {0}; else '.format(i)
+            for i in range(depth)) + 'return -1;')),
+        ('parentheses', head.format(
+            'return ' + '(1 + ' * depth + 'x' + ')' * depth + ';')),
+        ('assignments', head.format(
+            'x = ' + 'y = x += ' * depth + '1; return x;')),
+        ('unary minus', head.format('return ' + '- ' * depth + 'x;')),
+        ('calls', head.format(
+            'return ' + 'f(x, ' * depth + 'x' + ')' * depth + ';')),
+        ('mixed expressions', head.format(
+            'return ' + '-(f(y = 2 * (x - ' * depth + 'x'
+            + '))))' * depth + ';')),
+        ('blocks', head.format('{ ' * depth + 'return x;' + '}' * depth)),
+        ('while loops', head.format(
+            'while (x) ' * depth + 'x = x - 1; return x;')),
+        ('dangling else', head.format(
+            'if (x) ' * depth + 'return 1; else return 2;')),
+        ('unclosed parentheses', head.format(
+            'return ' + '(' * depth + 'x;')),
+    ]
+
+
+def differential(sources, parse=parse):
+    failures = 0
+    for name, data in sources:
+        for optimize in (False, True):
+            expected = parse('ply', data, optimize)
+            actual = parse('rd', data, optimize)
+            if expected != actual:
+                failures += 1
+                print('MISMATCH: {0} (optimize={1})'.format(name, optimize))
+    return failures
+
+
+def count_tokens(data):
+    lexer = Lexer()
+    lexer.build()
+    lexer.lexer.input(data)
+    n = 0
+    while lexer.lexer.token() is not None:
+        n += 1
+    return n
+
+
+def throughput(engine, data, repeat):
+    best = None
+    for i in range(repeat):
+        parser = Parser(engine=engine)
+        parser.build()
+        start = time.time()
+        parser.parse(data)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(args):
+    # 差分検査ではエラーメッセージを出力しない
+    logging.disable(logging.CRITICAL)
+
+    sources = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'samples_*', '*.tc'))):
+        with open(path) as f:
+            sources.append((os.path.relpath(path, ROOT), f.read()))
+    for seed in range(args.programs):
+        sources.append(('generated (seed={0})'.format(seed),
+                        program(20, seed=seed)))
+    failures = differential(sources)
+    print('differential: {0} programs, {1} mismatches'.format(
+        len(sources), failures))
+    deep = nested(args.depth)
+    deep_failures = differential(deep, parse=parse_structure)
+    print('differential (depth={0}): {1} programs, {2} mismatches'.format(
+        args.depth, len(deep), deep_failures))
+    failures += deep_failures
+    if failures:
+        return 1
+
+    data = program(args.n)
+    tokens = count_tokens(data)
+    print('input: {0} functions, {1} tokens'.format(args.n, tokens))
+    for engine in Parser.engines:
+        elapsed = throughput(engine, data, args.r)
+        print('{0:>3}: {1:.3f} s, {2:.0f} tokens/s'.format(
+            engine, elapsed, tokens / elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=2000,
+                        help='Number of functions in the timed program')
+    parser.add_argument('-r', type=int, default=3, help='Number of runs')
+    parser.add_argument('-p', '--programs', type=int, default=50,
+                        help='Number of generated programs to compare')
+    parser.add_argument('-d', '--depth', type=int, default=5000,
+                        help='Nesting depth of the deeply nested programs')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""命令選択 (演算子ごとの規則/木のパターン照合) の比較
+
+samples_nasm のプログラムと生成したプログラムについて, NASMx86Generator と
+BURSx86Generator で生成したコードの, 最適化後の命令数, メモリオペランドの数,
+命令のコスト (tinyc.generator.burs のコストの見積もり) の合計と,
+コード生成にかかった時間を出力する
+
+$ python benchmarks/selector.py [-f 300 3000]
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate import program
+from tinyc import analyzer, generator, optimizer
+from tinyc.code import Code, CodeList, Data, Memory
+from tinyc.generator import burs
+from tinyc.parser import Parser
+
+
+GENERATORS = (
+    ('hand', generator.NASMx86Generator,),
+    ('burs', generator.BURSx86Generator,),
+)
+
+
+def cost(line):
+    """命令のコストの見積もり"""
+    if line.op == 'idiv':
+        result = burs.DIVIDE
+    elif line.op == 'imul':
+        result = burs.MULTIPLY
+    elif line.op == 'call':
+        result = burs.CALL
+    else:
+        result = 1
+    for arg in line.args:
+        if isinstance(arg, (Data, Memory,)):
+            result += burs.MEMORY
+    return result
+
+
+def measure(label, parser, data):
+    results = []
+    for name, cls in GENERATORS:
+        ast = parser.parse(data)
+        for a in (analyzer.SymbolAnalyzer(), analyzer.SymbolReplaceAnalyzer(),
+                  analyzer.FunctionAnalyzer(), analyzer.ParameterAnalyzer(),
+                  analyzer.RegisterAnalyzer()):
+            a.analyze(ast)
+        gen = cls()
+        start = time.time()
+        gen.analyze(ast, format='elf', optimize=True)
+        elapsed = time.time() - start
+        code = CodeList(gen.code)
+        optimizer.PeepholeOptimizer().optimize(code)
+        lines = [line for line in code if isinstance(line, Code)]
+        memory = sum(1 for line in lines for arg in line.args
+                     if isinstance(arg, (Data, Memory,)))
+        results.append('{0} {1:>7} lines {2:>7} mem {3:>8} cost {4:6.3f} s'
+                       .format(name, len(lines), memory,
+                               sum(cost(line) for line in lines), elapsed))
+    print('{0:>16}: {1}'.format(label, ' | '.join(results)))
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    parser = Parser(engine='ply', lexer='regex')
+    parser.build()
+    for path in sorted(glob.glob(os.path.join(ROOT, 'samples_nasm', '*.tc'))):
+        name = os.path.basename(path)
+        if name == 'err.tc':
+            continue
+        with open(path) as f:
+            measure(name, parser, f.read())
+    for n in args.f:
+        measure('{0} functions'.format(n), parser, program(n))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-f', type=int, nargs='+', default=[300, 3000],
+                        help='Number of functions in the generated programs')
+    sys.exit(main(parser.parse_args()))
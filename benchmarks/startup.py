@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""scripts/tcc の起動時間を解析表キャッシュの有無 (cold/warm) で比較する
+
+$ python benchmarks/startup.py [-n 10] [samples_nasm/fib.tc]
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TCC = os.path.join(ROOT, 'scripts', 'tcc')
+
+
+def run(source, cache_dir, output):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.time()
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(
+            [sys.executable, TCC, '-f', 'elf', '--cache-dir', cache_dir,
+             '-o', output, source], env=env, stderr=devnull)
+    return time.time() - start
+
+
+def main(args):
+    workdir = tempfile.mkdtemp()
+    output = os.path.join(workdir, 'out.asm')
+    try:
+        cold = []
+        for i in range(args.n):
+            # 毎回空のキャッシュディレクトリを使う
+            cold.append(run(args.source, tempfile.mkdtemp(dir=workdir), output))
+
+        warm_dir = os.path.join(workdir, 'warm')
+        run(args.source, warm_dir, output)
+        warm = [run(args.source, warm_dir, output) for i in range(args.n)]
+    finally:
+        shutil.rmtree(workdir)
+
+    for name, times in (('cold', cold), ('warm', warm)):
+        print('{0}: mean {1:.1f} ms, min {2:.1f} ms ({3} runs)'.format(
+            name, 1000 * sum(times) / len(times), 1000 * min(times), args.n))
+    print('speedup: {0:.2f}x'.format(min(cold) / min(warm)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=10, help='Number of runs')
+    parser.add_argument('source', nargs='?',
+                        default=os.path.join(ROOT, 'samples_nasm', 'fib.tc'))
+    main(parser.parse_args())
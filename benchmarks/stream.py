@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""一括コンパイルと --stream (メモリマップ, 外部宣言ごとのコンパイル) の
+最大メモリ使用量 (RSS) と処理時間を比較する
+
+どちらも再帰下降構文解析器と regex の字句解析器を用い, 出力が一致することを確認する
+
+$ python benchmarks/stream.py [-n 5000] [-O 0]
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import program
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TCC = os.path.join(ROOT, 'scripts', 'tcc')
+
+
+def run(source, output, stream, optimization):
+    """tcc を実行し, 処理時間と最大 RSS (KiB) を返す"""
+    args = [sys.executable, TCC, '-f', 'elf', '-O', str(optimization),
+            '-o', output]
+    if stream:
+        args.append('--stream')
+    else:
+        args.extend(['--parser', 'rd', '--lexer', 'regex'])
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.time()
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen(args + [source], env=env, stderr=devnull)
+        _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.time() - start
+    if status != 0:
+        raise RuntimeError('tcc failed: {0}'.format(status))
+    return elapsed, usage.ru_maxrss
+
+
+def main(args):
+    workdir = tempfile.mkdtemp()
+    source = os.path.join(workdir, 'large.tc')
+    try:
+        with open(source, 'w') as f:
+            f.write(program(args.n))
+        print('input: {0} functions, {1} bytes'.format(
+            args.n, os.path.getsize(source)))
+
+        outputs = []
+        for stream in (False, True):
+            output = os.path.join(workdir, 'stream.asm' if stream else 'batch.asm')
+            elapsed, rss = run(source, output, stream, args.O)
+            with open(output) as f:
+                outputs.append(f.read())
+            print('{0:>6}: {1:.3f} s, max RSS {2:.1f} MiB'.format(
+                'stream' if stream else 'batch', elapsed, rss / 1024.0))
+    finally:
+        shutil.rmtree(workdir)
+
+    if outputs[0] != outputs[1]:
+        print('MISMATCH: outputs differ')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=5000,
+                        help='Number of functions in the input program')
+    # 覗き穴最適化の時間が支配的にならないように, 既定では最適化しない
+    parser.add_argument('-O', choices=range(2), default=0, type=int,
+                        help='Optimization level (default: 0)')
+    sys.exit(main(parser.parse_args()))
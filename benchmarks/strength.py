@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""帰納変数の強さの低減 (tinyc.transform.StrengthReduction) の効果の計測
+
+while ループを入れ子にした関数 (カーネル) を生成し, -O1 で強さの低減を
+行わない場合と行う場合について, 実行する命令の数 (動的な命令の構成) を
+オペコードごとに見積もって出力する. カーネルの各ループはちょうど
+trips 回繰り返し, 条件分岐を含まないため, 制御フローグラフ (tinyc.cfg) で
+深さ d のループに含まれるブロックは trips ** d 回実行される
+
+$ python benchmarks/strength.py [-n 20] [-t 100] [--seed 1]
+"""
+
+from __future__ import division, print_function, unicode_literals
+import argparse
+import collections
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tinyc import analyzer, cfg, generator, optimizer, transform
+from tinyc.code import CodeList
+from tinyc.parser import Parser
+
+
+def kernel(rng, name, trips):
+    """ループの入れ子の深さが 1 から 3 のカーネルを返す
+
+    カウンタは ++i または i += c (c = 2, 4) で更新し, 最も内側の本体で
+    カウンタと定数/パラメータの積 (とその 1 次式) を足し合わせる
+    """
+    depth = rng.randint(1, 3)
+    counters = ['i{0}'.format(d) for d in range(depth)]
+    steps = [rng.choice((1, 2, 4)) for _ in counters]
+    lines = ['int {0}(int n, int k) {{'.format(name),
+             'int s, {0};'.format(', '.join(counters)), 's = 0;']
+    for counter, step in zip(counters, steps):
+        lines.append('{0} = 0;'.format(counter))
+        lines.append('while ({0} < {1}) {{'.format(counter, trips * step))
+    for _ in range(rng.randint(1, 3)):
+        term = '{0} * {1}'.format(rng.choice(counters),
+                                  rng.choice(('3', '4', '12', 'k', 'n')))
+        if rng.random() < 0.5:
+            term = 'n + ' + term
+        lines.append('s = s + ({0});'.format(term))
+    for counter, step in reversed(list(zip(counters, steps))):
+        if step == 1:
+            lines.append('++{0};'.format(counter))
+        else:
+            lines.append('{0} += {1};'.format(counter, step))
+        lines.append('}')
+    lines += ['return s;', '}']
+    return '\n'.join(lines)
+
+
+def compiled(parser, data, reduction):
+    ast = parser.parse(data)
+    for a in (analyzer.SymbolAnalyzer(), analyzer.SymbolReplaceAnalyzer(),
+              analyzer.FunctionAnalyzer(), analyzer.ParameterAnalyzer()):
+        a.analyze(ast)
+    transformers = [transform.LoopInvariantMotion()]
+    if reduction:
+        transformers.append(transform.StrengthReduction())
+    for t in transformers + [analyzer.RegisterAnalyzer()]:
+        t.analyze(ast)
+    gen = generator.NASMx86Generator()
+    gen.analyze(ast, format='elf', optimize=True)
+    code = CodeList(gen.code)
+    optimizer.PeepholeOptimizer().optimize(code)
+    return code
+
+
+def mix(code, trips):
+    """オペコードごとの実行回数の見積もり"""
+    counts = collections.Counter()
+    for graph in cfg.build(code):
+        for block in graph.blocks:
+            if not block.reachable:
+                continue
+            depth = block.loop.depth if block.loop is not None else 0
+            for line in block.codes():
+                counts[line.op.replace(' dword', '')] += trips ** depth
+    return counts
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    parser = Parser(engine='ply', lexer='regex')
+    parser.build()
+    rng = random.Random(args.seed)
+    total = [collections.Counter(), collections.Counter()]
+    print('{0:>8} {1:>12} {2:>12} {3:>12} {4:>12}'.format(
+        'kernel', 'imul', 'imul (sr)', 'total', 'total (sr)'))
+    for i in range(args.n):
+        name = 'k{0}'.format(i)
+        data = kernel(rng, name, args.trips)
+        counts = [mix(compiled(parser, data, reduction), args.trips)
+                  for reduction in (False, True)]
+        for t, c in zip(total, counts):
+            t.update(c)
+        print('{0:>8} {1:>12} {2:>12} {3:>12} {4:>12}'.format(
+            name, counts[0]['imul'], counts[1]['imul'],
+            sum(counts[0].values()), sum(counts[1].values())))
+    print('{0:>8} {1:>12} {2:>12} {3:>12} {4:>12}'.format(
+        'total', total[0]['imul'], total[1]['imul'],
+        sum(total[0].values()), sum(total[1].values())))
+    print()
+    print('{0:>8} {1:>12} {2:>12}'.format('op', '-O1', '-O1 (sr)'))
+    for op in sorted(set(total[0]) | set(total[1]),
+                     key=lambda op: -total[0][op] - total[1][op]):
+        print('{0:>8} {1:>12} {2:>12}'.format(op, total[0][op], total[1][op]))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=20, help='Number of kernels')
+    parser.add_argument('-t', '--trips', type=int, default=100,
+                        help='Iterations of each loop')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""シンボルテーブル (chain: スコープごとの SymbolTable/flat: ScopedSymbolTable)
+の差分検査と SymbolAnalyzer の処理時間の計測
+
+samples_* と生成したプログラム (識別子を入れ替えてエラーを起こすものを含む)
+について両方のテーブルが同じ構文木, 同じエラー/警告を出力することを確認してから,
+ブロックの入れ子が深いプログラムと局所変数の多いプログラムで計測する
+
+$ python benchmarks/symbols.py [-d 2000] [-l 2000] [-r 3]
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import glob
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import program
+from tinyc import analyzer
+from tinyc.parser import Parser
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class MessageHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def nested(depth, seed=0):
+    """ブロックが depth 段入れ子になった関数を返す
+
+    各ブロックで変数を 1 つ宣言し, 外側のブロックの変数, パラメータ,
+    グローバル変数を参照する (一部のブロックではパラメータを隠蔽する)
+    """
+    r = random.Random(seed)
+    lines = ['int g0;', 'int f(int p0, int p1) {', 'int v0;', 'v0 = p0 + g0;']
+    for i in range(1, depth):
+        name = 'p1' if i % 97 == 0 else 'v{0}'.format(i)
+        terms = ['v{0}'.format(r.randrange(i)) for _ in range(3)]
+        lines.append('{{ int {0}; {0} = {1} + p0 + g0;'.format(
+            name, ' + '.join(terms)))
+    lines.append('g0 = v0;')
+    lines.append('}' * (depth - 1))
+    lines.append('return v0;')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def locals_(n, seed=0):
+    """局所変数を n 個宣言し, それらを参照する関数を返す"""
+    r = random.Random(seed)
+    names = ['v{0}'.format(i) for i in range(n)]
+    lines = ['int f(int p0) {', 'int {0};'.format(', '.join(names))]
+    for name in names:
+        lines.append('{0} = {1} + {2} + p0;'.format(
+            name, r.choice(names), r.choice(names)))
+    lines.append('return v0;')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def mutate(data, seed):
+    """識別子をいくつかランダムに入れ替えたプログラムを返す"""
+    r = random.Random(seed)
+    names = sorted(set(re.findall(r'\b[fgpv]\d+\b', data))) + ['u0']
+    return re.sub(r'\b[fgpv]\d+\b',
+                  lambda m: r.choice(names) if r.random() < 0.05 else m.group(),
+                  data)
+
+
+def analyze(parser, data, table):
+    """構文木, エラー/警告の数, 出力されたメッセージを返す"""
+    handler = MessageHandler()
+    logger = logging.getLogger()
+    logger.addHandler(handler)
+    try:
+        ast = parser.parse(data)
+        a = analyzer.SymbolAnalyzer(table=table)
+        try:
+            a.analyze(ast)
+        except Exception as e:
+            # 既存のテーブルが例外を送出する入力は, 同じ例外になることを確認する
+            return type(e).__name__, handler.messages
+        text = analyzer.PrintAnalyzer().analyze(ast)
+    finally:
+        logger.removeHandler(handler)
+    return text, a.errors, a.warnings, handler.messages
+
+
+def measure(parser, data, table, repeat):
+    best = None
+    for i in range(repeat):
+        ast = parser.parse(data)
+        a = analyzer.SymbolAnalyzer(table=table)
+        start = time.time()
+        a.analyze(ast)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    # 入れ子の深いブロックを再帰せずに解析できるように PLY を用いる
+    parser = Parser(engine='ply', lexer='regex')
+    parser.build()
+
+    sources = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'samples_*', '*.tc'))):
+        with open(path) as f:
+            sources.append((os.path.relpath(path, ROOT), f.read()))
+    for seed in range(args.programs):
+        for name, data in (('generated', program(20, seed=seed)),
+                           ('nested', nested(50, seed=seed)),
+                           ('locals', locals_(50, seed=seed))):
+            sources.append(('{0} (seed={1})'.format(name, seed), data))
+            sources.append(('{0} mutated (seed={1})'.format(name, seed),
+                            mutate(data, seed)))
+    failures = 0
+    for name, data in sources:
+        if analyze(parser, data, 'chain') != analyze(parser, data, 'flat'):
+            failures += 1
+            print('MISMATCH: {0}'.format(name))
+    print('differential: {0} programs, {1} mismatches'.format(
+        len(sources), failures))
+    if failures:
+        return 1
+
+    logging.disable(logging.CRITICAL)
+    for label, data in (('nested ({0} levels)'.format(args.d), nested(args.d)),
+                        ('locals ({0} variables)'.format(args.l), locals_(args.l))):
+        print('{0}:'.format(label))
+        for table in analyzer.SymbolAnalyzer.tables:
+            elapsed = measure(parser, data, table, args.r)
+            print('  {0:>5}: {1:.3f} s'.format(table, elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-d', type=int, default=2000,
+                        help='Depth of nested blocks')
+    parser.add_argument('-l', type=int, default=2000,
+                        help='Number of local variables')
+    parser.add_argument('-r', type=int, default=3, help='Number of runs')
+    parser.add_argument('-p', '--programs', type=int, default=50,
+                        help='Number of generated programs to compare')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""構文木全体の走査 (Node.accept によるメソッドの呼び出し) の処理時間を計測する
+
+Analyzer (何もしない既定の走査) と PrintAnalyzer について,
+同じ構文木を走査する時間の最小値を表示する
+
+$ python benchmarks/traversal.py [-n 2000] [-r 5]
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import program
+from tinyc.analyzer import Analyzer, PrintAnalyzer
+from tinyc.parser import Parser
+
+
+def count_nodes(ast):
+    class Counter(Analyzer):
+        count = 0
+
+        def a_Node(self, node):
+            self.count += 1
+
+        def a_NodeList(self, node):
+            self.count += 1
+            return node.nodes
+
+    counter = Counter()
+    counter.analyze(ast)
+    return counter.count
+
+
+def measure(factory, ast, repeat):
+    best = None
+    for i in range(repeat):
+        analyzer = factory()
+        start = time.time()
+        analyzer.analyze(ast)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    parser = Parser(engine='rd', lexer='regex')
+    parser.build()
+    ast = parser.parse(program(args.n))
+    print('input: {0} functions, {1} nodes visited'.format(
+        args.n, count_nodes(ast)))
+
+    for factory in (Analyzer, PrintAnalyzer):
+        elapsed = measure(factory, ast, args.r)
+        print('{0:>13}: {1:.3f} s'.format(factory.__name__, elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=2000,
+                        help='Number of functions in the traversed program')
+    parser.add_argument('-r', type=int, default=5, help='Number of runs')
+    sys.exit(main(parser.parse_args()))
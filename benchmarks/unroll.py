@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ループ展開 (tinyc.transform.LoopUnrolling) の効果の計測
+
+ループを 1 つ含む関数 (カーネル) を生成し, -O2 で展開しない場合
+(--unroll 1 に相当) と展開数ごとに, 命令の数 (静的な大きさ) と実行する
+命令/ジャンプ命令の数の見積もりを出力する. カーネルのループはちょうど
+trips 回 (展開数の倍数) 繰り返すため, 展開したループは trips / 展開数 回,
+残りを行うループは 0 回繰り返す. 制御フローグラフ (tinyc.cfg) で
+最初のループのブロックを前者, それ以外のループのブロックを後者として数える.
+ループの上限はカーネルごとに定数かパラメータ n (= trips) にする
+
+$ python benchmarks/unroll.py [-n 20] [-t 96] [--seed 1] [-u 2 4 8]
+"""
+
+from __future__ import division, print_function, unicode_literals
+import argparse
+import collections
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tinyc import analyzer, cfg, generator, optimizer, transform
+from tinyc.code import CodeList
+from tinyc.parser import Parser
+
+
+def kernel(rng, name, trips):
+    """カウンタを ++i または i += 2 で更新するループを 1 つ含むカーネルを返す"""
+    step = rng.choice((1, 2))
+    limit = rng.choice(('n', str(trips * step)))
+    lines = ['int {0}(int n, int k) {{'.format(name), 'int i, s, t;',
+             's = 0;', 't = k;', 'i = 0;',
+             'while (i < {0}) {{'.format(limit)]
+    for _ in range(rng.randint(1, 3)):
+        lines.append(rng.choice((
+            's = s + i * k;', 's = s + t;', 't = t - {0};'.format(
+                rng.randint(1, 9)), 's += i;', 't = t + s;')))
+    lines.append('++i;' if step == 1 else 'i += 2;')
+    lines += ['}', 'return s + t;', '}']
+    return '\n'.join(lines), limit == 'n'
+
+
+def compiled(parser, data, factor):
+    ast = parser.parse(data)
+    for a in (analyzer.SymbolAnalyzer(), analyzer.SymbolReplaceAnalyzer(),
+              analyzer.FunctionAnalyzer(), analyzer.ParameterAnalyzer()):
+        a.analyze(ast)
+    transformers = [
+        transform.LoopUnrolling(factor=factor),
+        transform.LoopInvariantMotion(), transform.StrengthReduction(),
+        analyzer.RegisterAnalyzer()]
+    for t in transformers:
+        t.analyze(ast)
+    gen = generator.NASMx86Generator()
+    gen.analyze(ast, format='elf', optimize=True)
+    code = CodeList(gen.code)
+    optimizer.PeepholeOptimizer(layout=True).optimize(code)
+    return code
+
+
+def measure(code, trips, factor):
+    """(命令の数, 実行する命令の数, 実行するジャンプ命令の数) の見積もり"""
+    size = executed = jumps = 0
+    for graph in cfg.build(code):
+        loops = sorted(graph.loops, key=lambda loop: loop.header.index)
+        for block in graph.blocks:
+            lines = list(block.codes())
+            size += len(lines)
+            if not block.reachable:
+                continue
+            if block.loop is None:
+                count = 1
+            elif block.loop is loops[0]:
+                count = trips // factor
+            else:
+                count = 0
+            executed += count * len(lines)
+            last = block.terminator
+            if last is not None and (last.op == 'jmp'
+                                     or last.op in cfg.CONDITIONAL_JUMPS):
+                jumps += count
+    return size, executed, jumps
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    parser = Parser(engine='ply', lexer='regex')
+    parser.build()
+    rng = random.Random(args.seed)
+    factors = [1] + args.unroll
+    totals = collections.defaultdict(lambda: [0, 0, 0])
+    print('{0:>8} {1:>6} {2:>8} {3:>8} {4:>10} {5:>8}'.format(
+        'kernel', 'limit', 'unroll', 'size', 'executed', 'jumps'))
+    for i in range(args.n):
+        name = 'k{0}'.format(i)
+        data, variable = kernel(rng, name, args.trips)
+        for factor in factors:
+            result = measure(compiled(parser, data, factor), args.trips,
+                             factor)
+            total = totals[factor]
+            for j, value in enumerate(result):
+                total[j] += value
+            print('{0:>8} {1:>6} {2:>8} {3:>8} {4:>10} {5:>8}'.format(
+                name, 'n' if variable else 'const', factor, *result))
+    print()
+    for factor in factors:
+        print('{0:>8} {1:>6} {2:>8} {3:>8} {4:>10} {5:>8}'.format(
+            'total', '', factor, *totals[factor]))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=20, help='Number of kernels')
+    parser.add_argument('-t', '--trips', type=int, default=96,
+                        help='Iterations of each loop (a multiple of the '
+                             'unroll factors)')
+    parser.add_argument('-u', '--unroll', type=int, nargs='+',
+                        default=[2, 4, 8], help='Unroll factors')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    sys.exit(main(parser.parse_args()))
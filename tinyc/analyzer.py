@@ -5,23 +5,129 @@
 
 from __future__ import print_function, unicode_literals
 import logging
+import types
 
 from tinyc import token
 from tinyc.common import Kinds
 
 
+# 解析器のクラスごとの, ノードのクラスから呼び出す関数への表
+_HANDLERS = {}
+
+
+def _find_methods(analyzer_class, node_class):
+    """node_class のノードに対して呼び出す analyzer_class のメソッドを返す
+
+    a_<クラス名> のメソッドが存在しない場合は, ノードのスーパークラスを
+    順に辿って探す (複数の基底クラスがあればそれぞれで探す)
+    """
+    name = 'a_' + node_class.__name__
+    method = getattr(analyzer_class, name, None)
+    if method is None:
+        methods = []
+        for base in node_class.__bases__:
+            methods.extend(_find_methods(analyzer_class, base))
+        return methods
+    if isinstance(method, types.MethodType):
+        return [method.__func__]
+    # staticmethod などは解析器のインスタンスから取得して呼び出す
+    return [lambda analyzer, node: getattr(analyzer, name)(node)]
+
+
+def _ignore(analyzer, node):
+    pass
+
+
+def _handler(handlers, analyzer_class, node_class):
+    """メソッドの探索を (解析器のクラス, ノードのクラス) の組ごとに 1 回だけ行う
+
+    解析器のクラスのメソッドは探索の後に変更しないこと
+    """
+    methods = _find_methods(analyzer_class, node_class)
+    if not methods:
+        function = _ignore
+    elif len(methods) == 1:
+        function = methods[0]
+    else:
+        def function(analyzer, node):
+            for method in methods:
+                yield method(analyzer, node)
+    handlers[node_class] = function
+    return function
+
+
 class Analyzer(object):
-    """汎用意味解析器"""
+    """汎用意味解析器
+
+    a_<クラス名> のメソッドは, 子ノードを accept する代わりに,
+    訪問する子ノードを返すか yield する (visit を参照)
+    """
     def __init__(self):
         self.warnings = 0
         self.errors = 0
         self.logger = logging.getLogger()
 
-    def _analyze_list(self, l):
-        map(lambda i: i.accept(self), l)
+    def visit(self, root):
+        """root 以下の構文木を明示的なスタックを用いて走査する
+
+        ノードごとに a_<クラス名> のメソッドを呼び出し, その戻り値によって
+        子ノードを訪問する (戻り値が None の場合は子ノードを訪問しない).
+
+        * ノードのタプル/リストを返すと, それらを順に訪問する
+        * ジェネレータとして書くと, yield したノード (ノードのタプル/リストや
+          別のジェネレータでもよい) を訪問し終えてから処理を再開する.
+          最初の yield より前が行きがけ (pre-order), 後が帰りがけ
+          (post-order) の処理となる
+
+        Python の再帰を用いないため, 深い構文木でも再帰の上限に達しない
+        """
+        analyzer_class = self.__class__
+        handlers = _HANDLERS.get(analyzer_class)
+        if handlers is None:
+            handlers = _HANDLERS[analyzer_class] = {}
+        node_type = token.Node
+
+        stack = [iter((root,))]
+        push = stack.append
+        pop = stack.pop
+        while stack:
+            for item in stack[-1]:
+                handler = handlers.get(item.__class__)
+                if handler is None:
+                    if isinstance(item, node_type):
+                        handler = _handler(handlers, analyzer_class, item.__class__)
+                    elif item is None:
+                        continue
+                    else:
+                        # ノードのタプル/リストまたはジェネレータ
+                        push(iter(item))
+                        break
+                frame = handler(self, item)
+                if frame is not None:
+                    push(iter(frame))
+                    break
+            else:
+                pop()
+
+    def start(self):
+        """解析を始める前の初期化処理
+
+        外部宣言ごとに accept する場合 (Compiler.compile_file) は,
+        最初の外部宣言の前に 1 回だけ呼び出す
+        """
+        pass
+
+    def finish(self):
+        """解析を終えた後の処理
+
+        外部宣言ごとに accept する場合は, 外部宣言ごとに呼び出す
+        """
+        pass
 
     def analyze(self, ast):
+        self.start()
         ast.accept(self)
+        self.finish()
         return ast
 
     def warning(self, message):
@@ -36,57 +142,57 @@ class Analyzer(object):
         pass
 
     def a_NodeList(self, node):
-        self._analyze_list(node.nodes)
+        return node.nodes
 
     def a_UnaryOperator(self, node):
-        node.expr.accept(self)
+        return (node.expr,)
 
     def a_BinaryOperator(self, node):
-        node.left.accept(self)
-        node.right.accept(self)
+        return (node.left, node.right,)
 
     def a_FunctionDefinition(self, node):
-        node.parameter_type_list.accept(self)
-        node.compound_statement.accept(self)
+        return (node.parameter_type_list, node.compound_statement,)
 
     def a_CompoundStatement(self, node):
-        node.declaration_list.accept(self)
-        node.statement_list.accept(self)
+        return (node.declaration_list, node.statement_list,)
 
     def a_Declaration(self, node):
-        node.declarators.accept(self)
+        return (node.declarators,)
 
     def a_ParameterDeclaration(self, node):
-        node.declarator.accept(self)
+        return (node.declarator,)
 
     def a_Declarator(self, node):
         pass
 
     def a_IfStatement(self, node):
-        node.expr.accept(self)
-        node.then_statement.accept(self)
-        node.else_statement.accept(self)
+        return (node.expr, node.then_statement, node.else_statement,)
 
     def a_WhileLoop(self, node):
-        node.expr.accept(self)
-        node.statement.accept(self)
+        return (node.expr, node.statement,)
 
     def a_ReturnStatement(self, node):
-        node.expr.accept(self)
+        return (node.expr,)
 
     def a_FunctionExpression(self, node):
-        node.function.accept(self)
-        node.argument_list.accept(self)
+        return (node.function, node.argument_list,)
 
 
 class PrintAnalyzer(Analyzer):
     """構文木をフォーマットして出力する解析器"""
+    _node_attributes = {}
+
     def __init__(self):
         super(PrintAnalyzer, self).__init__()
 
         self._indent = 0
         self._indent_amount = 2
-        self.text = ''
+        # 文字列の連結は全体の長さに比例するため, 行のリストに追加して最後に結合する
+        self._lines = []
+
+    @property
+    def text(self):
+        return ''.join(self._lines)
 
     def indent(self):
         self._indent += 1
@@ -95,90 +201,105 @@ class PrintAnalyzer(Analyzer):
         self._indent -= 1
 
     def write(self, s):
-        self.text += (' ' * (self._indent_amount * self._indent) + s + '\n')
+        self._lines.append(
+            ' ' * (self._indent_amount * self._indent) + s + '\n')
 
     def write_node(self, node):
         self.write('+ ' + node.__class__.__name__)
 
-        for key in node.__dict__.keys():
-            if key[0] == '_':
-                continue
-            val = node.__dict__[key]
+        for key in self._attributes(node.__class__):
+            val = getattr(node, key, None)
             if isinstance(val, str) or isinstance(val, int):
                 self.write('  %s: %s' % (key, str(val)))
             elif isinstance(val, Kinds):
                 self.write('  %s: %s' % (key, str(val.name)))
 
+    @classmethod
+    def _attributes(cls, klass):
+        """出力するノードの属性名 (ノードのクラスごとに 1 回だけ求める)
+
+        ノードは __dict__ を持たないので, __slots__ を基底クラスから順に辿る
+        """
+        attributes = cls._node_attributes.get(klass)
+        if attributes is None:
+            attributes = cls._node_attributes[klass] = [
+                key for base in reversed(klass.__mro__)
+                for key in base.__dict__.get('__slots__', ()) if key[0] != '_']
+        return attributes
+
     def write_subnode(self, subnode, label):
         if not subnode.is_null():
             self.write('  %s:' % label)
             self.indent()
-            subnode.accept(self)
+            yield subnode
             self.unindent()
 
     def a_FunctionDefinition(self, node):
         self.write_node(node)
-        self.write_subnode(node.declarator, 'Declarator')
-        self.write_subnode(node.parameter_type_list, 'Paremeter type list')
-        self.write_subnode(node.compound_statement, 'Compound statement')
+        yield self.write_subnode(node.declarator, 'Declarator')
+        yield self.write_subnode(node.parameter_type_list, 'Paremeter type list')
+        yield self.write_subnode(node.compound_statement, 'Compound statement')
 
     def a_UnaryOperator(self, node):
         self.write_node(node)
-        self.write_subnode(node.expr, 'Expression')
+        return self.write_subnode(node.expr, 'Expression')
 
     def a_BinaryOperator(self, node):
         self.write_node(node)
-        self.write_subnode(node.left, 'Left')
-        self.write_subnode(node.right, 'Right')
+        yield self.write_subnode(node.left, 'Left')
+        yield self.write_subnode(node.right, 'Right')
 
     def a_Declarator(self, node):
         self.write_node(node)
-        self.write_subnode(node.identifier, 'Identifier')
+        return self.write_subnode(node.identifier, 'Identifier')
 
     def a_Declaration(self, node):
         self.write_node(node)
-        self.write_subnode(node.declarators, 'Declarator list')
+        return self.write_subnode(node.declarators, 'Declarator list')
 
     def a_ParameterDeclaration(self, node):
         self.write_node(node)
-        self.write_subnode(node.declarator, 'Declarator')
+        return self.write_subnode(node.declarator, 'Declarator')
 
     def a_NodeList(self, node):
         self.write_node(node)
         self.indent()
-        self._analyze_list(node.nodes)
+        yield node.nodes
         self.unindent()
 
     def a_ParameterTypeList(self, node):
         self.write_node(node)
         self.indent()
-        self._analyze_list(node.nodes)
+        yield node.nodes
         self.unindent()
 
     def a_CompoundStatement(self, node):
         self.write_node(node)
-        self.write_subnode(node.declaration_list, 'Declaration list')
-        self.write_subnode(node.statement_list, 'Statement list')
+        yield self.write_subnode(node.declaration_list, 'Declaration list')
+        yield self.write_subnode(node.statement_list, 'Statement list')
 
     def a_IfStatement(self, node):
         self.write_node(node)
-        self.write_subnode(node.expr, 'Expression')
-        self.write_subnode(node.then_statement, 'Then statement')
-        self.write_subnode(node.else_statement, 'Else statement')
+        yield self.write_subnode(node.expr, 'Expression')
+        yield self.write_subnode(node.then_statement, 'Then statement')
+        yield self.write_subnode(node.else_statement, 'Else statement')
 
     def a_ReturnStatement(self, node):
         self.write_node(node)
-        self.write_subnode(node.expr, 'Expression')
+        return self.write_subnode(node.expr, 'Expression')
+
+    def a_TailJump(self, node):
+        self.write_node(node)
 
     def a_WhileLoop(self, node):
         self.write_node(node)
-        self.write_subnode(node.expr, 'Expression')
-        self.write_subnode(node.statement, 'Statement')
+        yield self.write_subnode(node.expr, 'Expression')
+        yield self.write_subnode(node.statement, 'Statement')
 
     def a_FunctionExpression(self, node):
         self.write_node(node)
-        self.write_subnode(node.function, 'Function')
-        self.write_subnode(node.argument_list, 'Argument list')
+        yield self.write_subnode(node.function, 'Function')
+        yield self.write_subnode(node.argument_list, 'Argument list')
 
     def a_Identifier(self, node):
         self.write_node(node)
@@ -207,14 +328,26 @@ class SymbolTable(object):
         self.parent = parent
         self.level = level
 
-    def add(self, name, symbol):
+    def push(self):
+        """新しいスコープのテーブルを返す"""
+        return SymbolTable(self, level=self.level + 1)
+
+    def pop(self):
+        """スコープを抜けた後のテーブルを返す"""
+        return self.parent
+
+    def add(self, name, symbol, level=None):
+        # level を指定した場合は, そのレベルのテーブルに追加する
+        table = self
+        while level is not None and level < table.level:
+            table = table.parent
         # 全てのテーブルからシンボルを探す
         if symbol.kind == Kinds.variable:
-            self._add_variable(name, symbol)
+            table._add_variable(name, symbol)
         elif symbol.kind == Kinds.parameter:
-            self._add_parameter(name, symbol)
+            table._add_parameter(name, symbol)
         elif symbol.kind == Kinds.function:
-            self._add_function(name, symbol)
+            table._add_function(name, symbol)
 
     def _add_variable(self, name, symbol):
         temp = self.get(name)
@@ -257,51 +390,176 @@ class SymbolTable(object):
         self.symbols[name] = symbol
 
     def get(self, name):
-        if name in self.symbols:
-            return self.symbols[name]
-        elif self.parent is not None:
-            return self.parent.get(name)
+        table = self
+        while table is not None:
+            if name in table.symbols:
+                return table.symbols[name]
+            table = table.parent
+        return None
+
+
+class ScopedSymbolTable(object):
+    """名前ごとの束縛のスタックでシンボルを管理するテーブル
+
+    SymbolTable はスコープごとにテーブルを作成して親のテーブルを順に辿るため,
+    シンボルの検索にネストの深さに比例する時間がかかる. このテーブルは
+    名前から束縛 (外側のスコープから順に並べたシンボル) のリストへの辞書を
+    1 つだけ持ち, スコープを抜けるときに, そのスコープで追加した名前の記録
+    (取り消しログ) をもとに束縛を取り除く. 検索は O(1) で,
+    再宣言/衝突/パラメータの隠蔽の判定は SymbolTable と同じである.
+
+    テーブルはすべてのスコープで共有し, push/pop は自身を返す
+    """
+    SymbolRedeclarationError = SymbolTable.SymbolRedeclarationError
+    SymbolConflictError = SymbolTable.SymbolConflictError
+    SymbolShadowsParameterWarning = SymbolTable.SymbolShadowsParameterWarning
+
+    def __init__(self):
+        self.bindings = {}
+        # スコープごとに追加した名前 (取り消しログ)
+        self.scopes = [[]]
+
+    @property
+    def level(self):
+        return len(self.scopes) - 1
+
+    def push(self):
+        self.scopes.append([])
+        return self
+
+    def pop(self):
+        bindings = self.bindings
+        for name in self.scopes.pop():
+            stack = bindings[name]
+            stack.pop()
+            if not stack:
+                del bindings[name]
+        return self
+
+    def add(self, name, symbol, level=None):
+        if level is None:
+            level = self.level
+        if symbol.kind == Kinds.variable:
+            self._add_variable(name, symbol, level)
+        elif symbol.kind == Kinds.parameter:
+            self._add_parameter(name, symbol, level)
+        elif symbol.kind == Kinds.function:
+            self._add_function(name, symbol, level)
+
+    def _add_variable(self, name, symbol, level):
+        temp = self._visible(name, level)
+
+        if temp is not None:
+            if temp.kind == Kinds.variable:
+                if temp.level == level:
+                    # 同一レベルで同じ変数名が使われているとき
+                    raise self.SymbolRedeclarationError()
+            elif temp.kind in (Kinds.function, Kinds.undefined_function):
+                # 変数名が関数名または未定義関数名として使われているとき
+                raise self.SymbolConflictError()
+            elif temp.kind == Kinds.parameter:
+                # 変数名がパラメータ名とかぶっているとき
+                self._add_symbol(name, symbol, level)
+                raise self.SymbolShadowsParameterWarning()
+
+        self._add_symbol(name, symbol, level)
+
+    def _add_parameter(self, name, symbol, level):
+        temp = self._visible(name, level)
+        if temp is not None and temp.level == level:
+            if temp.kind == Kinds.parameter:
+                # 同一レベルで同じパラメータ名が使われているとき
+                raise self.SymbolRedeclarationError()
+
+        self._add_symbol(name, symbol, level)
+
+    def _add_function(self, name, symbol, level):
+        temp = self._visible(name, level)
+        if temp is not None and temp.level == level:
+            if temp.kind in (Kinds.variable, Kinds.function):
+                # 同一レベルで同じ名前の関数または変数があるとき
+                raise self.SymbolRedeclarationError()
+
+        self._add_symbol(name, symbol, level)
+
+    def _add_symbol(self, name, symbol, level):
+        stack = self.bindings.get(name)
+        if stack is None:
+            stack = self.bindings[name] = []
+        # 束縛はレベルの昇順に並べる (通常は末尾に追加するだけ)
+        i = len(stack)
+        while i and stack[i - 1].level > level:
+            i -= 1
+        if i and stack[i - 1].level == level:
+            # 同一レベルの束縛は置き換える (SymbolTable の辞書と同じ)
+            stack[i - 1] = symbol
         else:
-            return None
+            stack.insert(i, symbol)
+            self.scopes[level].append(name)
+        symbol.level = level
+
+    def _visible(self, name, level):
+        """level のスコープから見える name のシンボル"""
+        stack = self.bindings.get(name)
+        if stack:
+            for symbol in reversed(stack):
+                if symbol.level <= level:
+                    return symbol
+        return None
+
+    def get(self, name):
+        stack = self.bindings.get(name)
+        if stack:
+            return stack[-1]
+        return None
 
 
 class SymbolAnalyzer(Analyzer):
-    """シンボルの意味解析器"""
+    """シンボルの意味解析器
+
+    table に 'chain' を指定するとスコープごとの SymbolTable を,
+    'flat' を指定するとすべてのスコープで共有する ScopedSymbolTable を用いる
+    """
+    tables = ('chain', 'flat',)
+
+    def __init__(self, table='chain'):
+        super(SymbolAnalyzer, self).__init__()
+        if table not in self.tables:
+            raise ValueError('Unknown symbol table: {0}'.format(table))
+        self.table = table
+
     def a_FunctionDefinition(self, node):
         node.declarator.identifier.kind = Kinds.function
         self._add_symbol(node.declarator.identifier)
         self._push_table(node)
-        node.parameter_type_list.accept(self)
-        node.compound_statement.accept(self)
+        yield node.parameter_type_list
+        yield node.compound_statement
         self._pop_table()
 
     def a_CompoundStatement(self, node):
         self._push_table(node)
-        node.declaration_list.accept(self)
-        node.statement_list.accept(self)
+        yield node.declaration_list
+        yield node.statement_list
         self._pop_table()
 
     def a_Declaration(self, node):
         for declarator in node.declarators:
             declarator.identifier.kind = Kinds.variable
-        node.declarators.accept(self)
+        return (node.declarators,)
 
     def a_ParameterDeclaration(self, node):
         node.declarator.identifier.kind = Kinds.parameter
-        node.declarator.accept(self)
+        return (node.declarator,)
 
     def a_Declarator(self, node):
         self._add_symbol(node.identifier)
 
     def a_IfStatement(self, node):
-        node.expr.accept(self)
-        node.then_statement.accept(self)
-        node.else_statement.accept(self)
+        return (node.expr, node.then_statement, node.else_statement,)
 
     def a_FunctionExpression(self, node):
         node.function.kind = Kinds.function_call
-        node.function.accept(self)
-        node.argument_list.accept(self)
+        return (node.function, node.argument_list,)
 
     def a_Identifier(self, node):
         # シンボルを検索する
@@ -320,7 +578,7 @@ class SymbolAnalyzer(Analyzer):
             else:
                 # 関数のシンボルが見つからない場合は, 未定義関数のシンボルをテーブルに追加
                 node.kind = Kinds.undefined_function
-                self._add_symbol(node, table=self.root_table)
+                self._add_symbol(node, level=0)
                 message = "Line {line}: Undeclared function '{value}'."
                 self.warning(message.format(
                     line=node.lineno, value=node.name))
@@ -339,18 +597,15 @@ class SymbolAnalyzer(Analyzer):
                 self.error(message.format(line=node.lineno, value=node.name))
 
     def _push_table(self, node):
-        self.current_table = SymbolTable(
-            self.current_table, level=self.current_table.level + 1)
+        self.current_table = self.current_table.push()
         node.table = self.current_table
 
     def _pop_table(self):
-        self.current_table = self.current_table.parent
+        self.current_table = self.current_table.pop()
 
-    def _add_symbol(self, node, table=None):
-        if table is None:
-            table = self.current_table
+    def _add_symbol(self, node, level=None):
         try:
-            table.add(node.name, node)
+            self.current_table.add(node.name, node, level)
         except SymbolTable.SymbolRedeclarationError:
             self.error(
                 "Line {line}: Redeclaration of identifier '{value}'.".format(
@@ -360,11 +615,18 @@ class SymbolAnalyzer(Analyzer):
             msg = "Line {line}: Declaration of '{value}' shadows parameter."
             self.warning(msg.format(line=node.lineno, value=node.name))
 
-    def analyze(self, ast):
-        self.root_table = SymbolTable(level=0)
+    def start(self):
+        if self.table == 'flat':
+            self.root_table = ScopedSymbolTable()
+        else:
+            self.root_table = SymbolTable(level=0)
         self.current_table = self.root_table
+
+    def analyze(self, ast):
+        self.start()
         ast.current_table = self.root_table
         ast.accept(self)
+        self.finish()
 
         return ast
 
@@ -373,32 +635,32 @@ class SymbolReplaceAnalyzer(Analyzer):
     """Identifier.symbol に記録された symbol で Identifier を置換する"""
     def a_NodeList(self, node):
         node.nodes = map(self._replace_symbol, node.nodes)
-        self._analyze_list(node.nodes)
+        return node.nodes
 
     def a_UnaryOperator(self, node):
         node.expr = self._replace_symbol(node.expr)
-        node.expr.accept(self)
+        return (node.expr,)
 
     def a_BinaryOperator(self, node):
         node.left = self._replace_symbol(node.left)
-        node.left.accept(self)
         node.right = self._replace_symbol(node.right)
-        node.right.accept(self)
+        return (node.left, node.right,)
 
     def a_IfStatement(self, node):
         node.expr = self._replace_symbol(node.expr)
-        node.expr.accept(self)
-        node.then_statement.accept(self)
-        node.else_statement.accept(self)
+        return (node.expr, node.then_statement, node.else_statement,)
+
+    def a_WhileLoop(self, node):
+        node.expr = self._replace_symbol(node.expr)
+        return (node.expr, node.statement,)
 
     def a_ReturnStatement(self, node):
         node.expr = self._replace_symbol(node.expr)
-        node.expr.accept(self)
+        return (node.expr,)
 
     def a_FunctionExpression(self, node):
         node.function = self._replace_symbol(node.function)
-        node.function.accept(self)
-        node.argument_list.accept(self)
+        return (node.function, node.argument_list,)
 
     def _replace_symbol(self, node):
         if isinstance(node, token.Identifier):
@@ -415,8 +677,7 @@ class FunctionAnalyzer(Analyzer):
         parameters = len(node.parameter_type_list.nodes)
         node.declarator.identifier.parameters = parameters
 
-        node.parameter_type_list.accept(self)
-        node.compound_statement.accept(self)
+        return (node.parameter_type_list, node.compound_statement,)
 
     def a_FunctionExpression(self, node):
         if node.function.kind == Kinds.function:
@@ -441,7 +702,7 @@ class ParameterAnalyzer(Analyzer):
     def a_ParameterTypeList(self, node):
         # パラメータリストが始まるたびに offset を初期化
         self.offset = 8
-        map(lambda i: i.accept(self), node.nodes)
+        return node.nodes
 
     def a_ParameterDeclaration(self, node):
         # パラメータの EBP からの offset を設定
@@ -449,21 +710,64 @@ class ParameterAnalyzer(Analyzer):
         self.offset += 4
 
 
+# 式の評価に用いるレジスタの数 (eax と, スクラッチレジスタの ecx, edx)
+REGISTERS = 3
+
+
+def _registers(node):
+    # エラーのある識別子など, 求まっていない場合は 1 とする
+    return getattr(node, 'registers', 1)
+
+
+def _unary_registers(node):
+    return max(_registers(node.expr), 1)
+
+
+def _binary_registers(node):
+    """二項演算子の Sethi-Ullman 数 (評価に必要なレジスタの数)
+
+    変数と定数はオペランドに直接書けるため 0 とする.
+    比較は条件を入れ替え, 減算は neg と add に書き換えることで
+    左右のオペランドを交換できる. 除算は cdq で edx を使い,
+    除数をレジスタに置く場合は eax, edx 以外に 1 つ必要になる
+    """
+    op = node.op
+    left = _registers(node.left)
+    right = _registers(node.right)
+    if op in ('ASSIGN', 'ASSIGN_PLUS', 'ASSIGN_MINUS',):
+        return max(right, 1)
+    elif op in ('LAND', 'LOR',):
+        return max(left, right, 1)
+    elif op == 'DIV':
+        if right == 0:
+            return max(left, 2)
+        return max(right, left + 1, REGISTERS)
+    elif left == 0 or right == 0:
+        return max(left, right, 1)
+    elif left == right:
+        return left + 1
+    return max(left, right)
+
+
+def _call_registers(node):
+    # 呼び出し先は eax, ecx, edx をすべて書き換える
+    # (引数は 1 つずつ評価してスタックに積む)
+    return max([REGISTERS] + [_registers(a) for a in node.argument_list.nodes])
+
+
 class RegisterAnalyzer(Analyzer):
-    """コード生成に必要なレジスタの数について見積もる"""
+    """コード生成に必要なレジスタの数 (Sethi-Ullman 数) を求める"""
     def a_BinaryOperator(self, node):
-        node.left.accept(self)
-        node.right.accept(self)
-        node.registers = 1
+        yield (node.left, node.right,)
+        node.registers = _binary_registers(node)
 
     def a_UnaryOperator(self, node):
-        node.expr.accept(self)
-        node.registers = 1
+        yield node.expr
+        node.registers = _unary_registers(node)
 
     def a_FunctionExpression(self, node):
-        node.function.accept(self)
-        node.argument_list.accept(self)
-        node.registers = 1
+        yield (node.function, node.argument_list,)
+        node.registers = _call_registers(node)
 
     def a_Identifier(self, node):
         if node.kind in (Kinds.parameter, Kinds.variable):
@@ -471,3 +775,128 @@ class RegisterAnalyzer(Analyzer):
 
     def a_Constant(self, node):
         node.registers = 0
+
+
+class FusedAnalyzer(SymbolAnalyzer):
+    """SymbolAnalyzer, SymbolReplaceAnalyzer, FunctionAnalyzer,
+    ParameterAnalyzer, RegisterAnalyzer の処理を 1 回の走査で行う解析器
+
+    各解析器を順に実行した場合と同じ構文木, 同じエラー/警告を出力する.
+    nasm が False の場合は ParameterAnalyzer と RegisterAnalyzer の処理を行わない.
+    table は SymbolAnalyzer と同じ
+    """
+    def __init__(self, nasm=True, table='chain'):
+        super(FusedAnalyzer, self).__init__(table)
+        self.nasm = nasm
+
+    def start(self):
+        super(FusedAnalyzer, self).start()
+        # 関数呼び出しの引数を解析している深さ
+        self.arguments = 0
+        # 関数呼び出しの引数の数のエラー (他のエラーの後に出力する)
+        self.arity_errors = []
+
+    def finish(self):
+        for message in self.arity_errors:
+            self.error(message)
+        self.arity_errors = []
+
+    def _substitute(self, node):
+        """訪問済みの子ノードをシンボルで置換したノードを返す"""
+        if isinstance(node, token.Identifier):
+            node = self._replace_symbol(node)
+            if self.nasm and node.kind in (Kinds.parameter, Kinds.variable):
+                node.registers = 0
+        return node
+
+    def a_NodeList(self, node):
+        nodes = node.nodes
+        for i, child in enumerate(nodes):
+            yield child
+            nodes[i] = self._substitute(child)
+
+    def a_ParameterTypeList(self, node):
+        # パラメータリストが始まるたびに offset を初期化
+        self.offset = 8
+        return self.a_NodeList(node)
+
+    def a_FunctionDefinition(self, node):
+        # 引数の数を identifier に記録
+        node.declarator.identifier.parameters = len(
+            node.parameter_type_list.nodes)
+        return super(FusedAnalyzer, self).a_FunctionDefinition(node)
+
+    def a_ParameterDeclaration(self, node):
+        yield super(FusedAnalyzer, self).a_ParameterDeclaration(node)
+        if self.nasm:
+            # パラメータの EBP からの offset を設定
+            node.declarator.identifier.offset = self.offset
+            self.offset += 4
+
+    def a_UnaryOperator(self, node):
+        yield node.expr
+        node.expr = self._substitute(node.expr)
+        if self.nasm:
+            node.registers = _unary_registers(node)
+
+    def a_BinaryOperator(self, node):
+        yield node.left
+        node.left = self._substitute(node.left)
+        yield node.right
+        node.right = self._substitute(node.right)
+        if self.nasm:
+            node.registers = _binary_registers(node)
+
+    def a_IfStatement(self, node):
+        yield node.expr
+        node.expr = self._substitute(node.expr)
+        yield (node.then_statement, node.else_statement,)
+
+    def a_WhileLoop(self, node):
+        yield node.expr
+        node.expr = self._substitute(node.expr)
+        yield node.statement
+
+    def a_ReturnStatement(self, node):
+        yield node.expr
+        node.expr = self._substitute(node.expr)
+
+    def a_FunctionExpression(self, node):
+        node.function.kind = Kinds.function_call
+        yield node.function
+        node.function = self._replace_symbol(node.function)
+        # FunctionAnalyzer と同じく, 引数の中の関数呼び出しは検査しない
+        if self.arguments == 0:
+            self._check_arguments(node)
+        self.arguments += 1
+        yield node.argument_list
+        self.arguments -= 1
+        if self.nasm:
+            node.registers = _call_registers(node)
+
+    def a_Constant(self, node):
+        if self.nasm:
+            node.registers = 0
+
+    def _replace_symbol(self, node):
+        symbol = getattr(node, 'symbol', None)
+        if symbol is not None:
+            return symbol
+        return node
+
+    def _check_arguments(self, node):
+        message = "Line {line}: '{value}' requires {num} parameters."
+        arguments = len(node.argument_list.nodes)
+        if node.function.kind == Kinds.function:
+            if node.function.parameters != arguments:
+                self.arity_errors.append(message.format(
+                    line=node.lineno, value=node.function.name,
+                    num=node.function.parameters))
+        elif node.function.kind == Kinds.undefined_function:
+            parameters = getattr(node.function, 'parameters', None)
+            if parameters is None:
+                node.function.parameters = arguments
+            elif parameters != arguments:
+                self.arity_errors.append(message.format(
+                    line=node.lineno, value=node.function.name,
+                    num=parameters))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""PLY が生成する字句解析表と構文解析表をキャッシュするためのモジュール"""
+
+from __future__ import unicode_literals
+import hashlib
+import os
+import tempfile
+
+from ply import yacc
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'tinyc')
+
+
+def get_cache_dir(cache_dir=None):
+    """キャッシュディレクトリを決定し, 必要であれば作成する
+
+    作成できない場合は None を返し, キャッシュを利用しない
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get('TINYC_CACHE_DIR', DEFAULT_CACHE_DIR)
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            return None
+    return cache_dir
+
+
+def signature(obj, prefix, *extra):
+    """prefix で始まる規則と extra から解析表のキーとなるハッシュを計算する
+
+    文字列の規則はその値を, 関数の規則は docstring (文法) をハッシュに含める
+    """
+    md5 = hashlib.md5()
+    md5.update(yacc.__version__.encode('utf-8'))
+    for value in extra:
+        md5.update(repr(value).encode('utf-8'))
+    for name in sorted(dir(obj)):
+        if not name.startswith(prefix):
+            continue
+        rule = getattr(obj, name)
+        if callable(rule):
+            rule = rule.__doc__
+        md5.update(name.encode('utf-8'))
+        md5.update(repr(rule).encode('utf-8'))
+    return md5.hexdigest()[:16]
+
+
+def temporary_path(cache_dir, suffix):
+    """キャッシュを書き出すための一時ファイルのパスを返す
+
+    書き出し後に os.rename で置き換えることで, 並行して起動した
+    コンパイラが書き込み途中のファイルを読まないようにする
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=cache_dir)
+    os.close(fd)
+    os.remove(path)
+    return path
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""NASM のコードの制御フローグラフ
+
+コード (CodeList) を関数 (GLOBAL に用いるラベルから始まる区間) ごとに
+基本ブロックに分割し, jmp/条件ジャンプ/ret から後続と先行ブロックを求める.
+さらに支配木 (Lengauer-Tarjan 法) と自然ループの入れ子を求める.
+いずれもブロック数と辺の数にほぼ比例する時間で計算する
+"""
+
+from __future__ import print_function, unicode_literals
+
+from tinyc.code import Code, CodeList, Label
+
+
+# 分岐しない場合は次のブロックに進むジャンプ命令
+CONDITIONAL_JUMPS = ('je', 'jne', 'jz', 'jnz', 'jl', 'jle', 'jg', 'jge',)
+
+
+class BasicBlock(object):
+    """基本ブロック
+
+    cells はブロックの行 (先頭のラベルやコメントを含む) を保持するセルのリスト
+    """
+    def __init__(self, index):
+        self.index = index
+        self.cells = []
+        self.labels = []
+        self.successors = []
+        self.predecessors = []
+        # 直接支配するブロック (支配木の親) と, 直接支配されるブロック
+        self.idom = None
+        self.dominated = []
+        # ブロックを含む最も内側のループ
+        self.loop = None
+        # 支配木の行きがけ/帰りがけの順番 (dominates で用いる)
+        self._pre = self._post = -1
+
+    def codes(self):
+        """ブロックの命令を順に返す"""
+        for cell in self.cells:
+            if isinstance(cell.line, Code):
+                yield cell.line
+
+    @property
+    def terminator(self):
+        """ブロックの最後の命令 (命令がなければ None)"""
+        for cell in reversed(self.cells):
+            if isinstance(cell.line, Code):
+                return cell.line
+        return None
+
+    @property
+    def reachable(self):
+        return self._pre >= 0
+
+    def __repr__(self):
+        label = self.labels[0].label if self.labels else ''
+        return '<BasicBlock {0} {1}>'.format(self.index, label)
+
+
+class Loop(object):
+    """自然ループ
+
+    body は内側のループに含まれないブロック (ヘッダを含む)
+    """
+    def __init__(self, header):
+        self.header = header
+        self.latches = []
+        self.body = [header]
+        self.parent = None
+        self.children = []
+        self.depth = 1
+
+    @property
+    def blocks(self):
+        """内側のループのブロックを含む, ループ内のすべてのブロック"""
+        blocks = []
+        stack = [self]
+        while stack:
+            loop = stack.pop()
+            blocks.extend(loop.body)
+            stack.extend(reversed(loop.children))
+        return blocks
+
+    def __contains__(self, block):
+        loop = block.loop
+        while loop is not None:
+            if loop is self:
+                return True
+            loop = loop.parent
+        return False
+
+    def __repr__(self):
+        return '<Loop {0} depth={1}>'.format(self.header.index, self.depth)
+
+
+class ControlFlowGraph(object):
+    """1 つの関数の制御フローグラフ
+
+    blocks はコード中の順番, order は入口から到達できるブロックの逆後順,
+    loops はすべての自然ループ (外側のループが先)
+    """
+    def __init__(self, name, blocks):
+        self.name = name
+        self.blocks = blocks
+        self.entry = blocks[0]
+        self._link()
+        self.order = self._reverse_postorder()
+        self._dominators()
+        self.loops = self._loops()
+
+    def dominates(self, a, b):
+        """ブロック a がブロック b を支配するか (O(1))"""
+        return (a.reachable and b.reachable
+                and a._pre <= b._pre and b._post <= a._post)
+
+    def _link(self):
+        """ラベルとジャンプ命令から後続ブロックを求める"""
+        targets = {}
+        for block in self.blocks:
+            for label in block.labels:
+                targets[label.label] = block
+
+        for i, block in enumerate(self.blocks):
+            last = block.terminator
+            fallthrough = self.blocks[i + 1] if i + 1 < len(self.blocks) else None
+            successors = []
+            if last is not None and last.op == 'ret':
+                pass
+            elif last is not None and last.op in ('jmp',) + CONDITIONAL_JUMPS:
+                target = last.args[0]
+                if isinstance(target, Label) and target.label in targets:
+                    successors.append(targets[target.label])
+                if last.op != 'jmp' and fallthrough is not None:
+                    successors.append(fallthrough)
+            elif fallthrough is not None:
+                successors.append(fallthrough)
+
+            for successor in successors:
+                if successor not in block.successors:
+                    block.successors.append(successor)
+                    successor.predecessors.append(block)
+
+    def _reverse_postorder(self):
+        """入口からの深さ優先探索 (再帰しない) で逆後順を求める"""
+        postorder = []
+        visited = set([self.entry])
+        stack = [(self.entry, iter(self.entry.successors))]
+        while stack:
+            block, successors = stack[-1]
+            for successor in successors:
+                if successor not in visited:
+                    visited.add(successor)
+                    stack.append((successor, iter(successor.successors)))
+                    break
+            else:
+                stack.pop()
+                postorder.append(block)
+        postorder.reverse()
+        return postorder
+
+    def _dominators(self):
+        """Lengauer-Tarjan 法 (単純な連結と経路圧縮) で直接支配ブロックを求める"""
+        # 深さ優先探索の行きがけ順の番号で計算する
+        vertex = []
+        number = {}
+        parent = []
+        stack = [(self.entry, -1)]
+        while stack:
+            block, p = stack.pop()
+            if block in number:
+                continue
+            number[block] = len(vertex)
+            vertex.append(block)
+            parent.append(p)
+            for successor in reversed(block.successors):
+                if successor not in number:
+                    stack.append((successor, number[block]))
+
+        n = len(vertex)
+        semi = list(range(n))
+        label = list(range(n))
+        ancestor = [-1] * n
+        idom = [0] * n
+
+        def evaluate(v):
+            if ancestor[v] < 0:
+                return v
+            # 経路圧縮
+            path = []
+            u = v
+            while ancestor[ancestor[u]] >= 0:
+                path.append(u)
+                u = ancestor[u]
+            while path:
+                u = path.pop()
+                a = ancestor[u]
+                if semi[label[a]] < semi[label[u]]:
+                    label[u] = label[a]
+                ancestor[u] = ancestor[a]
+            return label[v]
+
+        for w in range(n - 1, 0, -1):
+            for predecessor in vertex[w].predecessors:
+                v = number.get(predecessor)
+                if v is None:
+                    # 入口から到達できないブロック
+                    continue
+                u = evaluate(v)
+                if semi[u] < semi[w]:
+                    semi[w] = semi[u]
+            ancestor[w] = parent[w]
+
+        for w in range(1, n):
+            idom[w] = parent[w]
+            while idom[w] > semi[w]:
+                idom[w] = idom[idom[w]]
+            block = vertex[w]
+            block.idom = vertex[idom[w]]
+            block.idom.dominated.append(block)
+
+        # 支配木に行きがけ/帰りがけの順番を付ける
+        counter = 0
+        stack = [(self.entry, False)]
+        while stack:
+            block, done = stack.pop()
+            if done:
+                block._post = counter
+            else:
+                block._pre = counter
+                stack.append((block, True))
+                for child in reversed(block.dominated):
+                    stack.append((child, False))
+            counter += 1
+
+    def _loops(self):
+        """自然ループとその入れ子を求める
+
+        内側のループ (支配木で深いヘッダ) から順にループ本体を後ろ向きに辿る.
+        すでに見つけた内側のループのブロックに着いたら, Union-Find で
+        その最も外側のループのヘッダまで飛ぶ
+        """
+        headers = []
+        for block in self.order:
+            latches = [p for p in block.predecessors
+                       if self.dominates(block, p)]
+            if latches:
+                headers.append((block, latches))
+
+        outer = {}
+
+        def find(block):
+            path = []
+            while block in outer:
+                path.append(block)
+                block = outer[block]
+            for b in path:
+                outer[b] = block
+            return block
+
+        loops = {}
+        for header, latches in sorted(headers, key=lambda h: -h[0]._pre):
+            loop = Loop(header)
+            loop.latches = latches
+            loops[header] = loop
+            header.loop = loop
+            seen = set([header])
+            worklist = list(latches)
+            while worklist:
+                block = find(worklist.pop())
+                if block in seen:
+                    continue
+                seen.add(block)
+                if block in loops:
+                    # 内側のループ
+                    inner = loops[block]
+                    inner.parent = loop
+                    loop.children.append(inner)
+                else:
+                    block.loop = loop
+                    loop.body.append(block)
+                worklist.extend(p for p in block.predecessors if p.reachable)
+                outer[block] = header
+
+        result = sorted(loops.values(), key=lambda l: l.header._pre)
+        for loop in result:
+            if loop.parent is not None:
+                loop.depth = loop.parent.depth + 1
+        return result
+
+
+def build(code):
+    """コードを関数ごとに分割し, 制御フローグラフのリストを返す
+
+    最初の関数より前の行 (GLOBAL/EXTERN/section など) は含めない
+    """
+    if not isinstance(code, CodeList):
+        code = CodeList(code)
+
+    graphs = []
+    name = None
+    blocks = []
+    block = None
+    # 直前の命令がブロックを終えるジャンプ命令/ret か, ブロックに命令があるか
+    ended = has_code = False
+    for cell in code.cells():
+        line = cell.line
+        if isinstance(line, Label) and line.glob:
+            if blocks:
+                graphs.append(ControlFlowGraph(name, blocks))
+            name = line.label
+            block = BasicBlock(0)
+            blocks = [block]
+            ended = has_code = False
+        elif block is None:
+            continue
+        elif isinstance(line, Label):
+            # 連続するラベルは同じブロックの先頭とする
+            if ended or has_code:
+                block = BasicBlock(len(blocks))
+                blocks.append(block)
+            ended = has_code = False
+        elif isinstance(line, Code):
+            if ended:
+                block = BasicBlock(len(blocks))
+                blocks.append(block)
+            ended = line.op in ('jmp', 'ret',) + CONDITIONAL_JUMPS
+            has_code = True
+
+        block.cells.append(cell)
+        if isinstance(line, Label):
+            block.labels.append(line)
+    if blocks:
+        graphs.append(ControlFlowGraph(name, blocks))
+    return graphs
@@ -25,7 +25,7 @@ class Code(object):
                 dword = False
                 break
             elif isinstance(arg, (str, unicode,)):
-                if arg in ('al', 'eax', 'ebp', 'esp',):
+                if arg in Registers.__members__:
                     dword = False
                     break
 
@@ -50,6 +50,15 @@ class Code(object):
                 op, args, self.comment).strip()
 
 
+class Align(object):
+    """次の行のアドレスを bytes の倍数にそろえる (間は nop で埋められる)"""
+    def __init__(self, byte=16):
+        self.bytes = byte
+
+    def __str__(self):
+        return "    ALIGN       {0}".format(self.bytes)
+
+
 class Common(object):
     def __init__(self, label, byte=4):
         self.label = label
@@ -151,6 +160,41 @@ class Memory(object):
         return '[{0}{1:+d}]'.format(self.register.value, self.offset)
 
 
+class Address(object):
+    """lea 命令のアドレス [base+index*scale+offset] (base, index は省略可能)"""
+    def __init__(self, base=None, index=None, scale=1, offset=0):
+        self.base = base
+        self.index = index
+        self.scale = scale
+        self.offset = offset
+
+    def registers(self):
+        return [r for r in (self.base, self.index,) if r is not None]
+
+    def __eq__(self, other):
+        if isinstance(other, Address):
+            return ((self.base, self.index, self.scale, self.offset)
+                    == (other.base, other.index, other.scale, other.offset))
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __str__(self):
+        terms = []
+        if self.base is not None:
+            terms.append(str(self.base.value))
+        if self.index is not None:
+            if self.scale == 1:
+                terms.append(str(self.index.value))
+            else:
+                terms.append('{0}*{1}'.format(self.index.value, self.scale))
+        return '[{0}{1:+d}]'.format('+'.join(terms), self.offset)
+
+
 class Register(object):
     def __init__(self, register):
         self.register = register
@@ -172,6 +216,11 @@ class Register(object):
 class Registers(enum.Enum):
     al = Register('al')
     eax = Register('eax')
+    ebx = Register('ebx')
+    ecx = Register('ecx')
+    edx = Register('edx')
+    esi = Register('esi')
+    edi = Register('edi')
     ebp = Register('ebp')
     esp = Register('esp')
 
@@ -182,3 +231,104 @@ class Section(object):
 
     def __str__(self):
         return 'section .' + self.tp
+
+
+class CodeList(object):
+    """コードの行を保持する双方向連結リスト
+
+    最適化器が行の削除/挿入/置換をその場で O(1) で行うためのコンテナ.
+    反復中に行を削除しても, 削除されていない次の行から反復を続ける.
+    log にリストを設定すると, 変更のあったセル (削除されたセルとその直前のセル,
+    挿入/置換されたセル, touch で通知されたセル) を追加していく
+    """
+    class Cell(object):
+        __slots__ = ('line', 'prev', 'next',)
+
+        def __init__(self, line, prev=None, next=None):
+            self.line = line
+            self.prev = prev
+            self.next = next
+
+    def __init__(self, lines=()):
+        # 循環リストの番兵 (root.next が先頭, root.prev が末尾の行)
+        self._root = root = self.Cell(None)
+        root.prev = root.next = root
+        self._length = 0
+        self.log = None
+        for line in lines:
+            self.append(line)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for cell in self.cells():
+            yield cell.line
+
+    def cells(self, after=None):
+        """行を保持するセルを先頭 (after を指定した場合はその次) から順に返す"""
+        root = self._root
+        cell = root.next if after is None else after.next
+        while cell.prev is None:
+            cell = cell.next
+        while cell is not root:
+            yield cell
+            cell = cell.next
+            # 反復中に削除されたセルを飛ばす
+            while cell.prev is None:
+                cell = cell.next
+
+    def cells_before(self, cell):
+        """cell より前のセルを逆順に返す (反復中に削除してはならない)"""
+        root = self._root
+        cell = cell.prev
+        while cell is not root:
+            yield cell
+            cell = cell.prev
+
+    def first(self):
+        """先頭のセル (空の場合は None)"""
+        cell = self._root.next
+        return None if cell is self._root else cell
+
+    def append(self, line):
+        return self.insert_after(self._root.prev, line)
+
+    def insert_after(self, cell, line):
+        """cell の直後に行を挿入してセルを返す (cell が None なら先頭に挿入)"""
+        if cell is None:
+            cell = self._root
+        new = self.Cell(line, cell, cell.next)
+        cell.next.prev = new
+        cell.next = new
+        self._length += 1
+        if self.log is not None:
+            self.log.append(new)
+        return new
+
+    def insert_before(self, cell, line):
+        """cell の直前に行を挿入してセルを返す"""
+        return self.insert_after(cell.prev, line)
+
+    def replace(self, cell, line):
+        cell.line = line
+        self.touch(cell)
+
+    def touch(self, cell):
+        """セルの行をその場で書き換えたことを通知する"""
+        if self.log is not None:
+            self.log.append(cell)
+
+    def remove(self, cell):
+        """セルを削除する (削除済みのセルは無視する)"""
+        if cell.prev is None:
+            return
+        if self.log is not None:
+            if cell.prev is not self._root:
+                self.log.append(cell.prev)
+            self.log.append(cell)
+        cell.prev.next = cell.next
+        cell.next.prev = cell.prev
+        # next は反復を続けるために残す
+        cell.prev = None
+        self._length -= 1
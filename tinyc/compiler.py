@@ -3,9 +3,11 @@
 
 from __future__ import absolute_import, print_function, unicode_literals
 import logging
+import mmap
+import os
 
-from tinyc import analyzer, generator, optimizer
-from tinyc.code import Label
+from tinyc import analyzer, generator, optimizer, token, transform
+from tinyc.code import CodeList, Label
 from tinyc.parser import Parser
 
 
@@ -15,8 +17,10 @@ class Compiler(object):
         self.logger = logging.getLogger()
 
         # 字句解析器/構文解析器
-        self.parser = Parser()
-        self.parser.build(debug=kwargs['debug'])
+        self.parser = Parser(engine=kwargs.get('parser', 'ply'),
+                             lexer=kwargs.get('lexer', 'ply'))
+        self.parser.build(
+            debug=kwargs['debug'], cache_dir=kwargs.get('cache_dir'))
 
         self.errors = 0
         self.warnings = 0
@@ -28,27 +32,43 @@ class Compiler(object):
         self.warnings += analyzer.warnings
         return ast
 
+    def _transformers(self):
+        """構文木の変換による最適化 (意味解析の後に行う)"""
+        transformers = [transform.TailRecursion()]
+        if self.kwargs['optimization'] > 1:
+            transformers.append(transform.LoopUnrolling(
+                factor=self.kwargs.get('unroll', 4)))
+        transformers += [
+            transform.LoopInvariantMotion(), transform.StrengthReduction()]
+        if self.kwargs['format'] != 'llvm':
+            # 置き換えた式の評価に必要なレジスタ数を求め直す
+            transformers.append(analyzer.RegisterAnalyzer())
+        return transformers
+
+    def _transform(self, transformer, ast):
+        ast = transformer.analyze(ast)
+        self.optimized += getattr(transformer, 'optimized', 0)
+        return ast
+
     def _optimize_llvm(self, module):
         self.logger.info('Compilation process (LLVM Passes)')
         module = optimizer.LLVMPasses().optimize(module)
         return module
 
     def _optimize_nasm(self, code):
-        """最適化処理"""
+        """最適化処理
+
+        コードの行のリストを CodeList に変換し, 作業リストを用いて
+        変更のあった行の近傍だけを再検査しながら不動点まで最適化する
+        """
         self.logger.info('Compilation process (Peephole optimizations)')
-        for i in range(1, 6):
-            self.logger.info('Peephole optimizations (Phase {0})'.format(i))
-            temp = self.optimized
-            code = self._optimize_one(optimizer.LabelOptimizer(), code)
-            code = self._optimize_one(optimizer.GlobalExternOptimizer(), code)
-            code = self._optimize_one(optimizer.JumpOptimizer(), code)
-            code = self._optimize_one(
-                optimizer.UnnecessaryCodeOptimizer(), code)
-            code = self._optimize_one(optimizer.ReplaceCodeOptimizer(), code)
-            code = self._optimize_one(optimizer.StackPointerOptimzier(), code)
-            if self.optimized == temp:
-                break
-            self.logger.info('Optimized: {0}'.format(self.optimized - temp))
+        peephole = optimizer.PeepholeOptimizer(
+            layout=self.kwargs['optimization'] > 1)
+        code = self._optimize_one(peephole, CodeList(code))
+        self.logger.info('Peephole optimizations: {0} lines examined'.format(
+            peephole.scanned + peephole.examined))
+        for name, hits in peephole.hits.items():
+            self.logger.info('Peephole rule: {0}: {1}'.format(name, hits))
         return code
 
     def _optimize_one(self, optimizer, code):
@@ -76,16 +96,56 @@ class Compiler(object):
                 result.append(str(line))
         return "\n".join(result) + '\n'
 
-    def compile(self, code):
-        fm = self.kwargs['format']
-        optimize = self.kwargs['optimization'] > 0
-        result = {}
+    def _semantic_analyzers(self):
+        table = self.kwargs.get('symbol_table', 'chain')
+        if self.kwargs.get('analyzer') == 'fused':
+            # 意味解析を 1 回の走査で行う
+            return [analyzer.FusedAnalyzer(
+                nasm=self.kwargs['format'] != 'llvm', table=table)]
+        analyzers = [
+            analyzer.SymbolAnalyzer(table=table),
+            analyzer.SymbolReplaceAnalyzer(),
+            analyzer.FunctionAnalyzer(),
+        ]
+        if self.kwargs['format'] != 'llvm':
+            analyzers.append(analyzer.ParameterAnalyzer())
+            analyzers.append(analyzer.RegisterAnalyzer())
+        return analyzers
+
+    def _nasm_generator(self):
+        if self.kwargs.get('selector') == 'burs':
+            # 木のパターン照合による命令選択
+            return generator.BURSx86Generator()
+        return generator.NASMx86Generator()
 
+    def _log_options(self):
         self.logger.info('Compilation options')
         self.logger.info('* Format: ' + self.kwargs['format'])
         self.logger.info(
             '* Optimization level: ' + str(self.kwargs['optimization']))
 
+    def _finish_llvm(self, module, optimize):
+        if optimize:
+            module = self._optimize_llvm(module)
+        return self._format_llvm(module)
+
+    def _finish_nasm(self, gen, optimize):
+        code = gen.code
+        self.optimized += gen.optimized
+
+        # 最適化
+        if optimize:
+            code = self._optimize_nasm(code)
+
+        return self._format(code)
+
+    def compile(self, code):
+        fm = self.kwargs['format']
+        optimize = self.kwargs['optimization'] > 0
+        result = {}
+
+        self._log_options()
+
         # 字句解析/構文解析
         self.logger.info('Compilation process (Lexical/Syntax analysis)')
         ast = self.parser.parse(code, optimize=optimize)
@@ -95,12 +155,14 @@ class Compiler(object):
         if self.errors == 0:
             # 意味解析
             self.logger.info('Compilation process (Semantic analysis)')
-            ast = self._analyze(analyzer.SymbolAnalyzer(), ast)
-            ast = self._analyze(analyzer.SymbolReplaceAnalyzer(), ast)
-            ast = self._analyze(analyzer.FunctionAnalyzer(), ast)
-            if fm != 'llvm':
-                ast = self._analyze(analyzer.ParameterAnalyzer(), ast)
-                ast = self._analyze(analyzer.RegisterAnalyzer(), ast)
+            for a in self._semantic_analyzers():
+                ast = self._analyze(a, ast)
+
+        if self.errors == 0 and optimize:
+            # 構文木の変換
+            self.logger.info('Compilation process (AST transformations)')
+            for t in self._transformers():
+                ast = self._transform(t, ast)
 
         if self.errors == 0:
             # コード生成
@@ -109,22 +171,11 @@ class Compiler(object):
             if fm == 'llvm':
                 gen = generator.LLVMGenerator()
                 module = gen.analyze(ast, optimize=optimize)
-
-                if optimize:
-                    module = self._optimize_llvm(module)
-
-                result['asm'] = self._format_llvm(module)
+                result['asm'] = self._finish_llvm(module, optimize)
             else:
-                gen = generator.NASMx86Generator()
+                gen = self._nasm_generator()
                 ast = gen.analyze(ast, format=fm, optimize=optimize)
-                code = gen.code
-                self.optimized = gen.optimized
-
-                # 最適化
-                if optimize:
-                    code = self._optimize_nasm(code)
-
-                result['asm'] = self._format(code)
+                result['asm'] = self._finish_nasm(gen, optimize)
 
         # 抽象構文木
         if self.kwargs['ast']:
@@ -136,3 +187,101 @@ class Compiler(object):
         result['optimized'] = self.optimized
 
         return result
+
+    def _format_ast(self, node):
+        """外部宣言 1 つ分の構文木を ExternalDeclarationList の要素としてフォーマットする"""
+        printer = analyzer.PrintAnalyzer()
+        printer.indent()
+        return printer.analyze(node)
+
+    def compile_file(self, path):
+        """ファイルをメモリマップして, 外部宣言ごとにコンパイルする
+
+        外部宣言は構文解析が終わるたびに意味解析とコード生成へ渡すため,
+        ソースコード全体の文字列と構文木全体を同時に保持しない.
+        構文エラーが起きた後の外部宣言は意味解析を行わず (compile では
+        意味解析全体を行わない), エラーが起きた後はコード生成を行わない.
+        構文解析器は rd, 字句解析器は regex を指定しておくこと
+        """
+        fm = self.kwargs['format']
+        optimize = self.kwargs['optimization'] > 0
+        result = {}
+
+        self._log_options()
+
+        # mmap を入力にできるのは再帰下降構文解析器と regex の字句解析器のみ
+        parser = self.parser
+        if parser.engine != 'rd' or parser.lexer_engine != 'regex':
+            raise ValueError(
+                'compile_file requires the rd parser and the regex lexer')
+
+        analyzers = self._semantic_analyzers()
+        for a in analyzers:
+            a.start()
+        transformers = self._transformers() if optimize else []
+        for t in transformers:
+            t.start()
+        if fm == 'llvm':
+            gen = generator.LLVMGenerator()
+            gen.start_stream(optimize=optimize)
+        else:
+            gen = self._nasm_generator()
+            gen.start_stream(format=fm, optimize=optimize)
+        # 抽象構文木 (グローバル変数の宣言は後の関数定義で属性が追加されるため,
+        # 構文木を保持して最後にフォーマットする)
+        ast = ['+ ExternalDeclarationList\n'] if self.kwargs['ast'] else None
+
+        self.logger.info('Compilation process (Streaming compilation)')
+        with open(path, 'rb') as f:
+            # 空のファイルはメモリマップできない
+            if os.fstat(f.fileno()).st_size == 0:
+                data = b''
+            else:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for node in parser.parse_iter(data, optimize=optimize):
+                    if parser.errors == 0:
+                        # 意味解析
+                        for a in analyzers:
+                            node.accept(a)
+                            a.finish()
+                        self.errors = sum(a.errors for a in analyzers)
+                        self.warnings = sum(a.warnings for a in analyzers)
+                        # 構文木の変換とコード生成
+                        if self.errors == 0:
+                            for t in transformers:
+                                node.accept(t)
+                                t.finish()
+                            gen.analyze_stream(node)
+                    if ast is not None:
+                        if isinstance(node, token.Declaration):
+                            ast.append(node)
+                        else:
+                            ast.append(self._format_ast(node))
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+
+        self.errors += parser.errors
+        self.optimized += parser.optimized
+        for t in transformers:
+            self.optimized += getattr(t, 'optimized', 0)
+
+        if self.errors == 0:
+            if fm == 'llvm':
+                result['asm'] = self._finish_llvm(gen.finish_stream(), optimize)
+            else:
+                gen.finish_stream()
+                result['asm'] = self._finish_nasm(gen, optimize)
+
+        if ast is not None:
+            self.logger.info('Compilation process (AST formatting)')
+            result['ast'] = ''.join(
+                self._format_ast(node) if isinstance(node, token.Node) else node
+                for node in ast)
+
+        result['errors'] = self.errors
+        result['warnings'] = self.warnings
+        result['optimized'] = self.optimized
+
+        return result
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""制御フローグラフ (tinyc.cfg) 上のビットベクトルによるデータフロー解析
+
+汎用レジスタ, フラグ, スタック上の変数 ([ebp+n], esp 以上の [esp+n])
+を場所 (location) として扱い, 集合は Python の int をビット列として表す.
+グローバル変数と esp より下のメモリは追跡しない
+"""
+
+from __future__ import print_function, unicode_literals
+
+from tinyc.code import Address, Code, Memory, Registers
+
+
+EAX = 'eax'
+EBX = 'ebx'
+ECX = 'ecx'
+EDX = 'edx'
+ESI = 'esi'
+EDI = 'edi'
+FLAGS = 'flags'
+REGISTERS = (EAX, EBX, ECX, EDX, ESI, EDI, FLAGS,)
+# 関数呼び出しで値が保存されるレジスタ (呼び出された側が保存する)
+CALLEE_SAVED = (EBX, ESI, EDI,)
+# すべてのスタック上の変数 (未知の命令が読み出すもの)
+MEMORY = 'memory'
+
+ARITHMETIC = ('add', 'and', 'imul', 'or', 'sub', 'xor',)
+UNARY = ('dec', 'inc', 'neg',)
+COMPARE = ('cmp', 'test',)
+SETCC = ('sete', 'setg', 'setge', 'setl', 'setle', 'setne',)
+JUMPS = ('jmp', 'je', 'jne', 'jz', 'jnz', 'jl', 'jle', 'jg', 'jge',)
+
+
+class Effect(object):
+    """1 命令が読み書きする場所
+
+    defs はすべてを書き換える場所, partial は一部だけ書き換える場所 (al など),
+    removable は書き込んだ値が使われなければ削除してよい命令か
+    """
+    __slots__ = ('uses', 'defs', 'partial', 'removable',)
+
+    def __init__(self, uses=(), defs=(), partial=(), removable=True):
+        self.uses = list(uses)
+        self.defs = list(defs)
+        self.partial = list(partial)
+        self.removable = removable
+
+
+def _register(arg):
+    """レジスタのオペランドの (場所, 一部だけか) を返す (それ以外は None)"""
+    if isinstance(arg, Registers):
+        name = arg.name
+    elif isinstance(arg, (str, unicode,)) and arg in Registers.__members__:
+        name = arg
+    else:
+        return None
+    if name == 'al':
+        return EAX, True
+    return name, False
+
+
+def location(arg):
+    """オペランドの場所を返す (追跡しないオペランドは None)"""
+    register = _register(arg)
+    if register is not None:
+        return register[0]
+    elif isinstance(arg, Memory):
+        base = arg.register.name
+        if base == 'ebp' or (base == 'esp' and arg.offset >= 0):
+            return (base, arg.offset)
+    return None
+
+
+def effect(line):
+    """命令が読み書きする場所を返す"""
+    op = line.op
+    args = line.args
+
+    def uses(*operands):
+        return [l for l in map(location, operands) if l is not None]
+
+    def destination(arg, effect):
+        """書き込み先を effect に追加する"""
+        register = _register(arg)
+        l = location(arg)
+        if register is not None and register[1]:
+            effect.partial.append(l)
+        elif l is not None:
+            effect.defs.append(l)
+        if l in (None, 'ebp', 'esp',):
+            # ebp/esp, グローバル変数, esp より下のメモリへの書き込み
+            effect.removable = False
+
+    if op in ('mov', 'movzx',) and len(args) == 2:
+        e = Effect(uses=uses(args[1]))
+        destination(args[0], e)
+    elif op == 'lea' and len(args) == 2 and isinstance(args[1], Address):
+        # アドレスの計算だけで, メモリを読まない
+        e = Effect(uses=uses(*args[1].registers()))
+        destination(args[0], e)
+    elif op == 'imul' and len(args) == 3:
+        # imul R, R/M, I
+        e = Effect(uses=uses(args[1]), defs=[FLAGS])
+        destination(args[0], e)
+    elif op in ARITHMETIC and len(args) == 2:
+        if op == 'xor' and _register(args[0]) and args[0] == args[1]:
+            # xor R, R は R を読まない
+            e = Effect(defs=[FLAGS])
+        else:
+            e = Effect(uses=uses(*args), defs=[FLAGS])
+        destination(args[0], e)
+    elif op in UNARY and len(args) == 1:
+        e = Effect(uses=uses(args[0]), defs=[FLAGS])
+        destination(args[0], e)
+    elif op in COMPARE and len(args) == 2:
+        e = Effect(uses=uses(*args), defs=[FLAGS])
+    elif op in SETCC and len(args) == 1:
+        e = Effect(uses=[FLAGS])
+        destination(args[0], e)
+    elif op == 'cdq':
+        e = Effect(uses=[EAX], defs=[EDX])
+    elif op == 'idiv' and len(args) == 1:
+        # 0 除算の例外があるため削除しない
+        e = Effect(uses=[EAX, EDX] + uses(args[0]), defs=[EAX, EDX, FLAGS],
+                   removable=False)
+    elif op == 'push' and len(args) == 1:
+        e = Effect(uses=uses(args[0]), removable=False)
+    elif op == 'pop' and len(args) == 1:
+        e = Effect(removable=False)
+        destination(args[0], e)
+    elif op == 'call':
+        # 呼び出し先は eax, ecx, edx, フラグを書き換える
+        e = Effect(defs=[EAX, ECX, EDX, FLAGS], removable=False)
+    elif op == 'ret':
+        # 戻り値と, 呼び出し元のために保存したレジスタを読む
+        e = Effect(uses=(EAX,) + CALLEE_SAVED, removable=False)
+    elif op == 'jmp':
+        e = Effect(removable=False)
+    elif op in JUMPS:
+        e = Effect(uses=[FLAGS], removable=False)
+    else:
+        # 未知の命令はすべての場所を読むものとする
+        e = Effect(uses=REGISTERS + (MEMORY,), removable=False)
+    return e
+
+
+class Dataflow(object):
+    """ビットベクトルによるデータフロー解析 (合流は和集合)
+
+    サブクラスは forward (前向きか), transfer (ブロックの gen と kill),
+    boundary (入口/出口のブロックでの値) を定義する.
+    入口から到達できるブロックだけを, 前向きは逆後順, 後ろ向きは後順に
+    処理する. iterations は処理したブロックの延べ数で, ループが深く
+    入れ子になっていてもブロック数のほぼ定数倍で収束する
+    """
+    forward = True
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.gen = {}
+        self.kill = {}
+        for block in graph.order:
+            self.gen[block], self.kill[block] = self.transfer(block)
+        self.IN = {}
+        self.OUT = {}
+        self.iterations = 0
+        self._solve()
+
+    def transfer(self, block):
+        return 0, 0
+
+    def boundary(self, block):
+        return 0
+
+    def _solve(self):
+        if self.forward:
+            order = self.graph.order
+            sources = lambda b: b.predecessors
+            targets = lambda b: b.successors
+            before, after = self.IN, self.OUT
+            is_boundary = lambda b: b is self.graph.entry
+        else:
+            order = list(reversed(self.graph.order))
+            sources = lambda b: b.successors
+            targets = lambda b: b.predecessors
+            before, after = self.OUT, self.IN
+            is_boundary = lambda b: not b.successors
+
+        # 変更のあったブロックだけを order の順に繰り返し走査する.
+        # 後退辺の先のブロックは次の走査で処理するため, 入れ子のループの
+        # 後退辺からの情報が 1 回の走査でまとめて伝わる
+        position = dict((block, i) for i, block in enumerate(order))
+        for block in order:
+            before[block] = after[block] = 0
+        dirty = [True] * len(order)
+        remaining = len(order)
+        gen = self.gen
+        kill = self.kill
+        while remaining:
+            for i, block in enumerate(order):
+                if not dirty[i]:
+                    continue
+                dirty[i] = False
+                remaining -= 1
+                self.iterations += 1
+                value = self.boundary(block) if is_boundary(block) else 0
+                for source in sources(block):
+                    value |= after.get(source, 0)
+                before[block] = value
+                value = gen[block] | (value & ~kill[block])
+                if value != after[block]:
+                    after[block] = value
+                    for target in targets(block):
+                        j = position.get(target)
+                        if j is not None and not dirty[j]:
+                            dirty[j] = True
+                            remaining += 1
+
+
+def instructions(block):
+    """ブロックの削除されていない命令のセルを順に返す"""
+    for cell in block.cells:
+        if cell.prev is not None and isinstance(cell.line, Code):
+            yield cell
+
+
+class Liveness(Dataflow):
+    """生存区間解析 (後ろ向き)
+
+    locations は解析する場所のリストで, 省略するとレジスタとフラグだけを扱う.
+    ret 以外で終わる出口のブロックでは, すべてが生存しているものとする
+    """
+    forward = False
+
+    def __init__(self, graph, locations=REGISTERS):
+        self.locations = list(locations)
+        self.bits = dict((l, 1 << i) for i, l in enumerate(self.locations))
+        self.everything = (1 << len(self.locations)) - 1
+        self.memory = self.mask(l for l in self.locations
+                                if isinstance(l, tuple))
+        super(Liveness, self).__init__(graph)
+
+    def mask(self, locations):
+        bits = 0
+        for l in locations:
+            if l == MEMORY:
+                bits |= self.memory
+            else:
+                bits |= self.bits.get(l, 0)
+        return bits
+
+    def transfer(self, block):
+        gen = kill = 0
+        for cell in reversed(list(instructions(block))):
+            e = effect(cell.line)
+            defs = self.mask(e.defs)
+            gen = (gen & ~defs) | self.mask(e.uses)
+            kill |= defs
+        return gen, kill
+
+    def boundary(self, block):
+        last = block.terminator
+        if last is not None and last.op == 'ret':
+            return 0
+        return self.everything
+
+
+class ReachingDefinitions(Dataflow):
+    """スタック上の変数への書き込みの到達定義解析 (前向き)
+
+    definitions は書き込みのセルと場所の組のリストで, ビット i が
+    definitions[i] に対応する. 一部だけの書き込みは他の定義を消さない
+    """
+    forward = True
+
+    def __init__(self, graph):
+        self.definitions = []
+        self.bits = {}
+        # 場所ごとの, その場所へのすべての定義のビット
+        self.by_location = {}
+        for block in graph.order:
+            for cell in instructions(block):
+                e = effect(cell.line)
+                for l in e.defs + e.partial:
+                    if isinstance(l, tuple):
+                        bit = 1 << len(self.definitions)
+                        self.definitions.append((cell, l))
+                        self.bits[cell, l] = bit
+                        self.by_location[l] = self.by_location.get(l, 0) | bit
+        super(ReachingDefinitions, self).__init__(graph)
+
+    def used(self, e, reach):
+        """reach のうち, 命令 (の effect e) が読み出す定義を返す"""
+        if MEMORY in e.uses:
+            return reach
+        bits = 0
+        for l in e.uses:
+            bits |= reach & self.by_location.get(l, 0)
+        return bits
+
+    def step(self, cell, e, reach):
+        """命令 cell の後に到達する定義を返す"""
+        for l in e.defs:
+            if l in self.by_location:
+                reach = (reach & ~self.by_location[l]) | self.bits[cell, l]
+        for l in e.partial:
+            if (cell, l) in self.bits:
+                reach |= self.bits[cell, l]
+        return reach
+
+    def transfer(self, block):
+        gen = kill = 0
+        for cell in instructions(block):
+            e = effect(cell.line)
+            for l in e.defs:
+                if l in self.by_location:
+                    kill |= self.by_location[l]
+                    gen &= ~self.by_location[l]
+            gen = self.step(cell, e, gen)
+        return gen, kill
+
+    def boundary(self, block):
+        return 0
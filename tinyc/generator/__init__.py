@@ -3,5 +3,6 @@
 
 from __future__ import absolute_import
 
+from .burs import BURSx86Generator
 from .llvm import LLVMGenerator
 from .nasm import NASMx86Generator
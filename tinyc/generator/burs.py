@@ -0,0 +1,583 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""木のパターン照合 (BURS) による命令選択を行う NASM (x86) のコード生成器
+
+式の構文木の各ノードについて, 非終端記号ごとに最小のコストとその規則を
+葉から順に求め (ラベル付け), 根から最小コストの被覆に従ってコードを出力する
+(還元). 非終端記号は次のとおり.
+
+* reg: eax に求めた値
+* imm, zero, scale, scale_base: 定数 (即値) とその値による分類
+* mem: 変数 (メモリオペランド)
+* cc: フラグに求めた比較の結果
+* index, addr: lea 命令のアドレス (index はベースのないもの)
+* stmt: 値を使わない式 (式文)
+
+文, 関数呼び出しの引数, 論理演算子の子の式は, それぞれ新たな根として
+ラベル付けする. 途中の値を保持するスクラッチレジスタと評価の順序は
+NASMx86Generator と同じく Sethi-Ullman 数 (RegisterAnalyzer) による
+"""
+
+from __future__ import print_function, unicode_literals
+
+from tinyc import token
+from tinyc.analyzer import REGISTERS
+from tinyc.code import Address, Registers
+from tinyc.generator.nasm import NASMx86Generator
+
+
+# 命令のコスト (おおよそのサイクル数, 参考文献 6). 特に示さない命令は 1
+MEMORY = 1
+MULTIPLY = 3
+DIVIDE = 20
+CALL = 10
+
+COMPARE = ('EQ', 'NEQ', 'LT', 'LTE', 'GT', 'GTE',)
+
+_OPERATORS = {
+    token.Negative: 'NEG',
+    token.Increment: 'INC',
+    token.Decrement: 'DEC',
+    token.Constant: 'CONST',
+    token.Identifier: 'ID',
+    token.FunctionExpression: 'CALL',
+}
+
+
+def _operator(node):
+    """パターンの照合に用いるノードの演算子 (式でなければ None)"""
+    if isinstance(node, token.BinaryOperator):
+        return node.op
+    return _OPERATORS.get(node.__class__)
+
+
+def _children(node):
+    """パターンの照合に用いる子ノード (関数呼び出しと論理演算子は葉とする)"""
+    if isinstance(node, token.BinaryOperator):
+        if node.op in ('LAND', 'LOR',):
+            return ()
+        return (node.left, node.right,)
+    elif isinstance(node, token.UnaryOperator):
+        return (node.expr,)
+    return ()
+
+
+def _save_cost(kid):
+    """kid を評価する間, eax の値を保持するコスト
+
+    スクラッチレジスタに収まれば mov 1 回, 収まらなければスタック上の
+    一時変数への書き込みと読み出し
+    """
+    if 1 + kid.registers <= REGISTERS:
+        return 1
+    return 1 + 2 * MEMORY
+
+
+def _pair_cost(cost):
+    """両辺を eax に求める規則のコスト (後に評価する側の間の保持を含む)"""
+    def function(kids):
+        left, right = kids[0][0], kids[1][0]
+        later = right if left.registers > right.registers else left
+        return cost + _save_cost(later)
+    return function
+
+
+class Rule(object):
+    """命令選択の規則
+
+    nonterminal <- pattern をコスト cost で導き, BURSx86Generator の
+    emit という名前のメソッドでコードを出力する.
+    pattern は演算子と子のパターンのタプルで, 子のパターンは非終端記号か
+    入れ子のタプル. pattern が非終端記号の場合は連鎖規則になる.
+    cost は数か, 葉の (ノード, 非終端記号) のリストを受け取る関数.
+    when は定数の値の条件, swapped は演算子の左右の子を入れ替えた規則か
+    """
+    def __init__(self, nonterminal, pattern, cost, emit=None, when=None,
+                 swapped=False):
+        self.nonterminal = nonterminal
+        self.pattern = pattern
+        self.cost = cost
+        self.emit = emit
+        self.when = when
+        self.swapped = swapped
+
+    def __repr__(self):
+        return 'Rule({0!r}, {1!r})'.format(self.nonterminal, self.pattern)
+
+
+def _both(nonterminal, op, left, right, cost, emit, **kwargs):
+    """op(left, right) と, 左右を入れ替えた op(right, left) の規則"""
+    return [Rule(nonterminal, (op, left, right,), cost, emit, **kwargs),
+            Rule(nonterminal, (op, right, left,), cost, emit, swapped=True,
+                 **kwargs)]
+
+
+def _rules():
+    rules = [
+        # 葉
+        Rule('imm', ('CONST',), 0),
+        Rule('zero', ('CONST',), 0, when=lambda v: v == 0),
+        Rule('scale', ('CONST',), 0, when=lambda v: v in (2, 4, 8,)),
+        Rule('scale_base', ('CONST',), 0, when=lambda v: v in (3, 5, 9,)),
+        Rule('mem', ('ID',), 0),
+        Rule('stmt', ('CONST',), 0, '_emit_nothing'),
+        Rule('stmt', ('ID',), 0, '_emit_nothing'),
+        # 連鎖規則
+        Rule('reg', 'imm', 1, '_emit_constant'),
+        Rule('reg', 'mem', 1 + MEMORY, '_emit_variable'),
+        Rule('reg', 'cc', 2, '_emit_set'),
+        Rule('reg', 'addr', 1, '_emit_lea'),
+        Rule('addr', 'index', 0, '_emit_address'),
+        Rule('stmt', 'reg', 0, '_emit_discard'),
+        # 単項演算子, 関数呼び出し, 論理演算子
+        Rule('reg', ('NEG', 'reg',), 1, '_emit_negative'),
+        Rule('reg', ('INC', 'mem',), 2 + 2 * MEMORY, '_emit_increment'),
+        Rule('reg', ('DEC', 'mem',), 2 + 2 * MEMORY, '_emit_increment'),
+        Rule('stmt', ('INC', 'mem',), 1 + 2 * MEMORY,
+             '_emit_increment_memory'),
+        Rule('stmt', ('DEC', 'mem',), 1 + 2 * MEMORY,
+             '_emit_increment_memory'),
+        Rule('reg', ('CALL',), CALL, '_emit_call'),
+        Rule('reg', ('LAND',), CALL, '_emit_logical'),
+        Rule('reg', ('LOR',), CALL, '_emit_logical'),
+        Rule('stmt', ('LAND',), CALL - 2, '_emit_logical_statement'),
+        Rule('stmt', ('LOR',), CALL - 2, '_emit_logical_statement'),
+        # 除算 (cdq と idiv)
+        Rule('reg', ('DIV', 'reg', 'mem',), DIVIDE + MEMORY,
+             '_emit_divide_memory'),
+        Rule('reg', ('DIV', 'reg', 'imm',), DIVIDE + 1,
+             '_emit_divide_immediate'),
+        Rule('reg', ('DIV', 'reg', 'reg',), _pair_cost(DIVIDE),
+             '_emit_divide_pair'),
+        # 代入
+        Rule('reg', ('ASSIGN', 'mem', 'reg',), MEMORY, '_emit_assign'),
+        Rule('reg', ('ASSIGN_PLUS', 'mem', 'reg',), 1 + 2 * MEMORY,
+             '_emit_assign'),
+        Rule('reg', ('ASSIGN_MINUS', 'mem', 'reg',), 2 + 2 * MEMORY,
+             '_emit_assign'),
+        Rule('stmt', ('ASSIGN', 'mem', 'imm',), MEMORY,
+             '_emit_assign_memory'),
+        Rule('stmt', ('ASSIGN_PLUS', 'mem', 'imm',), 1 + 2 * MEMORY,
+             '_emit_assign_memory'),
+        Rule('stmt', ('ASSIGN_MINUS', 'mem', 'imm',), 1 + 2 * MEMORY,
+             '_emit_assign_memory'),
+        Rule('stmt', ('ASSIGN_PLUS', 'mem', 'reg',), 1 + 2 * MEMORY,
+             '_emit_assign_register'),
+        Rule('stmt', ('ASSIGN_MINUS', 'mem', 'reg',), 1 + 2 * MEMORY,
+             '_emit_assign_register'),
+        # lea のアドレス
+        Rule('index', ('MULT', 'reg', 'scale',), 0, '_emit_scale'),
+        Rule('index', ('MULT', 'scale', 'reg',), 0, '_emit_scale',
+             swapped=True),
+        Rule('addr', ('MULT', 'reg', 'scale_base',), 0, '_emit_scale'),
+        Rule('addr', ('MULT', 'scale_base', 'reg',), 0, '_emit_scale',
+             swapped=True),
+        Rule('addr', ('MINUS', 'addr', 'imm',), 0, '_emit_displacement'),
+    ]
+    rules += _both('addr', 'PLUS', 'addr', 'imm', 0, '_emit_displacement')
+    rules += _both('addr', 'PLUS', 'reg', 'index',
+                   lambda kids: _save_cost(kids[1][0] if kids[0][1] == 'reg'
+                                           else kids[0][0]),
+                   '_emit_base')
+    rules.append(Rule('addr', ('PLUS', 'reg', 'reg',), _pair_cost(0),
+                      '_emit_base_pair'))
+
+    for op in ('PLUS', 'MINUS', 'MULT',):
+        cost = MULTIPLY if op == 'MULT' else 1
+        # 右 (入れ替えた規則では左) の子をオペランドに直接書く
+        swapped = cost + 1 if op == 'MINUS' else cost
+        for operand, extra in (('imm', 0,), ('mem', MEMORY,),):
+            rules.append(Rule('reg', (op, 'reg', operand,), cost + extra,
+                              '_emit_arithmetic'))
+            rules.append(Rule('reg', (op, operand, 'reg',), swapped + extra,
+                              '_emit_arithmetic', swapped=True))
+        rules.append(Rule('reg', (op, 'reg', 'reg',), _pair_cost(cost),
+                          '_emit_arithmetic_pair'))
+    # imul R, M, I
+    rules += _both('reg', 'MULT', 'mem', 'imm', MULTIPLY + MEMORY,
+                   '_emit_multiply')
+
+    for op in COMPARE:
+        rules.append(Rule('cc', (op, 'reg', 'zero',), 1, '_emit_test'))
+        rules.append(Rule('cc', (op, 'zero', 'reg',), 1, '_emit_test',
+                          swapped=True))
+        for operand, extra in (('imm', 0,), ('mem', MEMORY,),):
+            rules += _both('cc', op, 'reg', operand, 1 + extra,
+                           '_emit_compare')
+        rules += _both('cc', op, 'mem', 'imm', 1 + MEMORY, '_emit_compare')
+        rules.append(Rule('cc', (op, 'reg', 'reg',), _pair_cost(1),
+                          '_emit_compare_pair'))
+    return rules
+
+
+RULES = _rules()
+# 演算子 -> 規則のリスト (連鎖規則を除く)
+RULES_BY_OPERATOR = {}
+# 連鎖規則
+CHAINS = []
+for _rule in RULES:
+    if isinstance(_rule.pattern, tuple):
+        RULES_BY_OPERATOR.setdefault(_rule.pattern[0], []).append(_rule)
+    else:
+        CHAINS.append(_rule)
+del _rule
+
+
+def _match(pattern, node, labels, kids):
+    """pattern が node に一致すればコストの和を返し, 葉の (ノード, 非終端記号)
+    を kids に追加する (一致しなければ None)
+    """
+    if not isinstance(pattern, tuple):
+        label = labels[id(node)].get(pattern)
+        if label is None:
+            return None
+        kids.append((node, pattern,))
+        return label[0]
+    if _operator(node) != pattern[0]:
+        return None
+    children = _children(node)
+    if len(children) != len(pattern) - 1:
+        return None
+    cost = 0
+    for p, child in zip(pattern[1:], children):
+        c = _match(p, child, labels, kids)
+        if c is None:
+            return None
+        cost += c
+    return cost
+
+
+def label(node, labels):
+    """子ノードのラベルから node のラベル (非終端記号 -> (コスト, 規則, 葉)) を求める"""
+    best = {}
+    for rule in RULES_BY_OPERATOR.get(_operator(node), ()):
+        if rule.when is not None and not rule.when(node.value):
+            continue
+        kids = []
+        cost = _match(rule.pattern, node, labels, kids)
+        if cost is None:
+            continue
+        cost += rule.cost(kids) if callable(rule.cost) else rule.cost
+        current = best.get(rule.nonterminal)
+        if current is None or cost < current[0]:
+            best[rule.nonterminal] = (cost, rule, kids,)
+
+    # 連鎖規則を変化がなくなるまで適用する
+    changed = True
+    while changed:
+        changed = False
+        for rule in CHAINS:
+            source = best.get(rule.pattern)
+            if source is None:
+                continue
+            cost = source[0] + rule.cost
+            current = best.get(rule.nonterminal)
+            if current is None or cost < current[0]:
+                best[rule.nonterminal] = (cost, rule, [(node, rule.pattern,)],)
+                changed = True
+    return best
+
+
+def label_tree(root):
+    """root 以下の式の構文木をラベル付けする (id(ノード) -> ラベル)
+
+    深い構文木でも再帰の上限に達しないように, 明示的なスタックで
+    帰りがけ順に処理する
+    """
+    labels = {}
+    stack = [(root, False,)]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            labels[id(node)] = label(node, labels)
+        elif id(node) not in labels:
+            stack.append((node, True,))
+            for child in _children(node):
+                stack.append((child, False,))
+    return labels
+
+
+class BURSx86Generator(NASMx86Generator):
+    """木のパターン照合による命令選択を行うコード生成器
+
+    式以外のコード生成と, 関数呼び出し, 論理演算子は NASMx86Generator と同じ.
+    emit のメソッドは (ノード, 規則, 葉, ラベル, 結果) を受け取り,
+    葉の還元を yield する. cc と addr の還元は結果のリストに
+    条件 (比較演算子) とアドレスを追加する
+    """
+    def _select(self, node, goal):
+        """node を根とする式をラベル付けし, goal に還元する"""
+        return self._reduce(node, goal, label_tree(node))
+
+    def _reduce(self, node, nonterminal, labels, out=None):
+        cost, rule, kids = labels[id(node)][nonterminal]
+        return getattr(self, rule.emit)(node, rule, kids, labels, out)
+
+    def a_StatementList(self, node):
+        for statement in node.nodes:
+            if _operator(statement) is not None:
+                yield self._select(statement, 'stmt')
+            else:
+                yield statement
+
+    def a_BinaryOperator(self, node):
+        return self._select(node, 'reg')
+
+    a_Negative = a_Increment = a_Decrement = a_BinaryOperator
+    a_Constant = a_Identifier = a_FunctionExpression = a_BinaryOperator
+
+    def _branch_condition(self, expr, label, comment, jump_if):
+        labels = label_tree(expr)
+        if 'cc' in labels[id(expr)]:
+            # 比較の結果のフラグで条件分岐する
+            condition = []
+            yield self._reduce(expr, 'cc', labels, condition)
+            op = condition[0] if jump_if else self.op_negated[condition[0]]
+            self._write_code(self.op_jump[op], label, comment=comment)
+        else:
+            yield self._reduce(expr, 'reg', labels)
+            self._write_code(
+                'test', Registers.eax, Registers.eax, comment=comment)
+            self._write_code('jnz' if jump_if else 'jz', label)
+
+    # 連鎖規則と葉
+
+    def _emit_nothing(self, node, rule, kids, labels, out):
+        pass
+
+    def _emit_constant(self, node, rule, kids, labels, out):
+        NASMx86Generator.a_Constant(self, node)
+
+    def _emit_variable(self, node, rule, kids, labels, out):
+        NASMx86Generator.a_Identifier(self, node)
+
+    def _emit_discard(self, node, rule, kids, labels, out):
+        return self._reduce(node, 'reg', labels)
+
+    def _emit_set(self, node, rule, kids, labels, out):
+        condition = []
+        yield self._reduce(node, 'cc', labels, condition)
+        self._write_code(
+            self.op_compare[condition[0]], Registers.al, comment='set flag')
+        self._write_code('movzx', Registers.eax, Registers.al)
+
+    def _emit_lea(self, node, rule, kids, labels, out):
+        result = []
+        yield self._reduce(node, 'addr', labels, result)
+        address, temp = result[0]
+        self._write_code('lea', Registers.eax, address, comment='lea')
+        if temp is not None and not isinstance(temp, Registers):
+            # ベースをスタックに退避した場合
+            self._write_code('add', Registers.eax, temp, comment='lea base')
+        if temp is not None:
+            self._restore(temp)
+
+    def _emit_address(self, node, rule, kids, labels, out):
+        return self._reduce(node, 'index', labels, out)
+
+    # 単項演算子, 関数呼び出し, 論理演算子
+
+    def _emit_negative(self, node, rule, kids, labels, out):
+        yield self._reduce(kids[0][0], 'reg', labels)
+        self._write_code('neg', Registers.eax, comment='negative')
+
+    def _emit_increment(self, node, rule, kids, labels, out):
+        var = self._get_identifier_address(node.expr)
+        op = 'inc' if rule.pattern[0] == 'INC' else 'dec'
+        NASMx86Generator.a_Identifier(self, node.expr)
+        self._write_code(op, Registers.eax, comment=op + 'rement')
+        self._write_code(
+            'mov', var, Registers.eax, comment='assign ' + node.expr.name)
+
+    def _emit_increment_memory(self, node, rule, kids, labels, out):
+        # インテルの最適化リファレンス・マニュアル 3.5.1.1
+        op = 'add' if rule.pattern[0] == 'INC' else 'sub'
+        self._write_code(
+            op, self._get_identifier_address(node.expr), 1,
+            comment='assign ' + node.expr.name)
+
+    def _emit_call(self, node, rule, kids, labels, out):
+        return NASMx86Generator.a_FunctionExpression(self, node)
+
+    def _emit_logical(self, node, rule, kids, labels, out):
+        return self._a_BinaryOperator_logical(node)
+
+    def _emit_logical_statement(self, node, rule, kids, labels, out):
+        # 値を使わないので, 短絡評価の分岐だけを出力する
+        done_label = self._new_label('logical_done')
+        yield self._branch(
+            node, done_label, 'logical (statement)', node.op == 'LOR')
+        self._write_label(done_label)
+
+    # 算術演算子
+
+    def _emit_arithmetic(self, node, rule, kids, labels, out):
+        operand, register = kids if rule.swapped else reversed(kids)
+        yield self._reduce(register[0], 'reg', labels)
+        self._write_arithmetic(
+            node.op, self._get_operand(operand[0]), rule.swapped,
+            'calc (R)' if rule.swapped else 'calc (L)')
+
+    def _emit_arithmetic_pair(self, node, rule, kids, labels, out):
+        left, right = node.left, node.right
+        if left.registers > right.registers:
+            yield self._reduce(left, 'reg', labels)
+            temp = self._save(right)
+            yield self._reduce(right, 'reg', labels)
+            self._write_arithmetic(node.op, temp, True, 'calc (LSR)')
+        else:
+            yield self._reduce(right, 'reg', labels)
+            temp = self._save(left)
+            yield self._reduce(left, 'reg', labels)
+            self._write_arithmetic(node.op, temp, False, 'calc (RSL)')
+        self._restore(temp)
+
+    def _emit_multiply(self, node, rule, kids, labels, out):
+        immediate, memory = kids if rule.swapped else reversed(kids)
+        self._write_code(
+            'imul', Registers.eax, self._get_operand(memory[0]),
+            immediate[0].value, comment='calc (L)')
+
+    def _emit_divide_memory(self, node, rule, kids, labels, out):
+        yield self._reduce(node.left, 'reg', labels)
+        self._write_code('cdq')
+        self._write_code(
+            'idiv', self._get_operand(node.right), comment='calc (L)')
+
+    def _emit_divide_immediate(self, node, rule, kids, labels, out):
+        yield self._reduce(node.left, 'reg', labels)
+        # 除数は cdq で書き換えられる edx 以外に置く
+        if self.saved:
+            divisor = self._allocate()
+        else:
+            divisor = self.scratch[0]
+        self._write_code('mov', divisor, node.right.value, comment='divisor')
+        self._write_code('cdq')
+        self._write_code('idiv', divisor, comment='calc (L)')
+        if not isinstance(divisor, Registers):
+            self._release()
+
+    def _emit_divide_pair(self, node, rule, kids, labels, out):
+        yield self._reduce(node.right, 'reg', labels)
+        divisor = self._save(node.left, divisor=True)
+        yield self._reduce(node.left, 'reg', labels)
+        self._write_code('cdq')
+        self._write_code('idiv', divisor, comment='calc (RSL)')
+        self._restore(divisor)
+
+    # lea のアドレス
+
+    def _emit_scale(self, node, rule, kids, labels, out):
+        scale, register = kids if rule.swapped else reversed(kids)
+        yield self._reduce(register[0], 'reg', labels)
+        value = scale[0].value
+        if value in (3, 5, 9,):
+            address = Address(Registers.eax, Registers.eax, value - 1)
+        else:
+            address = Address(index=Registers.eax, scale=value)
+        out.append((address, None,))
+
+    def _emit_displacement(self, node, rule, kids, labels, out):
+        immediate, inner = kids if rule.swapped else reversed(kids)
+        result = []
+        yield self._reduce(inner[0], 'addr', labels, result)
+        address, temp = result[0]
+        if node.op == 'MINUS':
+            address.offset -= immediate[0].value
+        else:
+            address.offset += immediate[0].value
+        out.append((address, temp,))
+
+    def _emit_base(self, node, rule, kids, labels, out):
+        index, base = kids if rule.swapped else reversed(kids)
+        # インデックスを eax に求めるため, ベースを先に評価する
+        yield self._reduce(base[0], 'reg', labels)
+        temp = self._save(index[0])
+        result = []
+        yield self._reduce(index[0], 'index', labels, result)
+        address = result[0][0]
+        if isinstance(temp, Registers):
+            address.base = temp
+        out.append((address, temp,))
+
+    def _emit_base_pair(self, node, rule, kids, labels, out):
+        left, right = node.left, node.right
+        first, later = (left, right) if left.registers > right.registers \
+            else (right, left)
+        yield self._reduce(first, 'reg', labels)
+        temp = self._save(later)
+        yield self._reduce(later, 'reg', labels)
+        if isinstance(temp, Registers):
+            address = Address(temp, Registers.eax)
+        else:
+            address = Address(index=Registers.eax)
+        out.append((address, temp,))
+
+    # 比較演算子
+
+    def _condition(self, node, swapped):
+        return self.op_swapped[node.op] if swapped else node.op
+
+    def _emit_test(self, node, rule, kids, labels, out):
+        register = kids[1] if rule.swapped else kids[0]
+        yield self._reduce(register[0], 'reg', labels)
+        self._write_code(
+            'test', Registers.eax, Registers.eax, comment='compare (zero)')
+        out.append(self._condition(node, rule.swapped))
+
+    def _emit_compare(self, node, rule, kids, labels, out):
+        operand, first = kids if rule.swapped else reversed(kids)
+        if first[1] == 'reg':
+            yield self._reduce(first[0], 'reg', labels)
+            left = Registers.eax
+        else:
+            left = self._get_operand(first[0])
+        self._write_code(
+            'cmp', left, self._get_operand(operand[0]),
+            comment='compare (R)' if rule.swapped else 'compare (L)')
+        out.append(self._condition(node, rule.swapped))
+
+    def _emit_compare_pair(self, node, rule, kids, labels, out):
+        left, right = node.left, node.right
+        swapped = left.registers > right.registers
+        if swapped:
+            yield self._reduce(left, 'reg', labels)
+            temp = self._save(right)
+            yield self._reduce(right, 'reg', labels)
+            comment = 'compare (LSR)'
+        else:
+            yield self._reduce(right, 'reg', labels)
+            temp = self._save(left)
+            yield self._reduce(left, 'reg', labels)
+            comment = 'compare (RSL)'
+        self._write_code('cmp', Registers.eax, temp, comment=comment)
+        self._restore(temp)
+        out.append(self._condition(node, swapped))
+
+    # 代入
+
+    def _emit_assign(self, node, rule, kids, labels, out):
+        var = self._get_identifier_address(node.left)
+        yield self._reduce(node.right, 'reg', labels)
+        if node.op == 'ASSIGN_PLUS':
+            self._write_code('add', Registers.eax, var, comment='add')
+        elif node.op == 'ASSIGN_MINUS':
+            self._write_code('neg', Registers.eax, comment='minus')
+            self._write_code('add', Registers.eax, var, comment='minus')
+        self._write_code(
+            'mov', var, Registers.eax, comment='assign ' + node.left.name)
+
+    def _emit_assign_memory(self, node, rule, kids, labels, out):
+        op = {'ASSIGN': 'mov', 'ASSIGN_PLUS': 'add',
+              'ASSIGN_MINUS': 'sub'}[node.op]
+        self._write_code(
+            op, self._get_identifier_address(node.left), node.right.value,
+            comment='assign ' + node.left.name)
+
+    def _emit_assign_register(self, node, rule, kids, labels, out):
+        yield self._reduce(node.right, 'reg', labels)
+        op = 'add' if node.op == 'ASSIGN_PLUS' else 'sub'
+        self._write_code(
+            op, self._get_identifier_address(node.left), Registers.eax,
+            comment='assign ' + node.left.name)
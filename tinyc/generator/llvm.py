@@ -58,18 +58,40 @@ class LLVMGenerator(Analyzer):
         ast.accept(self)
         return self.module
 
+    def start_stream(self, optimize=True):
+        self.optimize = optimize
+        self.module = Module.new('module')
+
+    def analyze_stream(self, node):
+        u"""外部宣言を 1 つずつコード生成する
+
+        グローバル変数と関数はモジュール内で別々に管理されるため,
+        外部宣言の順に処理しても analyze と同じモジュールになる
+        """
+        if isinstance(node, token.Declaration):
+            self._add_declaration(node)
+        else:
+            node.accept(self)
+
+    def finish_stream(self):
+        return self.module
+
+    def _add_declaration(self, node):
+        u"""グローバル変数の宣言"""
+        for declarator in node.declarators.nodes:
+            declarator.identifier.gv = self.module.add_global_variable(
+                self.types['int'], declarator.identifier.name, 0)
+
     def a_ExternalDeclarationList(self, node):
         u"""先にグローバル変数をまとめて処理し, 次に関数定義を処理する"""
         # グローバル変数
         for external_declaration in node.nodes:
             if isinstance(external_declaration, token.Declaration):
-                for declarator in external_declaration.declarators.nodes:
-                    declarator.identifier.gv = self.module.add_global_variable(
-                        self.types['int'], declarator.identifier.name, 0)
+                self._add_declaration(external_declaration)
         # 関数定義 (コード)
         for external_declaration in node.nodes:
             if isinstance(external_declaration, token.FunctionDefinition):
-                external_declaration.accept(self)
+                yield external_declaration
 
     def a_FunctionDefinition(self, node):
         # モジュールに関数を追加
@@ -83,6 +105,7 @@ class LLVMGenerator(Analyzer):
         entry = function.append_basic_block(
             'entry_' + node.declarator.identifier.name)
         self.builder = Builder.new(entry)
+        self.entry = entry
 
         # 戻り値を格納するためのメモリを確保
         self.returns[function] = (self.builder.alloca(self.types['int']), [],)
@@ -93,8 +116,15 @@ class LLVMGenerator(Analyzer):
             arg.declarator.identifier.memory = self.builder.alloca(self.types['int'])
             self.builder.store(function.args[i], arg.declarator.identifier.memory)
 
+        if getattr(node, 'tail_calls', 0):
+            # 末尾呼び出し (TailJump) の戻り先
+            self.head = function.append_basic_block(
+                'head_' + node.declarator.identifier.name)
+            self.builder.branch(self.head)
+            self.builder.position_at_end(self.head)
+
         # 関数本体のコード生成
-        node.compound_statement.accept(self)
+        yield node.compound_statement
 
         return_block = function.append_basic_block(
             'return_' + node.declarator.identifier.name)
@@ -111,14 +141,25 @@ class LLVMGenerator(Analyzer):
                 self.builder.position_at_end(block)
                 self.builder.branch(return_block)
 
+    def _alloca(self):
+        u"""関数の入口のブロックの先頭にメモリを確保する
+
+        ループ (末尾呼び出しを置き換えたものを含む) の中で alloca を
+        実行するとスタックが伸び続けるため, 関数内の変数と一時的な
+        メモリはすべて入口で確保する
+        """
+        builder = Builder.new(self.entry)
+        builder.position_at_beginning(self.entry)
+        return builder.alloca(self.types['int'])
+
     def a_Declarator(self, node):
-        node.identifier.memory = self.builder.alloca(self.types['int'])
+        node.identifier.memory = self._alloca()
 
     def a_IfStatement(self, node):
         then_returned = else_returned = False
 
         # 条件判定のコード
-        node.expr.accept(self)
+        yield node.expr
         ir = self.builder.icmp(
             IPRED_NE, node.expr.ir, Constant.int(self.types['int'], 0))
 
@@ -133,7 +174,7 @@ class LLVMGenerator(Analyzer):
         # then のコード生成, then 内で return されたかをチェックする
         self.builder.position_at_end(then_block)
         nbranch = self.nbranch
-        node.then_statement.accept(self)
+        yield node.then_statement
         if nbranch != self.nbranch:
             then_returned = True
         self.nbranch = nbranch
@@ -142,7 +183,7 @@ class LLVMGenerator(Analyzer):
         # else のコード生成, else 内で return されたかをチェックする
         self.builder.position_at_end(else_block)
         if not node.else_statement.is_null():
-            node.else_statement.accept(self)
+            yield node.else_statement
             if nbranch != self.nbranch:
                 else_returned = True
             self.nbranch = nbranch
@@ -163,27 +204,57 @@ class LLVMGenerator(Analyzer):
     def a_ReturnStatement(self, node):
         self.nbranch += 1  # then. else 節内での分岐を検知
         function = self.builder.basic_block.function
-        node.expr.accept(self)
+        yield node.expr
         # return を配置したいブロックを覚えておく
         return_value = self.returns[function][0]
         self.returns[function][1].append(self.builder.basic_block)
         self.builder.store(node.expr.ir, return_value)
 
+    def a_TailJump(self, node):
+        function = self.builder.basic_block.function
+        self.builder.branch(self.head)
+        # 後に続く (到達しない) 文のコードは新しいブロックに置く.
+        # then, else 節や while の本体の最後のブロックとして分岐を追加してよい
+        self.builder.position_at_end(
+            function.append_basic_block(self._new_label()))
+
     def a_WhileLoop(self, node):
         function = self.builder.basic_block.function
 
+        if self.optimize:
+            # ループの反転: 入口で 1 回だけ条件を判定し, 本体の後ろの条件分岐で
+            # 先頭に戻る
+            yield node.expr
+            ir = self.builder.icmp(
+                IPRED_EQ, node.expr.ir, Constant.int(self.types['int'], 0))
+            guard_block = self.builder.basic_block
+
+            loop_block = function.append_basic_block(self._new_label())
+            self.builder.position_at_end(loop_block)
+            yield node.statement
+            yield node.expr
+            back_ir = self.builder.icmp(
+                IPRED_NE, node.expr.ir, Constant.int(self.types['int'], 0))
+
+            done_block = function.append_basic_block(self._new_label())
+            self.builder.cbranch(back_ir, loop_block, done_block)
+            self.builder.position_at_end(guard_block)
+            self.builder.cbranch(ir, done_block, loop_block)
+            self.builder.position_at_end(done_block)
+            return
+
         test_block = function.append_basic_block(self._new_label())
         loop_block = function.append_basic_block(self._new_label())
 
         self.builder.branch(test_block)
         self.builder.position_at_end(test_block)
-        node.expr.accept(self)
+        yield node.expr
 
         ir = self.builder.icmp(
             IPRED_EQ, node.expr.ir, Constant.int(self.types['int'], 0))
 
         self.builder.position_at_end(loop_block)
-        node.statement.accept(self)
+        yield node.statement
         self.builder.branch(test_block)
 
         done_block = function.append_basic_block(self._new_label())
@@ -203,39 +274,39 @@ class LLVMGenerator(Analyzer):
                     node.function.name)
                 self.undefined_functions[node.function.name] = node.function.ir
 
-        node.argument_list.accept(self)
+        yield node.argument_list
         node.ir = self.builder.call(
             node.function.ir, map(lambda a: a.ir, node.argument_list.nodes))
 
     def a_Negative(self, node):
-        node.expr.accept(self)
+        yield node.expr
         node.ir = self.builder.neg(node.expr.ir)
 
     def a_Increment(self, node):
-        node.expr.accept(self)
+        yield node.expr
         node.ir = self.builder.add(
             node.expr.ir, Constant.int(self.types['int'], 1))
         self.builder.store(node.ir, node.expr.memory)
 
     def a_Decrement(self, node):
-        node.expr.accept(self)
+        yield node.expr
         node.ir = self.builder.sub(
             node.expr.ir, Constant.int(self.types['int'], 1))
         self.builder.store(node.ir, node.expr.memory)
 
     def a_BinaryOperator(self, node):
         if node.op in self.op_assign:
-            self._a_BinaryOperator_assign(node)
+            return self._a_BinaryOperator_assign(node)
         elif node.op in self.op_arithmetic:
-            self._a_BinaryOperator_arithmetic(node)
+            return self._a_BinaryOperator_arithmetic(node)
         elif node.op in self.op_compare:
-            self._a_BinaryOperator_compare(node)
+            return self._a_BinaryOperator_compare(node)
         elif node.op in self.op_logical:
-            self._a_BinaryOperator_logical(node)
+            return self._a_BinaryOperator_logical(node)
 
     def _a_BinaryOperator_assign(self, node):
-        node.right.accept(self)
-        node.left.accept(self)
+        yield node.right
+        yield node.left
 
         if node.op == 'ASSIGN':
             node.ir = node.right.ir
@@ -253,8 +324,8 @@ class LLVMGenerator(Analyzer):
             self.builder.store(ir, node.left.gv)
 
     def _a_BinaryOperator_arithmetic(self, node):
-        node.right.accept(self)
-        node.left.accept(self)
+        yield node.right
+        yield node.left
         if node.op == 'PLUS':
             node.ir = self.builder.add(node.left.ir, node.right.ir)
         elif node.op == 'MINUS':
@@ -265,25 +336,25 @@ class LLVMGenerator(Analyzer):
             node.ir = self.builder.sdiv(node.left.ir, node.right.ir)
 
     def _a_BinaryOperator_compare(self, node):
-        node.right.accept(self)
-        node.left.accept(self)
+        yield node.right
+        yield node.left
         comparator = self.op_compare[node.op]
         result = self.builder.icmp(comparator, node.left.ir, node.right.ir)
         node.ir = self.builder.zext(result, self.types['int'])
 
     def _a_BinaryOperator_logical(self, node):
         function = self.builder.basic_block.function
-        result = self.builder.alloca(self.types['int'])
+        result = self._alloca()
         if node.op == 'LAND':
             self.builder.store(Constant.int(self.types['int'], 0), result)
-            node.left.accept(self)
+            yield node.left
             left_ir = self.builder.icmp(
                 IPRED_EQ, node.left.ir, Constant.int(self.types['int'], 0))
             left_block = self.builder.basic_block
 
             right_block = function.append_basic_block(self._new_label())
             self.builder.position_at_end(right_block)
-            node.right.accept(self)
+            yield node.right
             right_ir = self.builder.icmp(
                 IPRED_EQ, node.right.ir, Constant.int(self.types['int'], 0))
 
@@ -302,13 +373,13 @@ class LLVMGenerator(Analyzer):
 
         elif node.op == 'LOR':
             self.builder.store(Constant.int(self.types['int'], 1), result)
-            node.left.accept(self)
+            yield node.left
             left_ir = self.builder.icmp(IPRED_EQ, node.left.ir, Constant.int(self.types['int'], 0))
             left_block = self.builder.basic_block
 
             right_block = function.append_basic_block(self._new_label())
             self.builder.position_at_end(right_block)
-            node.right.accept(self)
+            yield node.right
             right_ir = self.builder.icmp(IPRED_EQ, node.right.ir, Constant.int(self.types['int'], 0))
 
             false_block = function.append_basic_block(self._new_label())
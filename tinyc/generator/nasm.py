@@ -4,7 +4,7 @@
 from __future__ import print_function, unicode_literals
 
 from tinyc import token
-from tinyc.analyzer import Analyzer
+from tinyc.analyzer import REGISTERS, Analyzer
 from tinyc.code import (
     Code, Comment, Common, Data, Extern, Global, Label, Memory, Registers,
     Section)
@@ -39,12 +39,35 @@ class NASMx86Generator(Analyzer):
             'LAND': '',
             'LOR': ''
         }
-        self.op_commutative = {
-            'PLUS': 'add',
-            'MULT': 'imul',
-            'EQ': 'sete',
-            'NEQ': 'setne'
+        # 左右のオペランドを入れ替えた比較
+        self.op_swapped = {
+            'EQ': 'EQ',
+            'NEQ': 'NEQ',
+            'LT': 'GT',
+            'LTE': 'GTE',
+            'GT': 'LT',
+            'GTE': 'LTE'
+        }
+        # 比較が成り立つときの条件分岐
+        self.op_jump = {
+            'EQ': 'je',
+            'NEQ': 'jne',
+            'LT': 'jl',
+            'LTE': 'jle',
+            'GT': 'jg',
+            'GTE': 'jge'
         }
+        # 否定した比較
+        self.op_negated = {
+            'EQ': 'NEQ',
+            'NEQ': 'EQ',
+            'LT': 'GTE',
+            'LTE': 'GT',
+            'GT': 'LTE',
+            'GTE': 'LT'
+        }
+        # 式の評価の途中の値を保持するスクラッチレジスタ
+        self.scratch = (Registers.ecx, Registers.edx,)
 
     def _write(self, code, comment=None):
         self.code.append(code)
@@ -86,31 +109,90 @@ class NASMx86Generator(Analyzer):
         self.last_alloc += 4
         return self.last_alloc
 
-    def analyze(self, ast, format='macho', optimize=True):
+    def _save(self, node, divisor=False):
+        """eax の値を, node を評価する間保持する場所に書き込んで返す
+
+        node の評価に必要なレジスタ数 (Sethi-Ullman 数) と保持中の値が
+        eax と空いているスクラッチレジスタに収まればレジスタに,
+        収まらなければスタック上の一時変数に退避する.
+        除数は cdq で書き換えられる edx には置かない
+        """
+        held = len(self.saved)
+        need = max(node.registers, 2) if divisor else node.registers
+        if (held < len(self.scratch) and held + 1 + need <= REGISTERS
+                and not (divisor and self.scratch[held] == Registers.edx)):
+            temp = self.scratch[held]
+            self.saved.append(temp)
+        else:
+            temp = self._allocate()
+        self._write_code('mov', temp, Registers.eax, comment='temp')
+        return temp
+
+    def _restore(self, temp):
+        """_save で保持した場所を解放する"""
+        if isinstance(temp, Registers):
+            self.saved.pop()
+        else:
+            self._release()
+
+    def start(self, format='macho', optimize=True):
         self.format = format
         self.optimize = optimize
         self.optimized = 0
         self.last_alloc = 0
         self.top_alloc = 0
+        # 値を保持しているスクラッチレジスタ
+        self.saved = []
+
+    def analyze(self, ast, format='macho', optimize=True):
+        self.start(format, optimize)
         ast.accept(self)
         return ast
 
+    def start_stream(self, format='macho', optimize=True):
+        self.start(format, optimize)
+        self.globals = []
+
+    def analyze_stream(self, node):
+        """外部宣言を 1 つずつコード生成する
+
+        start_stream の後に外部宣言の順に呼び出す. グローバル変数は
+        self.globals に, 関数定義は self.code に書き出し,
+        finish_stream で analyze と同じ順序に並べる
+        """
+        if isinstance(node, token.Declaration):
+            code = self.code
+            self.code = self.globals
+            self._write_declaration(node)
+            self.code = code
+        else:
+            node.accept(self)
+
+    def finish_stream(self):
+        self.code = self.globals + ['', Section('text')] + self.code
+        self.globals = None
+        return self.code
+
+    def _write_declaration(self, node):
+        """グローバル変数の宣言"""
+        for declarator in node.declarators.nodes:
+            label = self._new_global_label(declarator.identifier.name)
+            declarator.identifier.label = label
+            self._write(Global(label))
+            self._write(Common(label), 4)
+
     def a_ExternalDeclarationList(self, node):
         """先にグローバル変数をまとめて処理し, 次に関数定義を処理する"""
         # グローバル変数
         for external_declaration in node.nodes:
             if isinstance(external_declaration, token.Declaration):
-                for declarator in external_declaration.declarators.nodes:
-                    label = self._new_global_label(declarator.identifier.name)
-                    declarator.identifier.label = label
-                    self._write(Global(label))
-                    self._write(Common(label), 4)
+                self._write_declaration(external_declaration)
         # 関数定義 (コード)
         self._write('')
         self._write(Section('text'))
         for external_declaration in node.nodes:
             if isinstance(external_declaration, token.FunctionDefinition):
-                external_declaration.accept(self)
+                yield external_declaration
 
     def a_FunctionDefinition(self, node):
         label = self._new_global_label(node.declarator.identifier.name)
@@ -122,7 +204,12 @@ class NASMx86Generator(Analyzer):
         self._write_code('push', Registers.ebp)
         self._write_code('mov', Registers.ebp, Registers.esp)
         code = self._write_code('sub', Registers.esp, 0)
-        node.compound_statement.accept(self)
+        if getattr(node, 'tail_calls', 0):
+            # 末尾呼び出し (TailJump) の戻り先
+            self.head_label = self._new_label(
+                "head_{0}".format(node.declarator.identifier.name))
+            self._write_label(self.head_label)
+        yield node.compound_statement
         # Nlocal の値を計算後にセット
         l = list(code.args)
         l[1] = -self.top_alloc
@@ -137,21 +224,21 @@ class NASMx86Generator(Analyzer):
         for declaration in node.nodes:
             for declarator in declaration.declarators:
                 declarator.identifier.offset = self._allocate().offset
-                declarator.accept(self)
+                yield declarator
 
     def a_CompoundStatement(self, node):
         alloc = self.last_alloc
-        node.declaration_list.accept(self)
-        node.statement_list.accept(self)
+        yield node.declaration_list
+        yield node.statement_list
         self.last_alloc = alloc
 
     def a_Negative(self, node):
-        node.expr.accept(self)
+        yield node.expr
         self._write_code('neg', Registers.eax, comment='negative')
 
     def a_Increment(self, node):
         var = self._get_identifier_address(node.expr)
-        node.expr.accept(self)
+        yield node.expr
 
         self._write_code('inc', Registers.eax, comment='increment')
         self._write_code(
@@ -159,7 +246,7 @@ class NASMx86Generator(Analyzer):
 
     def a_Decrement(self, node):
         var = self._get_identifier_address(node.expr)
-        node.expr.accept(self)
+        yield node.expr
 
         self._write_code('dec', Registers.eax, comment='decrement')
         self._write_code(
@@ -167,17 +254,17 @@ class NASMx86Generator(Analyzer):
 
     def a_BinaryOperator(self, node):
         if node.op in self.op_assign:
-            self._a_BinaryOperator_assign(node)
+            return self._a_BinaryOperator_assign(node)
         elif node.op in self.op_arithmetic:
-            self._a_BinaryOperator_arithmetic(node)
+            return self._a_BinaryOperator_arithmetic(node)
         elif node.op in self.op_compare:
-            self._a_BinaryOperator_compare(node)
+            return self._a_BinaryOperator_compare(node)
         elif node.op in self.op_logical:
-            self._a_BinaryOperator_logical(node)
+            return self._a_BinaryOperator_logical(node)
 
     def _a_BinaryOperator_assign(self, node):
         var = self._get_identifier_address(node.left)
-        node.right.accept(self)
+        yield node.right
 
         if node.op == 'ASSIGN_PLUS':
             self._write_code('add', Registers.eax, var, comment='add')
@@ -189,206 +276,261 @@ class NASMx86Generator(Analyzer):
             'mov', var, Registers.eax, comment='assign ' + node.left.name)
 
     def _a_BinaryOperator_arithmetic(self, node):
-        if node.right.registers == 0:
-            self._a_BinaryOperator_arithmetic_l(node)
-        elif node.left.registers == 0 and node.right.registers == 1:
-            if node.op in self.op_commutative:
-                self._a_BinaryOperator_arithmetic_r(node)
-            else:
-                self._a_BinaryOperator_arithmetic_rsl(node)
+        if node.op == 'DIV':
+            return self._a_BinaryOperator_divide(node)
+        elif node.right.registers == 0:
+            return self._a_BinaryOperator_arithmetic_l(node)
+        elif node.left.registers == 0:
+            return self._a_BinaryOperator_arithmetic_r(node)
+        elif node.left.registers > node.right.registers:
+            return self._a_BinaryOperator_arithmetic_lsr(node)
+        else:
+            return self._a_BinaryOperator_arithmetic_rsl(node)
+
+    def _write_arithmetic(self, op, operand, swapped, comment):
+        """eax と operand の演算 (swapped の場合は operand が左オペランド)"""
+        if swapped and op == 'MINUS':
+            self._write_code('neg', Registers.eax, comment='minus')
+            self._write_code('add', Registers.eax, operand, comment=comment)
         else:
-            self._a_BinaryOperator_arithmetic_rsl(node)
+            self._write_code(
+                self.op_arithmetic[op], Registers.eax, operand,
+                comment=comment)
 
     def _a_BinaryOperator_arithmetic_l(self, node):
         """Left 型"""
         # Left
-        node.left.accept(self)
-        # Right
-        if isinstance(node.right, token.Constant):
-            right = node.right.value
-        elif isinstance(node.right, token.Identifier):
-            right = self._get_identifier_address(node.right)
-        else:
-            raise Exception()
+        yield node.left
         # Calc
-        if node.op == 'DIV':
-            self._write_code('cdq')
-            if isinstance(node.right, token.Identifier):
-                self._write_code('idiv', right, comment='calc (L)')
-            else:
-                temp = self._allocate()
-                self._write_code('mov', temp, right, comment='right temp')
-                self._write_code('idiv', temp, comment='calc (L)')
-                self._release()
-        else:
-            self._write_code(
-                self.op_arithmetic[node.op], Registers.eax, right,
-                comment='calc (L)')
+        self._write_arithmetic(
+            node.op, self._get_operand(node.right), False, 'calc (L)')
 
     def _a_BinaryOperator_arithmetic_r(self, node):
         """Right 型"""
         # Right
-        node.right.accept(self)
-        # Left
-        if isinstance(node.left, token.Constant):
-            left = node.left.value
-        elif isinstance(node.left, token.Identifier):
-            left = self._get_identifier_address(node.left)
-        else:
-            raise Exception()
+        yield node.right
         # Calc
-        if node.op == 'DIV':
-            self._write_code('cdq')
-            self._write_code('idiv', left, comment='calc (R)')
-        else:
-            self._write_code(
-                self.op_arithmetic[node.op], Registers.eax, left,
-                comment='calc (R)')
+        self._write_arithmetic(
+            node.op, self._get_operand(node.left), True, 'calc (R)')
 
     def _a_BinaryOperator_arithmetic_rsl(self, node):
         """Right-Save-Left 型"""
         # Right
-        node.right.accept(self)
-        temp = self._allocate()
-        self._write_code('mov', temp, Registers.eax, comment='right temp')
+        yield node.right
+        temp = self._save(node.left)
         # Left
-        node.left.accept(self)
+        yield node.left
         # Calc
-        if node.op == 'DIV':
+        self._write_arithmetic(node.op, temp, False, 'calc (RSL)')
+        self._restore(temp)
+
+    def _a_BinaryOperator_arithmetic_lsr(self, node):
+        """Left-Save-Right 型 (左の方が多くのレジスタを必要とする場合)"""
+        # Left
+        yield node.left
+        temp = self._save(node.right)
+        # Right
+        yield node.right
+        # Calc
+        self._write_arithmetic(node.op, temp, True, 'calc (LSR)')
+        self._restore(temp)
+
+    def _a_BinaryOperator_divide(self, node):
+        """除算 (除数は cdq で書き換えられる edx 以外に置く)"""
+        if isinstance(node.right, token.Identifier):
+            # Left
+            yield node.left
+            # Calc
             self._write_code('cdq')
-            self._write_code('idiv', temp, comment='calc (RSL)')
-        else:
             self._write_code(
-                self.op_arithmetic[node.op], Registers.eax, temp,
-                comment='calc (RSL)')
-        self._release()
-
-    def _a_BinaryOperator_compare(self, node):
-        if node.right.registers == 0:
-            self._a_BinaryOperator_compare_l(node)
-        elif node.left.registers == 0 and node.right.registers == 1:
-            if node.op in self.op_commutative:
-                self._a_BinaryOperator_compare_r(node)
+                'idiv', self._get_identifier_address(node.right),
+                comment='calc (L)')
+        elif isinstance(node.right, token.Constant):
+            # Left
+            yield node.left
+            # Right
+            if self.saved:
+                divisor = self._allocate()
             else:
-                self._a_BinaryOperator_compare_rsl(node)
+                divisor = self.scratch[0]
+            self._write_code(
+                'mov', divisor, node.right.value, comment='right temp')
+            # Calc
+            self._write_code('cdq')
+            self._write_code('idiv', divisor, comment='calc (L)')
+            if not isinstance(divisor, Registers):
+                self._release()
         else:
-            self._a_BinaryOperator_compare_rsl(node)
+            # Right
+            yield node.right
+            divisor = self._save(node.left, divisor=True)
+            # Left
+            yield node.left
+            # Calc
+            self._write_code('cdq')
+            self._write_code('idiv', divisor, comment='calc (RSL)')
+            self._restore(divisor)
 
+    def _a_BinaryOperator_compare(self, node):
+        condition = []
+        yield self._compare(node, condition)
         self._write_code(
-            self.op_compare[node.op], Registers.al, comment='set flag')
+            self.op_compare[condition[0]], Registers.al, comment='set flag')
         self._write_code('movzx', Registers.eax, Registers.al)
 
+    def _compare(self, node, condition):
+        """比較演算子の両辺を比較してフラグを設定し, 条件を condition に追加する"""
+        if node.right.registers == 0:
+            yield self._a_BinaryOperator_compare_l(node)
+            swapped = False
+        elif node.left.registers == 0:
+            yield self._a_BinaryOperator_compare_r(node)
+            swapped = True
+        elif node.left.registers > node.right.registers:
+            yield self._a_BinaryOperator_compare_lsr(node)
+            swapped = True
+        else:
+            yield self._a_BinaryOperator_compare_rsl(node)
+            swapped = False
+
+        # 右オペランドと比較した場合は条件を入れ替える
+        condition.append(self.op_swapped[node.op] if swapped else node.op)
+
     def _a_BinaryOperator_compare_l(self, node):
-        """Left 型"""
+        """Left 型"""
         # Left
-        node.left.accept(self)
-        # Right
-        if isinstance(node.right, token.Constant):
-            right = node.right.value
-        elif isinstance(node.right, token.Identifier):
-            right = self._get_identifier_address(node.right)
-        else:
-            raise Exception()
+        yield node.left
         # Compare
-        self._write_code('cmp', Registers.eax, right, comment='compare (L)')
+        self._write_code(
+            'cmp', Registers.eax, self._get_operand(node.right),
+            comment='compare (L)')
 
     def _a_BinaryOperator_compare_r(self, node):
-        """Right 型"""
+        """Right 型"""
         # Right
-        node.right.accept(self)
-        # Left
-        if isinstance(node.left, token.Constant):
-            left = node.left.value
-        elif isinstance(node.left, token.Identifier):
-            left = self._get_identifier_address(node.left)
-        else:
-            raise Exception()
+        yield node.right
         # Compare
-        self._write_code('cmp', Registers.eax, left, comment='compare (R)')
+        self._write_code(
+            'cmp', Registers.eax, self._get_operand(node.left),
+            comment='compare (R)')
 
     def _a_BinaryOperator_compare_rsl(self, node):
-        """Right-Save-Left 型"""
+        """Right-Save-Left 型"""
         # Right
-        node.right.accept(self)
-        temp = self._allocate()
-        self._write_code('mov', temp, Registers.eax, comment='right temp')
+        yield node.right
+        temp = self._save(node.left)
         # Left
-        node.left.accept(self)
+        yield node.left
         # Compare
         self._write_code('cmp', Registers.eax, temp, comment='compare (RSL)')
-        self._release()
-
-    def _a_BinaryOperator_logical(self, node):
-        if node.op == 'LAND':
-            temp = self._allocate()
-            label = self._new_label('and')
-            self._write_code('mov', temp, 0, comment='false')
+        self._restore(temp)
 
-            node.left.accept(self)
-            self._write_code(
-                'cmp', Registers.eax, 0, comment='and left (false?)')
-            self._write_code('je', label)
-
-            node.right.accept(self)
-            self._write_code(
-                'cmp', Registers.eax, 0, comment='and right (false?)')
-            self._write_code('je', label)
-
-            self._write_code('mov', temp, 1, comment='true')
-            self._write_label(label)
-            self._write_code('mov', Registers.eax, temp, comment='logical and')
-        elif node.op == 'LOR':
-            temp = self._allocate()
-            label = self._new_label('or')
-            self._write_code('mov', temp, 1, comment='true')
+    def _a_BinaryOperator_compare_lsr(self, node):
+        """Left-Save-Right 型"""
+        # Left
+        yield node.left
+        temp = self._save(node.right)
+        # Right
+        yield node.right
+        # Compare
+        self._write_code('cmp', Registers.eax, temp, comment='compare (LSR)')
+        self._restore(temp)
 
-            node.left.accept(self)
-            self._write_code(
-                'cmp', Registers.eax, 1, comment='or left (true?)')
-            self._write_code('je', label)
+    def _a_BinaryOperator_logical(self, node):
+        """論理演算子の値 (0 または 1) を eax に求める"""
+        false_label = self._new_label('false')
+        done_label = self._new_label('logical_done')
+        yield self._branch(node, false_label, 'logical (false?)')
+        self._write_code('mov', Registers.eax, 1, comment='true')
+        self._write_code('jmp', done_label)
+        self._write_label(false_label)
+        self._write_code('mov', Registers.eax, 0, comment='false')
+        self._write_label(done_label)
 
-            node.right.accept(self)
+    def _branch(self, expr, label, comment, jump_if=False):
+        """条件式 expr の真偽が jump_if のとき label へ分岐する
+
+        論理演算子は両辺の値を eax に求めずに, 短絡評価の分岐先を
+        両辺の条件分岐にそのまま渡す
+        """
+        if (isinstance(expr, token.BinaryOperator)
+                and expr.op in self.op_logical):
+            if (expr.op == 'LOR') == jump_if:
+                # a || b が真, a && b が偽になる場合は, どちらの辺でも label へ
+                yield self._branch(expr.left, label, comment, jump_if)
+                yield self._branch(expr.right, label, comment, jump_if)
+            else:
+                # 左辺で結果が決まる場合は右辺を飛ばす
+                skip_label = self._new_label(
+                    'and' if expr.op == 'LAND' else 'or')
+                yield self._branch(expr.left, skip_label, comment, not jump_if)
+                yield self._branch(expr.right, label, comment, jump_if)
+                self._write_label(skip_label)
+        elif self.optimize and isinstance(expr, token.Constant):
+            self.optimized += 1
+            if (expr.value != 0) == jump_if:
+                self._write_code('jmp', label, comment=comment)
+        else:
+            yield self._branch_condition(expr, label, comment, jump_if)
+
+    def _branch_condition(self, expr, label, comment, jump_if):
+        """論理演算子以外の条件式の条件分岐
+
+        比較演算子は真偽値を eax に求めずに, 比較の直後に条件分岐する
+        """
+        if (isinstance(expr, token.BinaryOperator)
+                and expr.op in self.op_compare):
+            condition = []
+            yield self._compare(expr, condition)
+            op = condition[0] if jump_if else self.op_negated[condition[0]]
+            self._write_code(self.op_jump[op], label, comment=comment)
+        else:
+            yield expr
             self._write_code(
-                'cmp', Registers.eax, 1, comment='or right (true?)')
-            self._write_code('je', label)
-
-            self._write_code('mov', temp, 0, comment='false')
-            self._write_label(label)
-            self._write_code('mov', Registers.eax, temp, comment='logical or')
+                'test', Registers.eax, Registers.eax, comment=comment)
+            self._write_code('jnz' if jump_if else 'jz', label)
 
     def a_IfStatement(self, node):
         else_label = self._new_label('if_else')
         done_label = self._new_label('if_done')
-        node.expr.accept(self)
         if self.optimize and isinstance(node.expr, token.Constant):
+            yield node.expr
             self.optimized += 1
             if node.expr == token.Constant(0):
-                node.then_statement.accept(self)
+                yield node.else_statement
             else:
-                node.else_statement.accept(self)
+                yield node.then_statement
         else:
-            self._write_code(
-                'test', Registers.eax, Registers.eax, comment='compare (if)')
             if node.else_statement.is_null():
-                self._write_code('jz', done_label)
-                node.then_statement.accept(self)
+                yield self._branch(node.expr, done_label, 'compare (if)')
+                yield node.then_statement
             else:
-                self._write_code('jz', else_label)
-                node.then_statement.accept(self)
+                yield self._branch(node.expr, else_label, 'compare (if)')
+                yield node.then_statement
                 self._write_code('jmp', done_label)
                 self._write_label(else_label)
-                node.else_statement.accept(self)
+                yield node.else_statement
             self._write_label(done_label)
 
     def a_WhileLoop(self, node):
+        if self.optimize:
+            # ループの反転: 入口で 1 回だけ条件を判定し, 本体の後ろの条件分岐で
+            # 先頭に戻る (1 回の繰り返しで実行するジャンプは 1 つになる)
+            body_label = self._new_label('while_body')
+            done_label = self._new_label('while_done')
+            yield self._branch(node.expr, done_label, 'compare (while guard)')
+            self._write_label(body_label)
+            yield node.statement
+            yield self._branch(
+                node.expr, body_label, 'compare (while)', jump_if=True)
+            self._write_label(done_label)
+            return
+
         test_label = self._new_label('while_test')
         done_label = self._new_label('while_done')
         self._write_label(test_label)
-        node.expr.accept(self)
-        self._write_code(
-            'test', Registers.eax, Registers.eax, comment='compare (while)')
-        self._write_code('jz', done_label)
-        node.statement.accept(self)
+        yield self._branch(node.expr, done_label, 'compare (while)')
+        yield node.statement
         self._write_code('jmp', test_label)
         self._write_label(done_label)
 
@@ -396,7 +538,7 @@ class NASMx86Generator(Analyzer):
         label = self._new_global_label(node.function.name)
         if node.function.kind == Kinds.undefined_function:
             self._write(Extern(label))
-        node.argument_list.accept(self)
+        yield node.argument_list
         self._write_code('call', label)
         self._write_code(
             'add', Registers.esp, 4 * len(node.argument_list.nodes),
@@ -411,17 +553,29 @@ class NASMx86Generator(Analyzer):
                     and hasattr(argument, 'offset')):
                 arg = Memory(Registers.ebp, argument.offset)
             else:
-                argument.accept(self)
+                yield argument
                 arg = Registers.eax
             self._write_code('push', arg, comment='argument {0}'.format(l - i))
 
     def a_ReturnStatement(self, node):
-        node.expr.accept(self)
+        yield node.expr
         self._write_code('jmp', self.return_label)
 
+    def a_TailJump(self, node):
+        self._write_code('jmp', self.head_label, comment='tail call')
+
     def a_Constant(self, node):
         self._write_code('mov', Registers.eax, node.value, comment='constant')
 
+    def _get_operand(self, node):
+        """オペランドに直接書ける定数または変数のオペランドを返す"""
+        if isinstance(node, token.Constant):
+            return node.value
+        elif isinstance(node, token.Identifier):
+            return self._get_identifier_address(node)
+        else:
+            raise Exception()
+
     def _get_identifier_address(self, identifier):
         offset = getattr(identifier, 'offset', None)
         if offset is None:
@@ -2,16 +2,25 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import print_function, unicode_literals
+import imp
 import logging
+import operator
+import os
+import re
 
 from ply import lex
 
-from tinyc import common
+from tinyc import cache, common
 
 
 class Lexer(object):
-    """字句解析器"""
+    """字句解析器
+
+    engine に 'ply' を指定すると PLY の字句解析器を,
+    'regex' を指定すると Scanner を用いる
+    """
     tokens = common.TOKENS
+    engines = ('ply', 'regex',)
 
     t_PLUS      = r'\+'
     t_MINUS     = r'-'
@@ -69,7 +78,176 @@ class Lexer(object):
                 value=t.value[0]))
         t.lexer.skip(1)
 
-    def build(self, **kwargs):
+    def _build_cached(self, cache_dir, **kwargs):
+        """キャッシュした字句解析表 (lextab) を用いて字句解析器を作成する"""
+        name = 'lextab_' + cache.signature(self, 't_', self.tokens)
+        path = os.path.join(cache_dir, name + '.py')
+
+        if os.path.exists(path):
+            try:
+                # 規則はハッシュで一致を確認済みなので検証を省略する
+                lextab = imp.load_source('tinyc_' + name, path)
+                return lex.lex(module=self, optimize=1, lextab=lextab)
+            except Exception:
+                self.logger.debug('Failed to load lexer table: ' + path)
+
+        lexer = lex.lex(module=self, **kwargs)
+        try:
+            temp = cache.temporary_path(cache_dir, '.py')
+            lexer.writetab(os.path.basename(temp)[:-3], cache_dir)
+            os.rename(temp, path)
+        except (IOError, OSError):
+            self.logger.debug('Failed to write lexer table: ' + path)
+        return lexer
+
+    def build(self, cache_dir=None, engine='ply', **kwargs):
         self.errors = 0
         self.logger = logging.getLogger()
-        self.lexer = lex.lex(module=self, **kwargs)
+
+        if engine not in self.engines:
+            raise ValueError('Unknown lexer engine: {0}'.format(engine))
+        if engine == 'regex':
+            self.lexer = Scanner(self)
+            return
+
+        cache_dir = cache.get_cache_dir(cache_dir)
+        if cache_dir is None or kwargs.get('debug'):
+            self.lexer = lex.lex(module=self, **kwargs)
+        else:
+            self.lexer = self._build_cached(cache_dir, **kwargs)
+
+
+class ScannerToken(tuple):
+    """Scanner が返すトークン (PLY の LexToken と同じ属性を持つ)
+
+    生成の負荷を小さくするため (type, value, lexpos, lexer) のタプルとし,
+    行番号は参照されたときに lexpos から計算する
+    """
+    __slots__ = ()
+
+    type = property(operator.itemgetter(0))
+    value = property(operator.itemgetter(1))
+    lexpos = property(operator.itemgetter(2))
+    lexer = property(operator.itemgetter(3))
+
+    @property
+    def lineno(self):
+        return self[3].lineno_at(self[2])
+
+    def __repr__(self):
+        return 'LexToken({0},{1!r},{2},{3})'.format(
+            self.type, self.value, self.lineno, self.lexpos)
+
+
+class Scanner(object):
+    """1 つの正規表現 (名前付きグループの選択) で字句解析を行う字句解析器
+
+    Lexer の t_ 規則から PLY と同じ優先順位 (関数の規則を定義順に,
+    続けて文字列の規則を正規表現の長い順に) で正規表現を組み立てる.
+    読み飛ばす規則 (空白, 改行, コメント) は各トークンの前置部分として
+    同じ照合で読み飛ばし, トークンごとの関数呼び出しと改行の数え上げを行わない.
+    照合は常に現在の位置で成功する (不正な文字は error, 入力の終わりは
+    空の一致) ため, 前置部分の読み飛ばしをやり直す (バックトラックする)
+    ことはない
+    """
+    # 読み飛ばす規則と, 前置部分で用いる正規表現 (None は規則と同じ).
+    # 前置部分は (...)* で繰り返すため, 1 文字ずつの選択肢にして
+    # 同じ空白の並びに複数の一致の仕方がないようにする
+    skip_rules = {'t_newline': r'\n', 't_comment': None}
+
+    _pattern = None
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.input('')
+
+    @classmethod
+    def _compile(cls, owner):
+        """Lexer の t_ 規則から正規表現を作成する (クラスごとに 1 回だけ)"""
+        if cls._pattern is None:
+            functions = []
+            strings = []
+            for name in dir(owner):
+                if not name.startswith('t_') or name in ('t_error', 't_ignore',):
+                    continue
+                rule = getattr(owner, name)
+                if callable(rule):
+                    line = rule.__func__.__code__.co_firstlineno
+                    functions.append((line, name, rule.__doc__))
+                else:
+                    strings.append((-len(rule), name, rule))
+
+            skip = ['[{0}]'.format(re.escape(owner.t_ignore))]
+            patterns = []
+            for _, name, regex in sorted(functions) + sorted(strings):
+                if name in cls.skip_rules:
+                    skip.append(cls.skip_rules[name] or regex)
+                else:
+                    patterns.append('(?P<{0}>{1})'.format(name[2:], regex))
+            # どの規則にも一致しない 1 文字と, 入力の終わり (グループなし)
+            patterns += [r'(?P<error>[\w\W])', r'\Z']
+
+            # PLY と同じく, トークンの種類 (グループ名) を str にする
+            cls._pattern = re.compile(str('(?:{0})*(?:{1})'.format(
+                '|'.join(skip), '|'.join(patterns))))
+        return cls._pattern
+
+    def input(self, data):
+        """data には文字列のほか, mmap.mmap などのバッファを指定できる"""
+        self.data = data
+        self.lexpos = 0
+        # lineno_at で行番号を計算済みの位置
+        self._line_pos = 0
+        self._line = 1
+        self._tokens = self._scan(data)
+
+    def token(self):
+        return next(self._tokens, None)
+
+    def lineno_at(self, pos):
+        """pos の位置の行番号を返す
+
+        行番号は前回計算した位置からの差分だけ数えるため,
+        先頭から順に参照する場合は全体で O(n) となる
+        """
+        if pos >= self._line_pos:
+            self._line += self._count_newlines(self._line_pos, pos)
+        else:
+            self._line -= self._count_newlines(pos, self._line_pos)
+        self._line_pos = pos
+        return self._line
+
+    def _count_newlines(self, start, end):
+        # str に unicode を渡すと全体が unicode に変換されるため, バイト列で数える
+        data = self.data
+        if isinstance(data, basestring):
+            return data.count(b'\n', start, end)
+        # mmap は count を持たないため, 区間を切り出して数える
+        return data[start:end].count(b'\n')
+
+    def _illegal(self, pos):
+        """どの規則にも一致しなかった文字をエラーにする"""
+        self.owner.errors += 1
+        self.owner.logger.error(
+            "Line {line}: Illegal character '{value}'.".format(
+                line=self.lineno_at(pos), value=self.data[pos]))
+
+    def _scan(self, data):
+        new = tuple.__new__
+        keywords = common.KEYWORDS
+        for match in self._compile(self.owner).finditer(data):
+            tp = match.lastgroup
+            if tp is None:
+                break
+            start = match.start(tp)
+            if tp == 'error':
+                self._illegal(start)
+                continue
+            value = match.group(tp)
+            if tp == 'ID':
+                tp = keywords.get(value, 'ID')
+            elif tp == 'CONSTANT':
+                value = int(value)
+            self.lexpos = match.end()
+            yield new(ScannerToken, (tp, value, start, self))
+        self.lexpos = len(data)
@@ -4,6 +4,7 @@
 """最適化用のクラスをまとめたモジュール"""
 
 from __future__ import print_function, unicode_literals
+import collections
 import logging
 
 try:
@@ -11,18 +12,52 @@ try:
 except:
     pass
 
+from tinyc import cfg, dataflow, regalloc
 from tinyc.code import (
-    Code, Comment, Data, Extern, Global, Label, Memory, Register, Registers)
+    Address, Align, Code, Comment, Data, Extern, Global, Label, Memory,
+    Registers)
+from tinyc.peephole import Rule, RuleSet
 
 
 class Optimizer(object):
+    """最適化器
+
+    optimize は CodeList (tinyc.code) の行をその場で削除/挿入/置換して返す.
+    optimize_at は 1 つのセルとその近傍だけを最適化し, 変更した場合は
+    True を返す (PeepholeOptimizer を参照).
+    rules は覗き穴最適化の規則 (tinyc.peephole) で, hits に規則ごとの
+    適用回数を数える
+    """
+    rules = RuleSet([])
+
     def __init__(self):
         self.logger = logging.getLogger()
         self.optimized = 0
+        self.hits = collections.OrderedDict(
+            (rule.name, 0) for rule in self.rules.rules)
 
     def optimize(self, code):
         return code
 
+    def optimize_at(self, code, cell):
+        return False
+
+    def _apply_rules(self, code, cell):
+        """cell から始まる命令列に規則を適用する (適用した場合は True を返す)"""
+        rule = self.rules.apply(code, cell)
+        if rule is None:
+            return False
+        self.optimized += 1
+        self.hits[rule.name] += 1
+        self.logger.info(rule.message)
+        return True
+
+    def _optimize_rules(self, code):
+        """規則による最適化"""
+        for cell in code.cells():
+            self._apply_rules(code, cell)
+        return code
+
 
 class LabelOptimizer(Optimizer):
     """不要なラベルを削除することによる最適化"""
@@ -51,15 +86,15 @@ class LabelOptimizer(Optimizer):
                 label = None
 
         # 重複するラベルの削除と置換
-        new_code = []
-        for line in code:
+        for cell in code.cells():
+            line = cell.line
             if isinstance(line, Label):
                 if line in self.replace_table:
                     # 重複するラベル宣言はコードから外す
                     self.logger.info(
                         'Remove: label dupulication: ' + line.label)
                     self.optimized += 1
-                    continue
+                    code.remove(cell)
             elif isinstance(line, Code):
                 new_args = []
                 for arg in line.args:
@@ -70,8 +105,7 @@ class LabelOptimizer(Optimizer):
                     else:
                         new_args.append(arg)
                 line.args = new_args
-            new_code.append(line)
-        return new_code
+        return code
 
     def _optimize_unused(self, code):
         """利用されていないラベルの削除"""
@@ -79,12 +113,13 @@ class LabelOptimizer(Optimizer):
         used = {}
 
         # 利用されていないラベルを見つける
-        for i, line in enumerate(code):
+        for cell in code.cells():
+            line = cell.line
             if isinstance(line, Label):
                 if line not in used and not line.glob:
                     # 現時点で引数に利用されていないラベルであれば未使用に追加
                     # ただしグローバルで利用するものは削除しない
-                    unused[line] = i
+                    unused[line] = cell
             elif isinstance(line, Code):
                 # 引数でラベルが利用されている場合は使用中のラベルに追加
                 labels = filter(lambda a: isinstance(a, Label), line.args)
@@ -100,25 +135,98 @@ class LabelOptimizer(Optimizer):
 
         map(lambda l: self.logger.info('Remove: unused label: ' + l.label), unused)
 
-        return [i for j, i in enumerate(code) if j not in unused.values()]
+        for cell in unused.values():
+            code.remove(cell)
+        return code
 
     def optimize(self, code):
         code = self._optimize_duplication(code)
         code = self._optimize_unused(code)
         return code
 
+    def index(self, code):
+        """ラベルの定義と, ラベルを引数に持つ行の索引を作成する (optimize_at で用いる)"""
+        self.definitions = {}
+        self.references = {}
+        for cell in code.cells():
+            line = cell.line
+            if isinstance(line, Label):
+                if not line.glob:
+                    self.definitions[line.label] = cell
+            elif isinstance(line, Code):
+                for arg in line.args:
+                    if isinstance(arg, Label):
+                        self.references.setdefault(arg.label, set()).add(cell)
+
+    def unreference(self, cell):
+        """削除された行の参照を索引から取り除く
+
+        利用されなくなったラベルの定義のセルのリストを返す
+        """
+        unused = []
+        if isinstance(cell.line, Code):
+            for arg in cell.line.args:
+                if not isinstance(arg, Label):
+                    continue
+                references = self.references.get(arg.label)
+                if references:
+                    references.discard(cell)
+                    if not references and arg.label in self.definitions:
+                        unused.append(self.definitions[arg.label])
+        return unused
+
+    def optimize_at(self, code, cell):
+        line = cell.line
+        if not isinstance(line, Label) or line.glob:
+            return False
+
+        # 直前のラベル (コメントを挟んでもよい) と重複するラベルの削除と置換
+        label = None
+        for before in code.cells_before(cell):
+            if isinstance(before.line, Label):
+                label = before.line
+            elif not isinstance(before.line, Comment):
+                break
+        if label is not None:
+            self.logger.info('Remove: label dupulication: ' + line.label)
+            self.optimized += 1
+            references = self.references.setdefault(label.label, set())
+            for reference in self.references.pop(line.label, ()):
+                new_args = []
+                for arg in reference.line.args:
+                    if isinstance(arg, Label) and arg == line:
+                        self.optimized += 1
+                        new_args.append(label)
+                    else:
+                        new_args.append(arg)
+                reference.line.args = new_args
+                references.add(reference)
+                code.touch(reference)
+            self.definitions.pop(line.label, None)
+            code.remove(cell)
+            return True
+
+        # 利用されていないラベルの削除
+        if not self.references.get(line.label):
+            self.logger.info('Remove: unused label: ' + line.label)
+            self.optimized += 1
+            self.definitions.pop(line.label, None)
+            code.remove(cell)
+            return True
+        return False
+
 
 class GlobalExternOptimizer(Optimizer):
     """EXTERN の重複を取り除き, GLOBAL とともに先頭にまとめる"""
     def optimize(self, code):
         _globals = []
         externs = {}
-        others = []
-        new_code = []
 
-        for line in code:
+        for cell in code.cells():
+            line = cell.line
             if isinstance(line, Global):
                 _globals.append(line)
+                code.remove(cell)
             elif isinstance(line, Extern):
                 # EXTERN が重複しないように追加していく
                 if str(line) in externs:
@@ -127,132 +235,108 @@ class GlobalExternOptimizer(Optimizer):
                     self.optimized += 1
                 else:
                     externs[str(line)] = line
-            else:
-                others.append(line)
+                code.remove(cell)
 
+        # 先頭に GLOBAL, EXTERN の順に挿入する
+        position = None
         for gl in _globals:
-            new_code.append(gl)
+            position = code.insert_after(position, gl)
         for ex in externs:
-            new_code.append(externs[ex])
-        for line in others:
-            new_code.append(line)
+            position = code.insert_after(position, externs[ex])
 
-        return new_code
+        return code
 
 
 class JumpOptimizer(Optimizer):
     def _optimize_jump_1(self, code):
         """無条件ジャンプ後の実行されない不要な命令を削除"""
-        new_code = []
         jump = False
-        for line in code:
+        for cell in code.cells():
+            line = cell.line
             if isinstance(line, Label):
                 # ラベルが出てきたら削除区間終了
                 jump = False
             elif jump:
-                # 無条件ジャンプ直後の実行されないコードをスキップ
+                # 無条件ジャンプ直後の実行されないコードを削除
                 self.optimized += 1
                 self.logger.info('Remove: instruction after jmp')
-                continue
+                code.remove(cell)
             elif isinstance(line, Code):
                 if line.op == 'jmp':
                     # 無条件ジャンプ命令を検出 -> 削除区間開始
                     jump = True
-            new_code.append(line)
-        return new_code
+        return code
 
     def _optimize_jump_2(self, code):
         """直後のラベルへのジャンプ命令を削除"""
         jump = None
-        jump_line = -1
-        delete_lines = []
-        for i, line in enumerate(code):
+        jump_cell = None
+        for cell in code.cells():
+            line = cell.line
             if isinstance(line, Label):
                 if jump is not None and line == jump.args[0]:
-                    # 無条件ジャンプ命令直後のラベルであれば, ジャンプ命令を削除対象に追加
+                    # 無条件ジャンプ命令直後のラベルであれば, ジャンプ命令を削除
                     self.optimized += 1
-                    delete_lines += [jump_line]
+                    code.remove(jump_cell)
                     self.logger.info('Remove: unnecessary ' + jump.op)
                 jump = None
             elif isinstance(line, Code):
-                if line.op in ('je', 'jmp', 'jz',):
-                    # 無条件ジャンプ命令を検出
+                if line.op in ('jmp',) + cfg.CONDITIONAL_JUMPS:
+                    # ジャンプ命令を検出
                     jump = line
-                    jump_line = i
+                    jump_cell = cell
                 else:
                     jump = None
-        return [i for j, i in enumerate(code) if j not in delete_lines]
+        return code
 
     def optimize(self, code):
         code = self._optimize_jump_1(code)
         code = self._optimize_jump_2(code)
         return code
 
+    def optimize_at(self, code, cell):
+        line = cell.line
+        if (not isinstance(line, Code)
+                or line.op not in ('jmp',) + cfg.CONDITIONAL_JUMPS):
+            return False
 
-class UnnecessaryCodeOptimizer(Optimizer):
-    """不要コードを削除する"""
-    def _check_single_deletable(self, code):
-        """コードを 1 行見て不要かどうか判定する"""
-        if code.op in ('add', 'sub', 'imul',):
-            if not isinstance(code.args[1], (int,)):
-                return False
-            elif code.op == 'add' and code.args[1] == 0:
-                self.logger.info('Remove: add R, 0')
-                return True
-            elif code.op == 'sub' and code.args[1] == 0:
-                self.logger.info('Remove: sub R, 0')
-                return True
-            elif code.op == 'imul' and code.args[1] == 1:
-                self.logger.info('Remove: imul R, 1')
-                return True
-        return False
-
-    def _optimize_single(self, code):
-        """1行単位で行える最適化"""
-
-        # 不要な行を削除
-        new_code = []
-        for line in code:
-            if isinstance(line, Code) and self._check_single_deletable(line):
+        changed = False
+        if line.op == 'jmp':
+            # 無条件ジャンプ後の実行されない不要な命令を削除
+            for after in code.cells(after=cell):
+                if isinstance(after.line, Label):
+                    break
+                elif isinstance(after.line, Align):
+                    continue
                 self.optimized += 1
-                continue
-            new_code.append(line)
-        return new_code
+                self.logger.info('Remove: instruction after jmp')
+                code.remove(after)
+                changed = True
 
-    def _optimize_save_and_load(self, code):
-        """メモリストア直後のロード命令の削除"""
-        store = None
-        store_line = -1
-        delete_lines = []
+        # 直後のラベルへのジャンプ命令を削除
+        for after in code.cells(after=cell):
+            if isinstance(after.line, Label):
+                if after.line == line.args[0]:
+                    self.optimized += 1
+                    code.remove(cell)
+                    self.logger.info('Remove: unnecessary ' + line.op)
+                    return True
+                break
+            elif isinstance(after.line, Code):
+                break
+        return changed
 
-        for i, line in enumerate(code):
-            if isinstance(line, Comment):
-                continue
-            elif isinstance(line, Code):
-                if line.op == 'mov':
-                    if (isinstance(line.args[0], (Data, Memory,))
-                            and isinstance(line.args[1], Register)
-                            and line.args[1] == Registers.eax):
-                        # ストア
-                        store = line.args[0]
-                        store_line = i
-                    elif (isinstance(line.args[1], (Data, Memory,))
-                            and store is not None
-                            and isinstance(line.args[0], Register)
-                            and line.args[0] == Registers.eax
-                            and store == line.args[1]):
-                        # ロード
-                        self.optimized += 1
-                        delete_lines += [store_line, i]
-                        store = None
-                        self.logger.info(
-                            'Remove: mov (load) after mov (store)')
-                    else:
-                        store = None
-            else:
-                store = None
 
-        return [i for j, i in enumerate(code) if j not in delete_lines]
+class UnnecessaryCodeOptimizer(Optimizer):
+    """不要コードを削除する"""
+    rules = RuleSet([
+        Rule('add R, 0'),
+        Rule('sub R, 0'),
+        Rule('imul R, 1'),
+        # メモリストア直後のロード命令の削除
+        Rule('mov M, eax; mov eax, M', 'mov M, eax',
+             name='mov (load) after mov (store)'),
+    ])
 
     def _is_register_read(self, code, register=Registers.eax):
         op = code.op.replace(' dword', '')
@@ -266,6 +350,14 @@ class UnnecessaryCodeOptimizer(Optimizer):
 
         if op in ('cdq', 'idiv', 'ret',):
             return True
+        elif op in cfg.CONDITIONAL_JUMPS:
+            # 分岐先で読み出す可能性がある. また, 直前の演算のフラグを
+            # 読むため (FlagsOptimizer), その演算を削除しない
+            return True
+        elif op == 'lea':
+            if (isinstance(code.args[1], Address)
+                    and register in code.args[1].registers()):
+                return True
         elif op in ('add', 'and', 'cmp', 'dec', 'imul', 'inc', 'neg', 'or',
                 'sub', 'test', 'xor',):
             for arg in code.args:
@@ -275,6 +367,10 @@ class UnnecessaryCodeOptimizer(Optimizer):
             if (isinstance(code.args[1], Registers)
                     and code.args[1] == register):
                 return True
+        elif op == 'push':
+            if (isinstance(code.args[0], Registers)
+                    and code.args[0] == register):
+                return True
 
         return False
 
@@ -290,8 +386,8 @@ class UnnecessaryCodeOptimizer(Optimizer):
                         and code.args[0] == Registers.al):
                     return True
 
-        if op in ('add', 'and', 'call', 'dec', 'imul', 'inc', 'neg', 'mov',
-                'movzx', 'or', 'pop', 'sub', 'xor',):
+        if op in ('add', 'and', 'call', 'dec', 'imul', 'inc', 'lea', 'neg',
+                'mov', 'movzx', 'or', 'pop', 'sub', 'xor',):
             if (isinstance(code.args[0], Registers)
                     and code.args[0] == register):
                 return True
@@ -299,84 +395,148 @@ class UnnecessaryCodeOptimizer(Optimizer):
         return False
 
     def _optimize_unused_code(self, code):
-        used = False
-        start = -1
-        delete_lines = []
+        start = None
 
         # 使用されないレジスタ書き込みを検出して削除する
-        for i, line in enumerate(code):
+        for cell in code.cells():
+            line = cell.line
             if isinstance(line, Label):
-                start = -1
+                start = None
             elif isinstance(line, Code):
                 if self._is_register_read(line):
-                    start = -1
+                    start = None
                 elif self._is_register_write(line):
-                    if start > 0:
+                    if start is not None:
                         self.optimized += 1
-                        delete_lines.append(start)
-                        start = -1
+                        code.remove(start)
                         self.logger.info('Remove: unused mov (store)')
-                    start = i
+                    start = cell
 
-        return [i for j, i in enumerate(code) if j not in delete_lines]
+        return code
+
+    def _optimize_unused_write(self, code, write):
+        """write の後, eax を読み出す前に再び書き込んでいれば write を削除する"""
+        for after in code.cells(after=write):
+            line = after.line
+            if isinstance(line, Label):
+                return False
+            elif isinstance(line, Code):
+                # jmp の後は, 削除される前の実行されない命令の可能性がある
+                if line.op == 'jmp' or self._is_register_read(line):
+                    return False
+                elif self._is_register_write(line):
+                    self.optimized += 1
+                    code.remove(write)
+                    self.logger.info('Remove: unused mov (store)')
+                    return True
+        return False
+
+    def _optimize_unused_code_at(self, code, cell):
+        line = cell.line
+        if self._is_register_read(line):
+            return False
+        elif (self._is_register_write(line)
+                and self._optimize_unused_write(code, cell)):
+            return True
+
+        # cell より前で最後に eax へ書き込んだ命令を調べる
+        for before in code.cells_before(cell):
+            line = before.line
+            if isinstance(line, Label):
+                break
+            elif isinstance(line, Code):
+                if self._is_register_read(line):
+                    break
+                elif self._is_register_write(line):
+                    return self._optimize_unused_write(code, before)
+        return False
 
     def optimize(self, code):
-        code = self._optimize_single(code)
-        code = self._optimize_save_and_load(code)
+        code = self._optimize_rules(code)
         code = self._optimize_unused_code(code)
         return code
 
+    def optimize_at(self, code, cell):
+        if not isinstance(cell.line, Code):
+            return False
+        return (self._apply_rules(code, cell)
+                or self._optimize_unused_code_at(code, cell))
+
 
 class ReplaceCodeOptimizer(Optimizer):
     """より効率の良いコードに書き換えることによる最適化"""
+    rules = RuleSet([
+        Rule('mov R, 0', 'xor R, R'),
+        Rule('imul R, 0', 'mov R, 0'),
+        # インテルの最適化リファレンス・マニュアル 3.5.1.1
+        Rule('inc R', 'add R, 1'),
+        Rule('dec R', 'sub R, 1'),
+    ])
+
     def optimize(self, code):
-        for i, line in enumerate(code[:]):
-            if isinstance(line, Code):
-                if (line.op == 'mov'
-                        and isinstance(line.args[0], Registers)
-                        and isinstance(line.args[1], (int, str,))
-                        and int(line.args[1]) == 0):
-                    # mov を xor に置換する
-                    code[i].op = 'xor'
-                    code[i].args[1] = code[i].args[0]
-                    code[i].comment += ' (Optimized mov -> xor)'
-                    self.optimized += 1
-                    self.logger.info('Replace: mov R, 0 -> xor R, R')
-                elif (line.op == 'imul'
-                        and isinstance(line.args[1], (int, str,))
-                        and int(line.args[1]) == 0):
-                    # 0 乗算 を mov に置換する
-                    code[i].op = 'mov'
-                    code[i].args[1] = 0
-                    code[i].comment += ' (Optimized imul -> mov)'
-                    self.optimized += 1
-                    self.logger.info('Replace: imul R, 0 -> mov R, 0')
-                elif line.op == 'inc':
-                    # inc -> add
-                    code[i].op = 'add'
-                    code[i].args.append(1)
-                    code[i].comment += ' (Optimized inc -> add)'
-                    self.optimized += 1
-                    self.logger.info('Replace: inc R -> add R, 1')
-                elif line.op == 'dec':
-                    # dec -> sub
-                    code[i].op = 'sub'
-                    code[i].args.append(1)
-                    code[i].comment += ' (Optimized dec -> sub)'
-                    self.optimized += 1
-                    self.logger.info('Replace: dec R -> sub R, 1')
+        return self._optimize_rules(code)
+
+    def optimize_at(self, code, cell):
+        return self._apply_rules(code, cell)
+
+
+class FlagsOptimizer(Optimizer):
+    """直前の演算が設定したフラグで足りる test 命令を削除する
+
+    add, sub などは結果に応じてゼロフラグを設定するため, 結果のレジスタを
+    test してゼロフラグだけを読む命令 (jz など) の前の test は不要
+    """
+    # 結果に応じてゼロフラグを設定する命令
+    setters = ('add', 'and', 'dec', 'inc', 'neg', 'or', 'sub', 'xor',)
+    # ゼロフラグだけを読む命令
+    readers = ('je', 'jne', 'jz', 'jnz', 'sete', 'setne',)
+
+    def optimize(self, code):
+        for cell in code.cells():
+            self.optimize_at(code, cell)
         return code
 
+    def optimize_at(self, code, cell):
+        line = cell.line
+        if not (isinstance(line, Code) and line.op == 'test'
+                and isinstance(line.args[0], Registers)
+                and line.args[0] == line.args[1]):
+            return False
+
+        previous = following = None
+        for before in code.cells_before(cell):
+            if isinstance(before.line, (Code, Label,)):
+                previous = before.line
+                break
+        for after in code.cells(after=cell):
+            if isinstance(after.line, (Code, Label,)):
+                following = after.line
+                break
+        if not (isinstance(previous, Code) and previous.op in self.setters
+                and previous.args[0] == line.args[0]
+                and isinstance(following, Code)
+                and following.op in self.readers):
+            return False
+        if previous.op in ('add', 'or', 'sub',) and previous.args[1] == 0:
+            # UnnecessaryCodeOptimizer で削除される
+            return False
+
+        self.optimized += 1
+        code.remove(cell)
+        self.logger.info('Remove: test after ' + previous.op)
+        return True
+
 
 class StackPointerOptimzier(Optimizer):
     def optimize(self, code):
         flag = False
         functions = []
         start = -1
-        end = -1
+        start_cell = None
         offset = 0
 
-        for i, line in enumerate(code):
+        for i, cell in enumerate(code.cells()):
+            line = cell.line
             # 関数の開始地点を見つける
             if not isinstance(line, Code):
                 continue
@@ -385,6 +545,9 @@ class StackPointerOptimzier(Optimizer):
                     and line.args[0] == Registers.ebp):
                 flag = True
                 start = i
+                start_cell = cell
+                # sub esp がなければ (ラベルが続く場合も) スタックフレームは 0
+                offset = 0
             elif start == i - 1:
                 if not (line.op == 'mov'
                         and line.args[0] == Registers.ebp
@@ -400,37 +563,677 @@ class StackPointerOptimzier(Optimizer):
                 flag = False
             # 関数の終了地点を見つける
             elif flag and line.op == 'pop' and line.args[0] == Registers.ebp:
-                end = i
-                functions.append((start, offset, end,))
+                functions.append((start_cell, offset, cell,))
 
         for function in functions:
-            for i, line in enumerate(code[function[0]:function[2] + 1]):
-                if not isinstance(line, Code):
-                    continue
-                for j, memory in enumerate(line.args):
-                    if (isinstance(memory, Memory)
-                            and memory.register == Registers.ebp):
-                        # ebp 相対アクセスを esp 相対アクセスに書き換え
-                        code[function[0] + i].args[j].register = Registers.esp
-                        offset = function[1] + memory.offset - 4
-                        code[function[0] + i].args[j].offset = offset
+            cell = function[0]
+            while True:
+                line = cell.line
+                if isinstance(line, Code):
+                    for j, memory in enumerate(line.args):
+                        if (isinstance(memory, Memory)
+                                and memory.register == Registers.ebp):
+                            # ebp 相対アクセスを esp 相対アクセスに書き換え
+                            # (ebp を退避しないため, パラメータは 4 バイト近づく)
+                            memory.register = Registers.esp
+                            memory.offset = function[1] + memory.offset
+                            if memory.offset > function[1]:
+                                memory.offset -= 4
 
-                        self.logger.info('Replace: [ebp+n] -> [esp+n]')
+                            self.logger.info('Replace: [ebp+n] -> [esp+n]')
+                if cell is function[2]:
+                    break
+                cell = cell.next
 
-        delete_lines = []
+        delete_cells = []
         for function in functions:
             self.optimized += 1
             self.logger.info('Remove: unnecessary calling conventions')
 
             # 関数の先頭と末尾の不要になった部分を削除
-            delete_lines += [function[0], function[0] + 1, function[2] - 1]
+            delete_cells += [function[0], function[0].next, function[2].prev]
 
             # 関数の最終行に esp を戻す処理を追加
             # (offset 0 のときも最適化されるので問題ない)
-            code[function[2]] = Code('add', 'esp', function[1],
-                                     comment='Optimized ebp -> esp')
+            code.replace(function[2], Code('add', 'esp', function[1],
+                                           comment='Optimized ebp -> esp'))
 
-        return [i for j, i in enumerate(code) if j not in delete_lines]
+        for cell in delete_cells:
+            code.remove(cell)
+        return code
+
+
+class DeadCodeOptimizer(Optimizer):
+    """データフロー解析 (tinyc.dataflow) による関数全体の不要コードの削除
+
+    到達定義解析で, どの読み出しにも到達しないスタック上の変数への書き込みを,
+    生存区間解析で, 値が読み出されないレジスタとフラグへの書き込みを削除する.
+    削除によって別の書き込みが不要になることがあるため,
+    関数ごとに削除する命令がなくなるまで解析を繰り返す
+    """
+    def __init__(self):
+        super(DeadCodeOptimizer, self).__init__()
+        self.hits = collections.OrderedDict(
+            (('dead store', 0), ('dead register write', 0),))
+
+    def _remove(self, code, cell, name):
+        self.optimized += 1
+        self.hits[name] += 1
+        code.remove(cell)
+        self.logger.info('Remove: ' + name)
+
+    def _optimize_stores(self, code, graph):
+        """読み出されないスタック上の変数への書き込みを削除する"""
+        reaching = dataflow.ReachingDefinitions(graph)
+        used = 0
+        for block in graph.order:
+            reach = reaching.IN[block]
+            for cell in dataflow.instructions(block):
+                e = dataflow.effect(cell.line)
+                used |= reaching.used(e, reach)
+                reach = reaching.step(cell, e, reach)
+            last = block.terminator
+            if not block.successors and (last is None or last.op != 'ret'):
+                # 関数の外に出る可能性がある
+                used |= reach
+
+        removed = 0
+        flags = None
+        for i, (cell, l) in enumerate(reaching.definitions):
+            if used & (1 << i) or cell.prev is None:
+                continue
+            e = dataflow.effect(cell.line)
+            if not e.removable:
+                continue
+            if e.defs + e.partial == [l]:
+                self._remove(code, cell, 'dead store')
+                removed += 1
+            elif e.defs + e.partial == [dataflow.FLAGS, l]:
+                # add [m], I などはフラグが読み出されなければ削除できる
+                if flags is None:
+                    flags = self._flags_live(graph)
+                if cell not in flags:
+                    self._remove(code, cell, 'dead store')
+                    removed += 1
+        return removed
+
+    def _flags_live(self, graph):
+        """直後でフラグが生存している命令のセルの集合を返す"""
+        liveness = dataflow.Liveness(graph)
+        mask = liveness.mask
+        flags = mask([dataflow.FLAGS])
+        result = set()
+        for block in graph.order:
+            live = liveness.OUT[block]
+            for cell in reversed(list(dataflow.instructions(block))):
+                if live & flags:
+                    result.add(cell)
+                e = dataflow.effect(cell.line)
+                live = (live & ~mask(e.defs)) | mask(e.uses)
+        return result
+
+    def _optimize_registers(self, code, graph):
+        """値が読み出されないレジスタとフラグへの書き込みを削除する"""
+        liveness = dataflow.Liveness(graph)
+        mask = liveness.mask
+        removed = 0
+        for block in graph.order:
+            live = liveness.OUT[block]
+            for cell in reversed(list(dataflow.instructions(block))):
+                e = dataflow.effect(cell.line)
+                defs = mask(e.defs)
+                written = defs | mask(e.partial)
+                if (e.removable and written and not live & written
+                        and all(l in dataflow.REGISTERS
+                                for l in e.defs + e.partial)):
+                    self._remove(code, cell, 'dead register write')
+                    removed += 1
+                    continue
+                live = (live & ~defs) | mask(e.uses)
+        return removed
+
+    def optimize(self, code):
+        for graph in cfg.build(code):
+            while (self._optimize_stores(code, graph)
+                    + self._optimize_registers(code, graph)):
+                pass
+        return code
+
+
+def _frame(graph):
+    """関数の (プロローグの最後のセル, sub esp 命令のセル, エピローグの
+    mov esp, ebp 命令のセルのリスト) を返す (対象外の関数は None)
+    """
+    cells = list(dataflow.instructions(graph.entry))
+    lines = [c.line for c in cells]
+    if not (len(lines) >= 2
+            and lines[0].op == 'push'
+            and list(lines[0].args) == [Registers.ebp]
+            and lines[1].op == 'mov'
+            and list(lines[1].args) == [Registers.ebp, Registers.esp]):
+        return None
+    prologue = cells[1]
+    sub = None
+    if (len(lines) >= 3 and lines[2].op == 'sub'
+            and lines[2].args[0] == Registers.esp):
+        prologue = sub = cells[2]
+
+    epilogues = []
+    for block in graph.blocks:
+        last = block.terminator
+        if last is None or last.op != 'ret':
+            continue
+        cells = list(dataflow.instructions(block))
+        lines = [c.line for c in cells[-3:]]
+        if not (len(lines) == 3
+                and lines[0].op == 'mov'
+                and list(lines[0].args) == [Registers.esp, Registers.ebp]
+                and lines[1].op == 'pop'
+                and list(lines[1].args) == [Registers.ebp]):
+            return None
+        epilogues.append(cells[-3])
+    return prologue, sub, epilogues
+
+
+class RegisterAllocator(Optimizer):
+    """スタック上の変数をレジスタに割り付ける (tinyc.regalloc)
+
+    [ebp+n] のオペランドを割り付けたレジスタに書き換え, 入口で
+    パラメータをレジスタに読み込む. ebx, esi, edi は入口で保存して出口で復帰し,
+    call を跨ぐ ecx, edx の変数は call の前後でその変数のメモリに退避/復帰する.
+    push ebp; mov ebp, esp で始まり, mov esp, ebp; pop ebp; ret で終わる
+    関数だけを対象とする
+    """
+    def _save_slots(self, code, graph, allocation, prologue, sub):
+        """ebx, esi, edi を保存するメモリのリストと, プロローグの最後のセルを返す
+
+        レジスタに割り付けて使われなくなった局所変数のメモリを用い,
+        足りなければスタックフレームを広げる
+        """
+        registers = allocation.registers
+        free = sorted((s for s in registers
+                       if registers[s] in dataflow.CALLEE_SAVED and s[1] < 0),
+                      reverse=True)
+        slots = [Memory(Registers.ebp, s[1]) for s in free]
+        if len(slots) >= len(allocation.callee_saved):
+            return slots, prologue
+
+        # スタックフレームの最も下のメモリより下に確保する
+        lowest = -int(sub.line.args[1]) if sub is not None else 0
+        for block in graph.blocks:
+            for cell in dataflow.instructions(block):
+                for arg in cell.line.args:
+                    if (isinstance(arg, Memory)
+                            and arg.register == Registers.ebp):
+                        lowest = min(lowest, arg.offset)
+        while len(slots) < len(allocation.callee_saved):
+            lowest -= 4
+            slots.append(Memory(Registers.ebp, lowest))
+        if sub is None:
+            prologue = code.insert_after(
+                prologue, Code('sub', Registers.esp, -lowest))
+        else:
+            sub.line.args = [Registers.esp, -lowest]
+            code.touch(sub)
+        return slots, prologue
+
+    def _rewrite(self, code, graph, allocation, frame):
+        prologue, sub, epilogues = frame
+        registers = dict((s, Registers[r])
+                         for s, r in allocation.registers.items())
+        for block in graph.blocks:
+            for cell in dataflow.instructions(block):
+                line = cell.line
+                for i, arg in enumerate(line.args):
+                    register = registers.get(dataflow.location(arg))
+                    if isinstance(arg, Memory) and register is not None:
+                        line.args[i] = register
+                        code.touch(cell)
+
+        for slot, calls in sorted(allocation.saves.items()):
+            register = registers[slot]
+            memory = Memory(Registers.ebp, slot[1])
+            for call in calls:
+                code.insert_before(call, Code(
+                    'mov', memory, register,
+                    comment='save {0}'.format(register.name)))
+                code.insert_after(call, Code(
+                    'mov', register, memory,
+                    comment='restore {0}'.format(register.name)))
+
+        # 入口: ebx, esi, edi の保存, パラメータの読み込み
+        slots, last = self._save_slots(
+            code, graph, allocation, prologue, sub)
+        for name, memory in zip(allocation.callee_saved, slots):
+            register = Registers[name]
+            last = code.insert_after(last, Code(
+                'mov', memory, register, comment='save {0}'.format(name)))
+            for epilogue in epilogues:
+                code.insert_before(epilogue, Code(
+                    'mov', register, memory,
+                    comment='restore {0}'.format(name)))
+        for slot in allocation.loads:
+            last = code.insert_after(last, Code(
+                'mov', registers[slot], Memory(Registers.ebp, slot[1]),
+                comment='load parameter'))
+
+    def optimize(self, code):
+        for graph in cfg.build(code):
+            frame = _frame(graph)
+            if frame is None:
+                continue
+            allocation = regalloc.allocate(graph)
+            if allocation is None or not allocation.registers:
+                continue
+            self._rewrite(code, graph, allocation, frame)
+            for slot, register in sorted(allocation.registers.items()):
+                self.optimized += 1
+                self.logger.info('Replace: [ebp{0:+d}] -> {1}'.format(
+                    slot[1], register))
+        return code
+
+
+def _is_eax(arg):
+    return dataflow.location(arg) == dataflow.EAX
+
+
+def _same_operand(a, b):
+    """2 つのオペランドが同じレジスタかメモリか"""
+    if isinstance(a, Data) and isinstance(b, Data):
+        return a.label == b.label
+    elif isinstance(a, Memory) and isinstance(b, Memory):
+        return a == b
+    location = dataflow.location(a)
+    return (location in dataflow.REGISTERS
+            and location == dataflow.location(b))
+
+
+class AccumulatorOptimizer(Optimizer):
+    """eax を経由する命令列を, その後 eax の値が読み出されない場合に
+    1 命令にまとめる
+
+        mov eax, Y; op eax, X; mov Y, eax  ->  op Y, X
+        mov eax, X; op eax, Y; mov Y, eax  ->  op Y, X  (op が可換な場合)
+        mov eax, X; op Y, eax              ->  op Y, X
+        mov eax, X; cmp eax, Y             ->  cmp X, Y
+
+    コード生成器は式の値をいったん eax に求めるため, 式文の代入
+    (x += c, ++x, s = s + t) とループの条件の比較がこの形になる.
+    eax の生存区間は tinyc.dataflow で解析する. メモリ同士の演算になる
+    場合と, imul の書き込み先がレジスタでない場合は書き換えない
+    """
+    operations = ('add', 'and', 'imul', 'or', 'sub', 'xor',)
+    commutative = ('add', 'and', 'imul', 'or', 'xor',)
+
+    def __init__(self):
+        super(AccumulatorOptimizer, self).__init__()
+        self.hits = collections.OrderedDict(
+            (('fold read-modify-write', 0), ('fold operand', 0),
+             ('fold compare', 0),))
+
+    def _dead(self, graph):
+        """直後で eax が生存していない命令のセルの集合を返す"""
+        liveness = dataflow.Liveness(graph)
+        mask = liveness.mask
+        eax = mask([dataflow.EAX])
+        result = set()
+        for block in graph.order:
+            live = liveness.OUT[block]
+            for cell in reversed(list(dataflow.instructions(block))):
+                if not live & eax:
+                    result.add(cell)
+                e = dataflow.effect(cell.line)
+                live = (live & ~mask(e.defs)) | mask(e.uses)
+        return result
+
+    def _valid(self, op, target, operand):
+        """op target, operand が 1 命令で書けるか"""
+        if _is_eax(target) or _is_eax(operand):
+            return False
+        if isinstance(target, (int, long,)):
+            return False
+        if op == 'imul':
+            return dataflow.location(target) in dataflow.REGISTERS
+        return not (isinstance(target, (Data, Memory,))
+                    and isinstance(operand, (Data, Memory,)))
+
+    def _fold(self, lines):
+        """まとめた命令の (規則の名前, 命令数, オペコード, オペランドのリスト)
+
+        まとめられなければ None を返す
+        """
+        first = lines[0]
+        if not (first.op == 'mov' and len(first.args) == 2
+                and _is_eax(first.args[0]) and len(lines) >= 2):
+            return None
+        source = first.args[1]
+        second = lines[1]
+        if second.op not in self.operations + ('cmp',) or len(second.args) != 2:
+            return None
+
+        if len(lines) >= 3 and second.op != 'cmp' and _is_eax(second.args[0]):
+            third = lines[2]
+            if (third.op == 'mov' and len(third.args) == 2
+                    and _is_eax(third.args[1])):
+                target = third.args[0]
+                if _same_operand(target, source):
+                    operand = second.args[1]
+                elif (second.op in self.commutative
+                        and _same_operand(target, second.args[1])):
+                    operand = source
+                else:
+                    operand = None
+                if (operand is not None
+                        and self._valid(second.op, target, operand)):
+                    return ('fold read-modify-write', 3, second.op,
+                            [target, operand],)
+        if (second.op != 'cmp' and _is_eax(second.args[1])
+                and self._valid(second.op, second.args[0], source)):
+            return ('fold operand', 2, second.op, [second.args[0], source],)
+        if (second.op == 'cmp' and _is_eax(second.args[0])
+                and self._valid('cmp', source, second.args[1])):
+            return ('fold compare', 2, 'cmp', [source, second.args[1]],)
+        return None
+
+    def optimize(self, code):
+        for graph in cfg.build(code):
+            dead = self._dead(graph)
+            for block in graph.order:
+                cells = list(dataflow.instructions(block))
+                i = 0
+                while i < len(cells):
+                    fold = self._fold([c.line for c in cells[i:i + 3]])
+                    if fold is None or cells[i + fold[1] - 1] not in dead:
+                        i += 1
+                        continue
+                    name, n, op, args = fold
+                    line = cells[i].line
+                    line.op = op
+                    line.args = args
+                    line.comment = cells[i + n - 1].line.comment
+                    code.touch(cells[i])
+                    for cell in cells[i + 1:i + n]:
+                        code.remove(cell)
+                    self.optimized += 1
+                    self.hits[name] += 1
+                    self.logger.info('Replace: ' + name)
+                    i += n
+        return code
+
+
+class StackSlotOptimizer(Optimizer):
+    """同時に生存しない局所変数/一時変数に同じメモリを割り当てて
+    スタックフレームを縮める (tinyc.regalloc.colour_slots)
+
+    frames には関数ごとの (関数名, 縮める前のバイト数, 縮めた後のバイト数) を記録する
+    """
+    def __init__(self):
+        super(StackSlotOptimizer, self).__init__()
+        self.frames = []
+
+    def optimize(self, code):
+        for graph in cfg.build(code):
+            frame = _frame(graph)
+            if frame is None or frame[1] is None:
+                continue
+            sub = frame[1]
+            before = int(sub.line.args[1])
+            offsets = regalloc.colour_slots(graph)
+            if offsets is None:
+                continue
+            after = max([-o for o in offsets.values()] + [0])
+            self.frames.append((graph.name, before, after,))
+            if after >= before:
+                continue
+
+            for block in graph.blocks:
+                for cell in dataflow.instructions(block):
+                    line = cell.line
+                    for i, arg in enumerate(line.args):
+                        offset = offsets.get(dataflow.location(arg))
+                        if isinstance(arg, Memory) and offset is not None:
+                            line.args[i] = Memory(Registers.ebp, offset)
+                            code.touch(cell)
+            sub.line.args = [Registers.esp, after]
+            code.touch(sub)
+            self.optimized += 1
+            self.logger.info('Shrink: stack frame of {0} ({1} -> {2} bytes)'
+                             .format(graph.name, before, after))
+        return code
+
+
+class BlockLayoutOptimizer(Optimizer):
+    """ブロックの配置の最適化 (-O2)
+
+    ループ内の条件分岐の後にあり, jmp でループの外に出るブロック
+    (ループ内の return など) を関数の末尾に移し, ループに留まる側を
+    フォールスルーにする. 直前のブロックがそのブロックを飛び越える
+    条件ジャンプで終わる場合は, 条件を反転して移したブロックへ分岐させる.
+    最後にループのヘッダのラベルを alignment バイト境界にそろえる
+    """
+    negated = {
+        'je': 'jne', 'jne': 'je', 'jz': 'jnz', 'jnz': 'jz',
+        'jl': 'jge', 'jge': 'jl', 'jle': 'jg', 'jg': 'jle',
+    }
+
+    def __init__(self, alignment=16):
+        super(BlockLayoutOptimizer, self).__init__()
+        self.alignment = alignment
+        self.hits = collections.OrderedDict(
+            (('move cold block', 0), ('align loop header', 0),))
+
+    def _is_cold(self, block):
+        """ループから jmp で脱出するだけのブロックか"""
+        last = block.terminator
+        if (last is None or last.op != 'jmp' or len(block.successors) != 1
+                or not block.predecessors):
+            return False
+        loop = block.predecessors[0].loop
+        return (loop is not None and block not in loop
+                and block.successors[0] not in loop
+                and all(p in loop for p in block.predecessors))
+
+    def _move_cold_blocks(self, code, graph):
+        # 関数の最後の命令の後ろに移す
+        for tail in reversed(graph.blocks[-1].cells):
+            if isinstance(tail.line, Code):
+                break
+        # before は移していない直前のブロック
+        before = graph.blocks[0]
+        for i in range(1, len(graph.blocks) - 1):
+            block, after = graph.blocks[i:i + 2]
+            if not self._is_cold(block):
+                before = block
+                continue
+            last = before.terminator
+            label = None
+            if last is not None and last.op in ('jmp', 'ret',):
+                pass
+            elif (last is not None and last.op in self.negated
+                    and last.args[0] in after.labels):
+                # 条件を反転して, 移したブロックへ分岐する
+                if block.labels:
+                    target = block.labels[0]
+                else:
+                    target = label = Label(last.args[0].label + '_cold')
+                for jump in reversed(before.cells):
+                    if jump.line is last:
+                        break
+                code.replace(jump, Code(self.negated[last.op], target,
+                                        comment=last.comment))
+            else:
+                before = block
+                continue
+
+            lines = [cell.line for cell in block.cells]
+            for cell in block.cells:
+                code.remove(cell)
+            if label is not None:
+                tail = code.insert_after(tail, label)
+            for line in lines:
+                tail = code.insert_after(tail, line)
+            self.optimized += 1
+            self.hits['move cold block'] += 1
+            self.logger.info('Layout: move cold block to the end of '
+                             + graph.name)
+
+    def _align_loops(self, code, graph):
+        for loop in graph.loops:
+            header = loop.header
+            if header is graph.entry or not header.labels:
+                continue
+            code.insert_before(header.cells[0], Align(self.alignment))
+            self.hits['align loop header'] += 1
+            self.logger.info('Layout: align loop header '
+                             + header.labels[0].label)
+
+    def optimize(self, code):
+        for graph in cfg.build(code):
+            self._move_cold_blocks(code, graph)
+        for graph in cfg.build(code):
+            self._align_loops(code, graph)
+        return code
+
+
+class PeepholeOptimizer(Optimizer):
+    """覗き穴最適化を不動点に達するまで行う最適化器
+
+    ラベルと GLOBAL/EXTERN の最適化をコード全体に 1 回適用した後, すべての行を
+    作業リストに入れ, 取り出した行に各最適化器の optimize_at を順に適用する.
+    行が削除/置換されると, その前後の行 (直近のコードまたはラベルまで.
+    前方は規則の窓に収まる命令の数まで) と, 利用されなくなったラベルだけを
+    作業リストに戻して再検査する.
+    作業リストが空になったら DeadCodeOptimizer, RegisterAllocator,
+    AccumulatorOptimizer, StackSlotOptimizer (dataflow が偽なら省く),
+    StackPointerOptimzier (layout が真ならさらに BlockLayoutOptimizer) を
+    順に適用し, それぞれ変更のあった行について同様に不動点まで最適化する.
+    hits には各最適化器の規則ごとの適用回数を, frames には
+    StackSlotOptimizer で縮めた関数ごとのスタックフレームをまとめる
+    """
+    def __init__(self, layout=False, dataflow=True):
+        super(PeepholeOptimizer, self).__init__()
+        self.layout = layout
+        self.dataflow = dataflow
+        self.labels = LabelOptimizer()
+        self.optimizers = (
+            self.labels,
+            JumpOptimizer(),
+            UnnecessaryCodeOptimizer(),
+            ReplaceCodeOptimizer(),
+            FlagsOptimizer(),
+        )
+        # 変更された行より前で再検査するコードまたはラベルの数
+        self.reach = max(
+            [o.rules.window - 1 for o in self.optimizers] + [1])
+        # 作業リストから取り出して検査した行の数
+        self.examined = 0
+        # コード全体を走査する最適化で検査した行の数
+        self.scanned = 0
+        self._queue = collections.deque()
+        self._queued = set()
+        self.frames = []
+
+    def _push(self, cell):
+        if cell not in self._queued:
+            self._queued.add(cell)
+            self._queue.append(cell)
+
+    def _push_around(self, code, cell):
+        """cell と, その前後の直近のコードまたはラベルまでの行を作業リストに追加する"""
+        self._push(cell)
+        reach = self.reach
+        for before in code.cells_before(cell):
+            self._push(before)
+            if isinstance(before.line, (Code, Label,)):
+                reach -= 1
+                if reach == 0:
+                    break
+        for after in code.cells(after=cell):
+            self._push(after)
+            if isinstance(after.line, (Code, Label,)):
+                break
+
+    def _mark(self, code):
+        """変更のあったセルの近傍を作業リストに追加する"""
+        log = code.log
+        code.log = []
+        for cell in log:
+            if cell.prev is None:
+                # 削除された行が参照していたラベルと, 後続の行を再検査する
+                for definition in self.labels.unreference(cell):
+                    self._push(definition)
+                for cell in code.cells(after=cell):
+                    break
+                else:
+                    continue
+            self._push_around(code, cell)
+
+    def _run(self, code):
+        queue = self._queue
+        while queue:
+            cell = queue.popleft()
+            self._queued.discard(cell)
+            if cell.prev is None:
+                # 削除済み
+                continue
+            self.examined += 1
+            for o in self.optimizers:
+                if o.optimize_at(code, cell):
+                    if cell.prev is not None:
+                        self._push(cell)
+                    self._mark(code)
+                    break
+
+    def optimize(self, code):
+        global_extern = GlobalExternOptimizer()
+        dead_code = DeadCodeOptimizer()
+        allocator = RegisterAllocator()
+        accumulator = AccumulatorOptimizer()
+        stack_slots = StackSlotOptimizer()
+        stack_pointer = StackPointerOptimzier()
+        layout = BlockLayoutOptimizer()
+
+        self.scanned += len(code)
+        code = self.labels.optimize(code)
+        self.scanned += len(code)
+        code = global_extern.optimize(code)
+        self.scanned += len(code)
+        self.labels.index(code)
+
+        for cell in code.cells():
+            self._push(cell)
+        code.log = []
+        try:
+            self._run(code)
+            if self.dataflow:
+                for o in (dead_code, allocator, accumulator, stack_slots,):
+                    self.scanned += len(code)
+                    code = o.optimize(code)
+                    self._mark(code)
+                    self._run(code)
+            self.scanned += len(code)
+            code = stack_pointer.optimize(code)
+            self._mark(code)
+            self._run(code)
+            if self.layout:
+                self.scanned += len(code)
+                code = layout.optimize(code)
+                # 移したブロックのラベルを索引し直す
+                self.labels.index(code)
+                self._mark(code)
+                self._run(code)
+        finally:
+            code.log = None
+
+        self.optimized = (sum(o.optimized for o in self.optimizers)
+                          + global_extern.optimized + dead_code.optimized
+                          + allocator.optimized + accumulator.optimized
+                          + stack_slots.optimized
+                          + stack_pointer.optimized + layout.optimized)
+        self.frames += stack_slots.frames
+        for o in self.optimizers + (dead_code, accumulator, layout,):
+            self.hits.update(o.hits)
+        return code
 
 
 class LLVMPasses(object):
@@ -3,17 +3,31 @@
 
 from __future__ import print_function
 import logging
+import os
 
 from ply import yacc
 
-from tinyc import common, token
+from tinyc import cache, common, token
 from tinyc.common import Kinds
 from tinyc.lexer import Lexer
+from tinyc.rdparser import RecursiveDescentParser
 
 
 class Parser(object):
-    u"""構文解析器"""
+    u"""構文解析器
+
+    engine に 'ply' を指定すると PLY の LALR 構文解析器を,
+    'rd' を指定すると再帰下降構文解析器を用いる.
+    lexer には字句解析器の種類 (Lexer.engines) を指定する
+    """
     tokens = common.TOKENS
+    engines = ('ply', 'rd',)
+
+    def __init__(self, engine='ply', lexer='ply'):
+        if engine not in self.engines:
+            raise ValueError('Unknown parser engine: {0}'.format(engine))
+        self.engine = engine
+        self.lexer_engine = lexer
 
     def p_program_external_declaration(self, p):
         """program : external_declaration"""
@@ -165,7 +179,7 @@ class Parser(object):
         """logical_OR_expr : logical_OR_expr LOR logical_AND_expr"""
         if self.optimize and self._check_if_constants(p[1], p[3]):
             self.optimized += 1
-            if p[1] == token.Constant(1) or p[3] == token.Constant(1):
+            if p[1] != token.Constant(0) or p[3] != token.Constant(0):
                 p[0] = token.Constant(1)
             else:
                 p[0] = token.Constant(0)
@@ -180,7 +194,7 @@ class Parser(object):
         """logical_AND_expr : logical_AND_expr LAND equality_expr"""
         if self.optimize and self._check_if_constants(p[1], p[3]):
             self.optimized += 1
-            if p[1] == token.Constant(1) and p[3] == token.Constant(1):
+            if p[1] != token.Constant(0) and p[3] != token.Constant(0):
                 p[0] = token.Constant(1)
             else:
                 p[0] = token.Constant(0)
@@ -390,18 +404,77 @@ class Parser(object):
                 return False
         return True
 
-    def build(self, debug=False, **kwargs):
+    def _build_cached(self, cache_dir):
+        """キャッシュした構文解析表を用いて構文解析器を作成する"""
+        name = 'parsetab_' + cache.signature(
+            self, 'p_', self.tokens, self.precedence)
+        path = os.path.join(cache_dir, name + '.pickle')
+
+        if os.path.exists(path):
+            # 文法はハッシュで一致を確認済みなので LALR 表の生成を省略する
+            return yacc.yacc(module=self, optimize=1, picklefile=path)
+
+        try:
+            temp = cache.temporary_path(cache_dir, '.pickle')
+            parser = yacc.yacc(module=self, debug=False, picklefile=temp)
+            os.rename(temp, path)
+        except (IOError, OSError):
+            self.logger.debug('Failed to write parser table: ' + path)
+            parser = yacc.yacc(module=self, debug=False, write_tables=0)
+        return parser
+
+    def build(self, debug=False, cache_dir=None, **kwargs):
         self.errors = 0
         self.optimized = 0
         self.logger = logging.getLogger()
 
         # 字句解析
         self.lexer = Lexer()
-        self.lexer.build(debug=debug)
-        self.parser = yacc.yacc(module=self, debug=debug)
+        self.lexer.build(
+            debug=debug, cache_dir=cache_dir, engine=self.lexer_engine)
+
+        if self.engine == 'rd':
+            self.parser = RecursiveDescentParser(self.lexer.lexer)
+            return
+
+        # デバッグ時は parser.out を出力するため, キャッシュを用いない
+        cache_dir = cache.get_cache_dir(cache_dir)
+        if cache_dir is None or debug:
+            self.parser = yacc.yacc(module=self, debug=debug)
+        else:
+            self.parser = self._build_cached(cache_dir)
 
     def parse(self, data, optimize=True):
         self.optimize = optimize
-        result = self.parser.parse(data)
+        if self.engine == 'rd':
+            result = self.parser.parse(data, optimize=optimize)
+            self.errors += self.parser.errors
+            self.optimized += self.parser.optimized
+        else:
+            result = self.parser.parse(data, lexer=self.lexer.lexer)
         self.errors += self.lexer.errors
         return result
+
+    def parse_iter(self, data, optimize=True):
+        """外部宣言を解析できた順に 1 つずつ返す
+
+        errors と optimized は外部宣言を返すたびに, その時点までの値に更新する.
+        data に mmap.mmap を指定できるのは再帰下降構文解析器と regex の
+        字句解析器を用いる場合のみで, PLY の構文解析器は全体を解析してから返す
+        """
+        if self.engine != 'rd':
+            ast = self.parse(data, optimize=optimize)
+            if ast is not None:
+                for node in ast.nodes:
+                    yield node
+            return
+
+        self.optimize = optimize
+        errors = self.errors
+        optimized = self.optimized
+        for node in self.parser.parse_iter(data, optimize=optimize):
+            self.errors = errors + self.parser.errors + self.lexer.errors
+            self.optimized = optimized + self.parser.optimized
+            yield node
+        self.errors = errors + self.parser.errors + self.lexer.errors
+        self.optimized = optimized + self.parser.optimized
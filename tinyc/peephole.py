@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""覗き穴最適化の規則を記述するための小さな言語
+
+規則は命令のパターンと置換後の命令のテンプレートを文字列で記述する.
+
+    Rule('mov R, 0', 'xor R, R')
+    Rule('mov M, eax; mov eax, M', 'mov M, eax')
+
+パターンは ';' で区切った命令の並び (窓) で, 命令の間のコメントは無視する.
+オペランドには次のものを書ける.
+
+* レジスタ名 (eax など): そのレジスタ
+* 整数: その値の即値
+* R, R1, ...: 任意のレジスタ
+* I, I1, ...: 任意の即値
+* M, M1, ...: 任意のメモリ (Memory/Data)
+
+同じ名前のワイルドカードは同じオペランドにしか一致しない.
+guard を指定すると, ワイルドカードの束縛 (名前 -> オペランドの辞書) を
+受け取り, 真を返した場合だけ規則を適用する.
+置換後の命令を省略するとパターンに一致した命令を削除する.
+
+RuleSet は規則を一度だけコンパイルし, 先頭の命令のオペコードで索引を作る.
+各命令はそのオペコードで始まる規則とだけ照合する
+"""
+
+from __future__ import print_function, unicode_literals
+import re
+
+from tinyc.code import Code, Comment, Data, Memory, Registers
+
+
+class Rule(object):
+    """覗き穴最適化の規則
+
+    name はログと適用回数の集計に用いる (省略するとパターンから作る)
+    """
+    def __init__(self, pattern, replacement=None, guard=None, name=None):
+        self.pattern = [_parse_instruction(s) for s in _split(pattern)]
+        self.replacement = [
+            _parse_instruction(s) for s in _split(replacement or '')]
+        self.guard = guard
+        if name is None:
+            name = pattern
+            if replacement:
+                name += ' -> ' + replacement
+        self.name = name
+        if len(self.replacement) < len(self.pattern):
+            self.message = 'Remove: ' + name
+        else:
+            self.message = 'Replace: ' + name
+
+        self._matchers = [
+            (op, [_compile_operand(a) for a in args])
+            for op, args in self.pattern]
+        self._templates = [
+            (op, [_compile_template(a) for a in args])
+            for op, args in self.replacement]
+
+    def match(self, lines):
+        """命令のリストがパターンに一致すれば束縛を返す (一致しなければ None)"""
+        bindings = {}
+        for line, (op, matchers) in zip(lines, self._matchers):
+            if line.op != op or len(line.args) != len(matchers):
+                return None
+            for arg, matcher in zip(line.args, matchers):
+                if not matcher(arg, bindings):
+                    return None
+        if self.guard is not None and not self.guard(bindings):
+            return None
+        return bindings
+
+    def instantiate(self, bindings):
+        """置換後の命令の (オペコード, オペランドのリスト) のリストを返す"""
+        return [(op, [template(bindings) for template in templates])
+                for op, templates in self._templates]
+
+
+class RuleSet(object):
+    """コンパイルした規則の集合
+
+    規則はリストの順に優先する
+    """
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.index = {}
+        for rule in self.rules:
+            self.index.setdefault(rule.pattern[0][0], []).append(rule)
+        # 最も長い窓の命令数
+        self.window = max([len(rule.pattern) for rule in self.rules] + [1])
+
+    def _window(self, code, cell, n):
+        """cell から始まる, コメントを除いた n 個までの命令のセルを返す"""
+        cells = [cell]
+        if n > 1:
+            for after in code.cells(after=cell):
+                if isinstance(after.line, Comment):
+                    continue
+                elif not isinstance(after.line, Code):
+                    break
+                cells.append(after)
+                if len(cells) == n:
+                    break
+        return cells
+
+    def match(self, code, cell):
+        """cell から始まる命令列に一致する最初の規則を探す
+
+        (規則, 一致したセルのリスト, 束縛) を返す (一致しなければ None)
+        """
+        line = cell.line
+        if not isinstance(line, Code):
+            return None
+        rules = self.index.get(line.op)
+        if not rules:
+            return None
+        cells = self._window(code, cell, self.window)
+        lines = [c.line for c in cells]
+        for rule in rules:
+            n = len(rule.pattern)
+            if n > len(cells):
+                continue
+            bindings = rule.match(lines[:n])
+            if bindings is not None:
+                return rule, cells[:n], bindings
+        return None
+
+    def apply(self, code, cell):
+        """cell から始まる命令列に規則を適用し, 適用した規則を返す
+
+        置換後の命令は一致した命令を先頭から順に書き換え, 余った命令は削除,
+        足りない命令は最後の命令の後に挿入する.
+        1 命令を別のオペコードの 1 命令に書き換える場合はコメントに追記する
+        """
+        match = self.match(code, cell)
+        if match is None:
+            return None
+        rule, cells, bindings = match
+        replacement = rule.instantiate(bindings)
+
+        last = None
+        for i, (op, args) in enumerate(replacement):
+            if i < len(cells):
+                last = cells[i]
+                line = last.line
+                if line.op == op and line.args == args:
+                    continue
+                if len(cells) == len(replacement) == 1 and line.op != op:
+                    suffix = '(Optimized {0} -> {1})'.format(line.op, op)
+                    if line.comment is None:
+                        line.comment = suffix
+                    else:
+                        line.comment += ' ' + suffix
+                line.op = op
+                line.args = args
+                code.touch(last)
+            else:
+                last = code.insert_after(last, Code(op, *args))
+        for c in cells[len(replacement):]:
+            code.remove(c)
+        return rule
+
+
+def _split(text):
+    return [s.strip() for s in text.split(';') if s.strip()]
+
+
+def _parse_instruction(text):
+    parts = text.split(None, 1)
+    if len(parts) == 1:
+        return parts[0], []
+    return parts[0], [a.strip() for a in parts[1].split(',')]
+
+
+_WILDCARD = re.compile(r'^([RIM])(\d*)$')
+_INTEGER = re.compile(r'^-?\d+$')
+
+
+def _is_register(arg):
+    # StackPointerOptimzier はレジスタを文字列で書き込む
+    return (isinstance(arg, Registers)
+            or (isinstance(arg, (str, unicode,))
+                and arg in Registers.__members__))
+
+
+def _is_immediate(arg):
+    return isinstance(arg, (int, long,)) and not isinstance(arg, bool)
+
+
+def _is_memory(arg):
+    return isinstance(arg, (Data, Memory,))
+
+
+def _register_name(arg):
+    return arg.name if isinstance(arg, Registers) else arg
+
+
+def _same(a, b):
+    """ワイルドカードに束縛した 2 つのオペランドが同じか"""
+    if _is_register(a) and _is_register(b):
+        return _register_name(a) == _register_name(b)
+    elif isinstance(a, Data) and isinstance(b, Data):
+        return a.label == b.label
+    elif isinstance(a, Memory) and isinstance(b, Memory):
+        return a == b
+    elif _is_immediate(a) and _is_immediate(b):
+        return a == b
+    return False
+
+
+def _compile_operand(text):
+    """オペランドのパターンを, (オペランド, 束縛) を受け取る関数にする"""
+    wildcard = _WILDCARD.match(text)
+    if wildcard:
+        check = {'R': _is_register, 'I': _is_immediate,
+                 'M': _is_memory}[wildcard.group(1)]
+
+        def match(arg, bindings):
+            if not check(arg):
+                return False
+            elif text in bindings:
+                return _same(bindings[text], arg)
+            bindings[text] = arg
+            return True
+        return match
+    elif _INTEGER.match(text):
+        value = int(text)
+        return lambda arg, bindings: _is_immediate(arg) and arg == value
+    elif text in Registers.__members__:
+        return lambda arg, bindings: (
+            _is_register(arg) and _register_name(arg) == text)
+    raise ValueError('Unknown operand in peephole rule: ' + text)
+
+
+def _compile_template(text):
+    """置換後のオペランドのテンプレートを, 束縛を受け取る関数にする"""
+    if _WILDCARD.match(text):
+        return lambda bindings: bindings[text]
+    elif _INTEGER.match(text):
+        value = int(text)
+        return lambda bindings: value
+    elif text in Registers.__members__:
+        register = Registers[text]
+        return lambda bindings: register
+    raise ValueError('Unknown operand in peephole rule: ' + text)
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""再帰下降構文解析器 (式は演算子順位法で解析する)
+
+tinyc.parser.Parser と同じ文法を解析し, 同じ構文木 (定数計算を含む) を作成する.
+入れ子になる文と式は明示的なスタックで解析するため, 深い入れ子でも
+Python の再帰の上限に達しない
+"""
+
+from __future__ import print_function
+import logging
+
+from tinyc import token
+
+
+# 二項演算子の優先順位 (大きいほど強く結合する, すべて左結合)
+BINARY_PRECEDENCE = {
+    'LOR': 1,
+    'LAND': 2,
+    'EQ': 3,
+    'NEQ': 3,
+    'LT': 4,
+    'LTE': 4,
+    'GT': 4,
+    'GTE': 4,
+    'PLUS': 5,
+    'MINUS': 5,
+    'MULT': 6,
+    'DIV': 6,
+}
+
+ASSIGN_OPERATORS = {
+    'EQUALS': 'ASSIGN',
+    'PLUS_EQ': 'ASSIGN_PLUS',
+    'MINUS_EQ': 'ASSIGN_MINUS',
+}
+
+
+def _bool(value):
+    if value:
+        return token.Constant(1)
+    return token.Constant(0)
+
+
+# 定数同士の二項演算のコンパイル時実行 (Parser.p_*_expr_* と同じ規則)
+CONSTANT_FOLDING = {
+    'LOR': lambda l, r: _bool(l != token.Constant(0) or r != token.Constant(0)),
+    'LAND': lambda l, r: _bool(l != token.Constant(0) and r != token.Constant(0)),
+    'EQ': lambda l, r: _bool(l == r),
+    'NEQ': lambda l, r: _bool(l != r),
+    'LT': lambda l, r: _bool(l < r),
+    'LTE': lambda l, r: _bool(l <= r),
+    'GT': lambda l, r: _bool(l > r),
+    'GTE': lambda l, r: _bool(l >= r),
+    'PLUS': lambda l, r: l + r,
+    'MINUS': lambda l, r: l - r,
+    'MULT': lambda l, r: l * r,
+    'DIV': lambda l, r: l / r,
+}
+
+
+class ParseError(Exception):
+    pass
+
+
+# エラーからの回復 (構文解析の再開) を表す印
+RESTART = object()
+
+
+class RecursiveDescentParser(object):
+    """再帰下降構文解析器"""
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.logger = logging.getLogger()
+
+    def parse(self, data, optimize=True):
+        result = None
+        for node in self._parse(data, optimize):
+            if node is RESTART:
+                # エラーから回復した場合は, それまでの構文木を破棄する
+                result = None
+            elif result is None:
+                result = token.ExternalDeclarationList(node)
+            else:
+                result.add(node)
+        return result
+
+    def parse_iter(self, data, optimize=True):
+        """外部宣言 (external_declaration) を解析できた順に 1 つずつ返す
+
+        data には文字列のほか, mmap などバッファインターフェースを持つ
+        オブジェクトを指定できる (字句解析器が対応している場合)
+        """
+        for node in self._parse(data, optimize):
+            if node is not RESTART:
+                yield node
+
+    def _parse(self, data, optimize):
+        self.optimize = optimize
+        self.errors = 0
+        self.optimized = 0
+
+        self.lexer.input(data)
+        self.tokens = []
+        self.error_count = 0
+        self._advance()
+
+        while self.tok is not None:
+            try:
+                node = self._external_declaration()
+            except ParseError:
+                # Panic mode に突入, 特定のトークンまで読み飛ばして最初から再開
+                self._recover()
+                yield RESTART
+                continue
+            yield node
+
+    # トークン操作
+    def _advance(self):
+        if self.error_count:
+            self.error_count -= 1
+        tok = self.tok = (
+            self.tokens.pop() if self.tokens else self.lexer.token())
+        return tok
+
+    def _peek(self):
+        """現在のトークンの次のトークンを先読みする"""
+        if not self.tokens:
+            self.tokens.append(self.lexer.token())
+        return self.tokens[-1]
+
+    def _expect(self, tp):
+        tok = self.tok
+        if tok is None or tok.type != tp:
+            self._error()
+        self._advance()
+        return tok
+
+    def _error(self):
+        # PLY と同様に, 回復後 3 トークン以内のエラーは報告しない
+        if self.error_count == 0:
+            self.errors += 1
+            tok = self.tok
+            if tok is None:
+                logging.error("Syntax error at end of input.")
+            else:
+                message = "Line {line}: Syntax error at '{value}'. "
+                logging.error(message.format(line=tok.lineno, value=tok.value))
+        raise ParseError()
+
+    def _recover(self):
+        while True:
+            tok = self._advance()
+            if tok is None or tok.type in ('SEMICOLON', 'RBRACE',):
+                break
+        if tok is not None:
+            self._advance()
+        self.error_count = 3
+
+    # 宣言
+    def _external_declaration(self):
+        self._expect('INT')
+        declarator = self._declarator()
+        if self.tok is not None and self.tok.type == 'LPAREN':
+            self._advance()
+            parameters = self._parameter_type_list()
+            self._expect('RPAREN')
+            if self.tok is None or self.tok.type != 'LBRACE':
+                self._error()
+            # 現在のトークンは LBRACE なので, 関数本体の複合文を解析する
+            return token.FunctionDefinition(
+                declarator, parameters, self._statement())
+        return self._declaration_rest(declarator)
+
+    def _declaration(self):
+        self._expect('INT')
+        return self._declaration_rest(self._declarator())
+
+    def _declaration_rest(self, declarator):
+        declarators = token.DeclaratorList(declarator)
+        while self.tok is not None and self.tok.type == 'COMMA':
+            self._advance()
+            declarators.add(self._declarator())
+        self._expect('SEMICOLON')
+        return token.Declaration(declarators)
+
+    def _declarator(self):
+        return token.Declarator(self._identifier())
+
+    def _parameter_type_list(self):
+        parameters = token.ParameterTypeList()
+        if self.tok is not None and self.tok.type == 'RPAREN':
+            return parameters
+        while True:
+            self._expect('INT')
+            parameters.add(token.ParameterDeclaration(self._declarator()))
+            if self.tok is None or self.tok.type != 'COMMA':
+                return parameters
+            self._advance()
+
+    # 文
+    def _statement(self):
+        """文を明示的なスタックを用いて解析する
+
+        複合文, if/while の本体, else 節 (else if の連鎖を含む) の入れ子を
+        Python の再帰を用いずに解析する. スタックには入れ子の文を待っている
+        構文を (種類, ...) のタプルとして積む
+        """
+        stack = []
+        push = stack.append
+        while True:
+            # 文の始まり: 入れ子の文を待つ構文はスタックに積んで次の文へ進む
+            tok = self.tok
+            tp = tok.type if tok is not None else None
+            if tp == 'SEMICOLON':
+                self._advance()
+                statement = None
+            elif tp == 'LBRACE':
+                self._advance()
+                if self.tok is not None and self.tok.type == 'RBRACE':
+                    self._advance()
+                    statement = token.CompoundStatement(
+                        token.NullNode(), token.NullNode())
+                else:
+                    declarations = token.DeclarationList()
+                    while self.tok is not None and self.tok.type == 'INT':
+                        declarations.add(self._declaration())
+                    statements = token.StatementList()
+                    if self.tok is not None and self.tok.type != 'RBRACE':
+                        push(('compound', declarations, statements))
+                        continue
+                    self._expect('RBRACE')
+                    statement = token.CompoundStatement(declarations, statements)
+            elif tp == 'IF' or tp == 'WHILE':
+                self._advance()
+                self._expect('LPAREN')
+                expr = self._expression()
+                self._expect('RPAREN')
+                push((tp, expr))
+                continue
+            elif tp == 'RETURN':
+                self._advance()
+                expr = self._expression()
+                self._expect('SEMICOLON')
+                statement = token.ReturnStatement(expr)
+            else:
+                statement = self._expression()
+                self._expect('SEMICOLON')
+
+            # 解析した文を, それを待っている構文に渡す
+            while stack:
+                frame = stack[-1]
+                kind = frame[0]
+                if kind == 'compound':
+                    statements = frame[2]
+                    # StatementList(None) と同様に, 先頭の空文はリストに含めない
+                    if statement is not None or statements.nodes:
+                        statements.add(statement)
+                    if self.tok is not None and self.tok.type != 'RBRACE':
+                        break
+                    self._expect('RBRACE')
+                    stack.pop()
+                    statement = token.CompoundStatement(frame[1], statements)
+                elif kind == 'IF':
+                    if self.tok is not None and self.tok.type == 'ELSE':
+                        # else は直近の if に結合する
+                        self._advance()
+                        stack[-1] = ('ELSE', frame[1], statement)
+                        break
+                    stack.pop()
+                    statement = token.IfStatement(
+                        frame[1], statement, token.NullNode())
+                elif kind == 'ELSE':
+                    stack.pop()
+                    statement = token.IfStatement(frame[1], frame[2], statement)
+                else:
+                    stack.pop()
+                    statement = token.WhileLoop(frame[1], statement)
+            else:
+                return statement
+
+    # 式
+    def _expression(self):
+        """式 (expression) を明示的なスタックを用いて解析する
+
+        括弧, 関数呼び出しの引数, 単項の -, 代入と二項演算子の右辺の入れ子を
+        Python の再帰を用いずに解析する. 二項演算子は優先順位に従って
+        スタック上で結合する (すべて左結合).
+        スタックには値 (オペランド) を待っている構文を (種類, ...) の
+        タプルとして積む
+        """
+        stack = []
+        push = stack.append
+        # 代入式 (assign_expr) の始まりかどうか
+        assign = True
+        while True:
+            # オペランド (unary_expr) の解析
+            tok = self.tok
+            tp = tok.type if tok is not None else None
+            if tp == 'ID':
+                op = None
+                if assign:
+                    op = ASSIGN_OPERATORS.get(getattr(self._peek(), 'type', None))
+                value = self._identifier()
+                if op is not None:
+                    self._advance()
+                    push(('assign', op, value))
+                    continue
+                if self.tok is not None and self.tok.type == 'LPAREN':
+                    self._advance()
+                    arguments = token.ArgumentExpressionList()
+                    if self.tok is None or self.tok.type != 'RPAREN':
+                        push(('call', value, arguments))
+                        assign = True
+                        continue
+                    self._advance()
+                    value = token.FunctionExpression(
+                        value, arguments, value.lineno)
+            elif tp == 'CONSTANT':
+                self._advance()
+                value = token.Constant(tok.value)
+            elif tp == 'MINUS':
+                self._advance()
+                push(('negative',))
+                assign = False
+                continue
+            elif tp == 'INC':
+                self._advance()
+                value = token.Increment(self._identifier())
+            elif tp == 'DEC':
+                self._advance()
+                value = token.Decrement(self._identifier())
+            elif tp == 'LPAREN':
+                self._advance()
+                push(('paren',))
+                assign = True
+                continue
+            else:
+                self._error()
+
+            # 値に続くトークンを見て, 値を待っている構文と結合する
+            while True:
+                kind = stack[-1][0] if stack else None
+                if kind == 'negative':
+                    stack.pop()
+                    if self.optimize and isinstance(value, token.Constant):
+                        self.optimized += 1
+                        value = -value
+                    else:
+                        value = token.Negative(value)
+                    continue
+                tok = self.tok
+                precedence = (BINARY_PRECEDENCE.get(tok.type)
+                              if tok is not None else None)
+                if kind == 'binary' and (precedence is None
+                                         or precedence <= stack[-1][3]):
+                    _, left, op, _ = stack.pop()
+                    if (self.optimize and isinstance(left, token.Constant)
+                            and isinstance(value, token.Constant)):
+                        self.optimized += 1
+                        value = CONSTANT_FOLDING[op](left, value)
+                    else:
+                        value = token.BinaryOperator(op, left, value)
+                    continue
+                if precedence is not None:
+                    self._advance()
+                    push(('binary', value, tok.type, precedence))
+                    assign = False
+                    break
+                if kind == 'assign':
+                    _, op, identifier = stack.pop()
+                    value = token.BinaryOperator(op, identifier, value)
+                    continue
+                # ここからは value が代入式 (assign_expr) 全体となる
+                if kind == 'call':
+                    _, identifier, arguments = stack[-1]
+                    arguments.add(value)
+                    if tok is not None and tok.type == 'COMMA':
+                        self._advance()
+                        assign = True
+                        break
+                    self._expect('RPAREN')
+                    stack.pop()
+                    value = token.FunctionExpression(
+                        identifier, arguments, identifier.lineno)
+                    continue
+                if kind == 'comma':
+                    expr = stack.pop()[1]
+                    expr.add(value)
+                    value = expr
+                    continue
+                # 括弧の中または式全体のカンマ演算子
+                if tok is not None and tok.type == 'COMMA':
+                    self._advance()
+                    push(('comma', value))
+                    assign = True
+                    break
+                if kind == 'paren':
+                    self._expect('RPAREN')
+                    stack.pop()
+                    continue
+                return value
+
+    def _identifier(self):
+        tok = self._expect('ID')
+        return token.Identifier(tok.value, tok.lineno)
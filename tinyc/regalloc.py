@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""スタック上の変数のレジスタ割り付け
+
+関数のスタック上の変数 ([ebp+n] の局所変数, パラメータ, 一時変数) を
+生存区間解析 (tinyc.dataflow) で干渉グラフにし, 優先度順の貪欲法で
+彩色する. eax は式の評価に用いるため, ecx, edx (呼び出し側が保存する)
+と ebx, esi, edi (呼び出された側が保存する) に割り付ける.
+レジスタを割り付けられなかった変数はスタック上に残すため,
+スピルのためのコードは必要ない.
+スタック上に残った局所変数と一時変数 ([ebp-n]) は, 同時に生存しないもの
+同士が同じメモリを共有するように彩色して, スタックフレームを縮める
+"""
+
+from __future__ import division, print_function, unicode_literals
+
+from tinyc import dataflow
+from tinyc.dataflow import CALLEE_SAVED, ECX, EDX
+
+
+# 割り付けに用いる呼び出し側が保存するレジスタ
+CALLER_SAVED = (ECX, EDX,)
+# ループの入れ子の深さごとの重みの上限
+MAX_DEPTH = 3
+
+
+def _members(bits):
+    """ビット列の立っているビットの位置を順に返す"""
+    i = 0
+    while bits:
+        if bits & 1:
+            yield i
+        bits >>= 1
+        i += 1
+
+
+class Allocation(object):
+    """1 つの関数のレジスタ割り付けの結果
+
+    registers は変数 (場所) -> レジスタ名,
+    saves は呼び出し側が保存するレジスタに割り付けた変数 -> 前後で
+    その変数のメモリに退避/復帰する call 命令のセルのリスト,
+    loads は入口でメモリからレジスタに読み込むパラメータのリスト,
+    callee_saved は入口で保存し出口で復帰するレジスタのリスト
+    """
+    def __init__(self):
+        self.registers = {}
+        self.saves = {}
+        self.loads = []
+        self.callee_saved = []
+
+
+class InterferenceGraph(object):
+    """スタック上の変数の干渉グラフ
+
+    neighbors は変数 -> 同時に生存する変数と, 生存中に値が書き換えられる
+    レジスタの集合 (call 命令による書き換えを除く).
+    calls は変数 -> 生存したまま実行する call 命令のセルと実行頻度のリスト,
+    weight は変数 -> 読み書きする命令の実行頻度の和.
+    実行頻度は入口を 1 とし, 条件分岐では等確率に分かれ,
+    ループの中では入れ子の深さごとに 10 倍になるものとして見積もる.
+    関数に追跡できない命令, esp 相対のアクセス, ebx/esi/edi を用いる命令が
+    あれば slots は None
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        self.slots = self._slots()
+        if self.slots is None:
+            return
+        self.neighbors = dict((s, set()) for s in self.slots)
+        self.calls = dict((s, []) for s in self.slots)
+        self.live_in = set()
+        self._build()
+
+    def _slots(self):
+        slots = set()
+        self.weight = {}
+        self.frequency = self._frequency()
+        for block in self.graph.order:
+            weight = self.frequency[block]
+            for cell in dataflow.instructions(block):
+                e = dataflow.effect(cell.line)
+                if dataflow.MEMORY in e.uses:
+                    return None
+                elif cell.line.op != 'ret' and any(
+                        l in CALLEE_SAVED for l in e.uses + e.defs):
+                    # すでに割り付けたレジスタがある
+                    return None
+                for l in set(e.uses + e.defs + e.partial):
+                    if isinstance(l, tuple):
+                        if l[0] != 'ebp':
+                            return None
+                        slots.add(l)
+                        self.weight[l] = self.weight.get(l, 0) + weight
+        return sorted(slots)
+
+    def _frequency(self):
+        """ブロック -> 実行頻度の見積もり"""
+        # 後退辺を除いた非巡回グラフでの頻度 (先行ブロックは逆後順で先に求まる)
+        acyclic = {}
+        frequency = {}
+        for block in self.graph.order:
+            if block is self.graph.entry:
+                f = 1.0
+            else:
+                f = sum(acyclic[p] / len(p.successors)
+                        for p in block.predecessors if p in acyclic)
+            acyclic[block] = f
+            depth = block.loop.depth if block.loop is not None else 0
+            frequency[block] = f * 10 ** min(depth, MAX_DEPTH)
+        return frequency
+
+    def _build(self):
+        # ebx, esi, edi は入口で保存するため, ret までの生存を考えない
+        registers = tuple(
+            r for r in dataflow.REGISTERS if r not in CALLEE_SAVED)
+        liveness = dataflow.Liveness(
+            self.graph, registers + tuple(self.slots))
+        locations = liveness.locations
+        index = dict((l, i) for i, l in enumerate(locations))
+        mask = liveness.mask
+        adjacency = [0] * len(locations)
+        slots = liveness.memory
+
+        for block in self.graph.order:
+            live = liveness.OUT[block]
+            weight = self.frequency[block]
+            for cell in reversed(list(dataflow.instructions(block))):
+                e = dataflow.effect(cell.line)
+                if cell.line.op == 'call':
+                    # call の前後で生存する変数 (呼び出し側で保存できる)
+                    for i in _members(live & slots & ~mask(e.defs)):
+                        self.calls[locations[i]].append((cell, weight))
+                else:
+                    for l in e.defs + e.partial:
+                        if l in index:
+                            adjacency[index[l]] |= live & ~liveness.bits[l]
+                live = (live & ~mask(e.defs)) | mask(e.uses)
+
+        # 入口で生存している変数 (パラメータ) は互いに干渉する
+        entry = liveness.IN[self.graph.entry] & slots
+        for i in _members(entry):
+            adjacency[i] |= entry & ~(1 << i)
+            self.live_in.add(locations[i])
+
+        for i, bits in enumerate(adjacency):
+            for j in _members(bits):
+                a, b = locations[i], locations[j]
+                if a in self.neighbors:
+                    self.neighbors[a].add(b)
+                if b in self.neighbors:
+                    self.neighbors[b].add(a)
+
+    def benefit(self, slot):
+        """レジスタに割り付けることで減るメモリアクセスの数 (実行頻度の和)"""
+        benefit = self.weight[slot]
+        if slot in self.live_in and slot[1] > 0:
+            # パラメータは入口でレジスタに読み込む
+            benefit -= 1
+        return benefit
+
+
+def allocate(graph):
+    """制御フローグラフの関数のレジスタ割り付けを返す (割り付けられなければ None)
+
+    変数は削減できるメモリアクセスの多い順に, 次の順でレジスタを選ぶ.
+
+    1. call を跨がない変数は ecx, edx
+    2. すでに用いている ebx, esi, edi
+    3. 新たな ebx, esi, edi
+    4. call の前後で退避/復帰しても削減できる場合は ecx, edx
+
+    最後に, 入口での保存と出口での復帰 (2 回のメモリアクセス) に見合わない
+    ebx, esi, edi の割り付けを取り消す
+    """
+    interference = InterferenceGraph(graph)
+    if interference.slots is None:
+        return None
+
+    allocation = Allocation()
+    registers = allocation.registers
+    order = sorted(interference.slots,
+                   key=lambda s: (-interference.benefit(s), s))
+    for slot in order:
+        benefit = interference.benefit(slot)
+        if benefit <= 0:
+            continue
+        neighbors = interference.neighbors[slot]
+        taken = set(registers[n] for n in neighbors if n in registers)
+        taken |= neighbors
+        calls = interference.calls[slot]
+        used = set(registers.values())
+
+        candidates = []
+        if not calls:
+            candidates += CALLER_SAVED
+        candidates += [r for r in CALLEE_SAVED if r in used]
+        candidates += [r for r in CALLEE_SAVED if r not in used]
+        if calls and benefit > 2 * sum(w for c, w in calls):
+            candidates += CALLER_SAVED
+        for register in candidates:
+            if register not in taken:
+                registers[slot] = register
+                if register in CALLER_SAVED and calls:
+                    allocation.saves[slot] = [c for c, w in calls]
+                break
+
+    for register in CALLEE_SAVED:
+        slots = [s for s in registers if registers[s] == register]
+        if not slots:
+            continue
+        if sum(interference.benefit(s) for s in slots) <= 2:
+            for s in slots:
+                del registers[s]
+        else:
+            allocation.callee_saved.append(register)
+
+    allocation.loads = sorted(
+        s for s in registers if s in interference.live_in and s[1] > 0)
+    return allocation
+
+
+def colour_slots(graph):
+    """局所変数と一時変数 ([ebp-n]) -> 新しい ebp からの offset を返す
+
+    同時に生存しない変数に同じメモリを割り当て, 関数の中で最初に
+    現れる順に, 干渉する変数が使っていない最も上のメモリを選ぶ.
+    関数に追跡できない命令や esp 相対のアクセスがあれば None
+    """
+    slots = []
+    for block in graph.order:
+        for cell in dataflow.instructions(block):
+            e = dataflow.effect(cell.line)
+            if dataflow.MEMORY in e.uses:
+                return None
+            for l in e.uses + e.defs + e.partial:
+                if isinstance(l, tuple):
+                    if l[0] != 'ebp':
+                        return None
+                    elif l[1] < 0 and l not in slots:
+                        slots.append(l)
+
+    liveness = dataflow.Liveness(graph, slots)
+    index = dict((l, i) for i, l in enumerate(slots))
+    mask = liveness.mask
+    adjacency = [0] * len(slots)
+    for block in graph.order:
+        live = liveness.OUT[block]
+        for cell in reversed(list(dataflow.instructions(block))):
+            e = dataflow.effect(cell.line)
+            for l in e.defs + e.partial:
+                if l in index:
+                    adjacency[index[l]] |= live & ~liveness.bits[l]
+            live = (live & ~mask(e.defs)) | mask(e.uses)
+    # 入口で生存している変数 (初期化前に読み出す変数) は互いに干渉する
+    entry = liveness.IN[graph.entry]
+    for i in _members(entry):
+        adjacency[i] |= entry & ~(1 << i)
+    for i, bits in enumerate(list(adjacency)):
+        for j in _members(bits):
+            adjacency[j] |= 1 << i
+
+    colours = []
+    for i, slot in enumerate(slots):
+        taken = set(colours[j]
+                    for j in _members(adjacency[i] & ((1 << i) - 1)))
+        colour = 0
+        while colour in taken:
+            colour += 1
+        colours.append(colour)
+    return dict((slot, -4 * (colour + 1))
+                for slot, colour in zip(slots, colours))
@@ -1,14 +1,25 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-"""構文木を作成するためのトークンのクラスをまとめたモジュール"""
+"""構文木を作成するためのトークンのクラスをまとめたモジュール
+
+構文木は入力の大きさに比例して最も多くのメモリを使うため, すべてのノードは
+__slots__ を用いて __dict__ を持たない. 意味解析器やコード生成器が
+ノードに追加する属性も, 各クラスの __slots__ で宣言しておく必要がある
+"""
 
 from __future__ import unicode_literals
 
 from tinyc.common import Kinds
 
 
+# インスタンスを共有する定数の値の範囲 (両端を含む)
+SHARED_CONSTANTS = (-5, 256)
+
+
 class Node(object):
+    __slots__ = ()
+
     def is_null(self):
         return 0
 
@@ -16,36 +27,52 @@ class Node(object):
         return None
 
     def accept(self, analyzer):
-        self._accept(self.__class__, analyzer)
-
-    def _accept(self, klass, analyzer):
-        # 解析器の a_<クラス名> のメソッドを検索して実行する
-        # 存在しない場合はノードのスーパークラスを順に辿って探す
-        # print('DEBUG:', klass.__name__)
-        method = getattr(analyzer, "a_%s" % klass.__name__, None)
-        if method is None:
-            bases = klass.__bases__
-            last = None
-            for i in bases:
-                last = self._accept(i, analyzer)
-            return last
-        else:
-            return method(self)
+        # 解析器の a_<クラス名> のメソッドを実行する (Analyzer.visit を参照)
+        analyzer.visit(self)
 
 
 class NullNode(Node):
+    __slots__ = ()
+
     def is_null(self):
         return 1
 
 
 class Identifier(Node):
+    __slots__ = (
+        'name', 'lineno', 'kind',
+        # 意味解析 (SymbolAnalyzer, FunctionAnalyzer, ParameterAnalyzer,
+        # RegisterAnalyzer) で追加する属性
+        'symbol', 'level', 'parameters', 'offset', 'registers',
+        # コード生成 (NASM, LLVM) で追加する属性
+        'label', 'gv', 'memory', 'ir',
+    )
+
     def __init__(self, name, lineno):
-        self.name = name
+        # 同じ名前の識別子で文字列を共有する
+        self.name = intern(name) if isinstance(name, str) else name
         self.lineno = lineno
         self.kind = Kinds.fresh
 
 
 class Constant(Node):
+    """定数
+
+    値が SHARED_CONSTANTS の範囲にあるインスタンスは共有されるため,
+    出現箇所ごとに異なる値の属性を追加してはならない
+    """
+    __slots__ = ('value', 'registers', 'ir',)
+
+    _shared = {}
+
+    def __new__(cls, value):
+        if SHARED_CONSTANTS[0] <= value <= SHARED_CONSTANTS[1]:
+            constant = cls._shared.get(value)
+            if constant is None:
+                constant = cls._shared[value] = super(Constant, cls).__new__(cls)
+            return constant
+        return super(Constant, cls).__new__(cls)
+
     def __init__(self, value):
         self.value = value
 
@@ -120,38 +147,48 @@ class Constant(Node):
 
 
 class Declaration(Node):
+    __slots__ = ('declarators',)
+
     def __init__(self, declarators):
         self.declarators = declarators
 
 
 class ParameterDeclaration(Node):
+    __slots__ = ('declarator',)
+
     def __init__(self, declarator):
         self.declarator = declarator
 
 
 class Declarator(Node):
+    __slots__ = ('identifier',)
+
     def __init__(self, identifier):
         self.identifier = identifier
 
 
 class UnaryOperator(Node):
+    __slots__ = ('expr', 'registers', 'ir',)
+
     def __init__(self, node):
         self.expr = node
 
 
 class Negative(UnaryOperator):
-    pass
+    __slots__ = ()
 
 
 class Increment(UnaryOperator):
-    pass
+    __slots__ = ()
 
 
 class Decrement(UnaryOperator):
-    pass
+    __slots__ = ()
 
 
 class BinaryOperator(Node):
+    __slots__ = ('op', 'left', 'right', 'registers', 'ir',)
+
     def __init__(self, op, left, right):
         self.op = op
         self.left = left
@@ -159,6 +196,8 @@ class BinaryOperator(Node):
 
 
 class IfStatement(Node):
+    __slots__ = ('expr', 'then_statement', 'else_statement',)
+
     def __init__(self, expr, then_statement, else_statement):
         self.expr = expr
         self.then_statement = then_statement
@@ -166,17 +205,32 @@ class IfStatement(Node):
 
 
 class ReturnStatement(Node):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
 
+class TailJump(Node):
+    """関数の先頭 (パラメータを読み込んだ後) に戻る文
+
+    構文解析器は作らず, TailRecursion が自身の末尾呼び出しを
+    パラメータへの代入とこの文に置き換える
+    """
+    __slots__ = ()
+
+
 class WhileLoop(Node):
+    __slots__ = ('expr', 'statement',)
+
     def __init__(self, expr, statement):
         self.expr = expr
         self.statement = statement
 
 
 class NodeList(Node):
+    __slots__ = ('nodes',)
+
     def __init__(self, node=None):
         if node is None:
             self.nodes = []
@@ -194,30 +248,32 @@ class NodeList(Node):
 
 
 class ExternalDeclarationList(NodeList):
-    pass
+    __slots__ = ('current_table',)
 
 
 class DeclaratorList(NodeList):
-    pass
+    __slots__ = ()
 
 
 class ParameterTypeList(NodeList):
-    pass
+    __slots__ = ()
 
 
 class DeclarationList(NodeList):
-    pass
+    __slots__ = ()
 
 
 class StatementList(NodeList):
-    pass
+    __slots__ = ()
 
 
 class ArgumentExpressionList(NodeList):
-    pass
+    __slots__ = ()
 
 
 class FunctionExpression(Node):
+    __slots__ = ('function', 'argument_list', 'lineno', 'registers', 'ir',)
+
     def __init__(self, function, argument_list, lineno=0):
         self.function = function
         self.argument_list = argument_list
@@ -226,12 +282,19 @@ class FunctionExpression(Node):
 
 
 class CompoundStatement(Node):
+    __slots__ = ('declaration_list', 'statement_list', 'table',)
+
     def __init__(self, declaration_list, statement_list):
         self.declaration_list = declaration_list
         self.statement_list = statement_list
 
 
 class FunctionDefinition(Node):
+    __slots__ = (
+        'declarator', 'parameter_type_list', 'compound_statement', 'table',
+        # TailRecursion で追加する属性 (置き換えた末尾呼び出しの数)
+        'tail_calls',)
+
     def __init__(self, declarator, parameter_type_list, compound_statement):
         self.declarator = declarator
         self.parameter_type_list = parameter_type_list
@@ -0,0 +1,888 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""構文木の変換による最適化をまとめたモジュール
+
+意味解析の後, コード生成の前に構文木をその場で書き換える.
+NASM と LLVM のどちらのコード生成器にも同じ構文木を渡すため,
+変換は生成するコードの形式によらない.
+深い構文木でも再帰の上限に達しないように, 走査は Analyzer.visit か
+明示的なスタックで行う
+"""
+
+from __future__ import print_function, unicode_literals
+
+from tinyc import token
+from tinyc.analyzer import Analyzer
+from tinyc.common import Kinds
+
+
+# 式ではない文のノード
+STATEMENTS = (
+    token.CompoundStatement, token.IfStatement, token.NullNode,
+    token.ReturnStatement, token.TailJump, token.WhileLoop,)
+
+# 代入演算子
+ASSIGNMENTS = ('ASSIGN', 'ASSIGN_PLUS', 'ASSIGN_MINUS',)
+
+# 算術演算子
+ARITHMETIC = ('PLUS', 'MINUS', 'MULT', 'DIV',)
+
+
+def _get(slot):
+    """slot (ノードと属性名, またはリストと添字の組) の値"""
+    container, key = slot
+    if isinstance(key, int):
+        return container[key]
+    return getattr(container, key)
+
+
+def _set(slot, value):
+    container, key = slot
+    if isinstance(key, int):
+        container[key] = value
+    else:
+        setattr(container, key, value)
+
+
+def _children(node):
+    """式のノードの子ノードの slot"""
+    if isinstance(node, token.BinaryOperator):
+        return ((node, 'left',), (node, 'right',),)
+    elif isinstance(node, token.UnaryOperator):
+        return ((node, 'expr',),)
+    elif isinstance(node, token.FunctionExpression):
+        nodes = node.argument_list.nodes
+        return tuple((nodes, i,) for i in range(len(nodes)))
+    return ()
+
+
+def _walk(root):
+    """式の各ノードを行きがけ順に返す"""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(_get(slot) for slot in reversed(_children(node)))
+
+
+def _key(root):
+    """同じ値になる式が等しくなるキー (行きがけ順のノードの列)"""
+    key = []
+    for node in _walk(root):
+        if isinstance(node, token.Identifier):
+            key.append(id(node))
+        elif isinstance(node, token.Constant):
+            key.append(('constant', node.value,))
+        elif isinstance(node, token.BinaryOperator):
+            key.append(node.op)
+        else:
+            key.append(node.__class__.__name__)
+    return tuple(key)
+
+
+# 複製せずに共有するノード (識別子は宣言のノードを指し, 定数は値ごとに共有される)
+SHARED = (token.Identifier, token.Constant, token.NullNode,)
+
+_SLOTS = {}
+
+
+def _slot_names(cls):
+    """クラスとその基底クラスの __slots__ の属性名"""
+    names = _SLOTS.get(cls)
+    if names is None:
+        names = _SLOTS[cls] = tuple(
+            name for klass in reversed(cls.__mro__)
+            for name in getattr(klass, '__slots__', ()))
+    return names
+
+
+def _node_slots(node):
+    """文または式のノードの, 複製する (共有しない) 子ノードの slot"""
+    if isinstance(node, token.NodeList):
+        slots = [(node.nodes, i,) for i in range(len(node.nodes))]
+    else:
+        slots = [(node, name,) for name in _slot_names(node.__class__)
+                 if hasattr(node, name)]
+    return [slot for slot in slots
+            if isinstance(_get(slot), token.Node)
+            and not isinstance(_get(slot), SHARED)]
+
+
+def _copy(node):
+    """ノードの浅い複製"""
+    cls = node.__class__
+    copy = cls.__new__(cls)
+    for name in _slot_names(cls):
+        if hasattr(node, name):
+            setattr(copy, name, getattr(node, name))
+    if isinstance(node, token.NodeList):
+        copy.nodes = list(node.nodes)
+    return copy
+
+
+def _clone(root):
+    """文の構文木の複製 (識別子と定数は複製せずに共有する)"""
+    if root is None or isinstance(root, SHARED):
+        return root
+    root = _copy(root)
+    stack = [root]
+    while stack:
+        for slot in _node_slots(stack.pop()):
+            copy = _copy(_get(slot))
+            _set(slot, copy)
+            stack.append(copy)
+    return root
+
+
+def _size(root):
+    """文の構文木の (共有するノードを含む) ノードの数"""
+    size = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, token.Node):
+            continue
+        size += 1
+        if isinstance(node, token.NodeList):
+            stack.extend(node.nodes)
+        elif not isinstance(node, SHARED):
+            stack.extend(getattr(node, name, None)
+                         for name in _slot_names(node.__class__))
+    return size
+
+
+class _Loop(object):
+    """_LoopTransformer で解析中のループ
+
+    assigned はループ内で代入される変数, declared はループ内で宣言される変数,
+    calls はループ内に関数呼び出しがあるか, roots はループの本体と条件式で
+    (内側のループを除いて) 1 回の繰り返しごとに評価する式の slot,
+    assignments はループ内の代入, ++, -- のノード,
+    expression_statements はループ内の式文の (slot, 式) のリスト,
+    preheaders は内側のループの前に移した (一時変数, 代入の式, 代入を含む文のリスト),
+    hoisted はループの前で一時変数に代入する (一時変数, 代入の式) のリスト,
+    temporaries は移した式のキー (_key) から一時変数への表,
+    statements はループを置き換える文のリスト (代入とループなど),
+    slot はループの文の slot
+    """
+    def __init__(self, node, slot):
+        self.node = node
+        self.slot = slot
+        self.assigned = set()
+        self.declared = set()
+        self.calls = False
+        self.roots = []
+        self.assignments = []
+        self.expression_statements = []
+        self.preheaders = []
+        self.hoisted = []
+        self.temporaries = {}
+        self.statements = None
+
+
+class _Transformer(Analyzer):
+    """一時変数を用いる変換の基底クラス
+
+    一時変数は関数の先頭で宣言する. 一時変数の名前は <prefix>.N とする
+    """
+    prefix = None
+
+    def __init__(self):
+        super(_Transformer, self).__init__()
+        self.optimized = 0
+
+    def start(self):
+        self.temporaries = 0
+
+    def a_FunctionDefinition(self, node):
+        # 一時変数の宣言
+        self.declarators = token.DeclaratorList()
+        yield node.compound_statement
+        if self.declarators.nodes:
+            compound = node.compound_statement
+            if compound.declaration_list.is_null():
+                compound.declaration_list = token.DeclarationList()
+            compound.declaration_list.add(token.Declaration(self.declarators))
+
+    def _new_temporary(self):
+        """関数の先頭で宣言する一時変数の識別子を作る"""
+        temporary = token.Identifier(
+            '{0}.{1}'.format(self.prefix, self.temporaries), 0)
+        temporary.kind = Kinds.variable
+        self.temporaries += 1
+        self.declarators.add(token.Declarator(temporary))
+        return temporary
+
+
+class _LoopTransformer(_Transformer):
+    """while ループを内側から順に書き換える変換の基底クラス
+
+    ループごとに本体を訪問し終えてから transform_loop を呼び出す.
+    transform_loop で loop.hoisted に加えた代入はループの直前に置き,
+    loop.statements に設定した文のリストはループを置き換える
+    """
+    def start(self):
+        super(_LoopTransformer, self).start()
+        # 解析中のループのスタック
+        self.loops = []
+        # 書き換えたループのノードから, ループを置き換える文のリストへの表
+        self.replaced = {}
+
+    def a_StatementList(self, node):
+        for i in range(len(node.nodes)):
+            yield self._statement((node.nodes, i,))
+
+    def a_IfStatement(self, node):
+        self._expression((node, 'expr',))
+        yield self._statement((node, 'then_statement',))
+        yield self._statement((node, 'else_statement',))
+
+    def a_ReturnStatement(self, node):
+        self._expression((node, 'expr',))
+
+    def a_Declarator(self, node):
+        if self.loops:
+            self.loops[-1].declared.add(node.identifier)
+
+    def a_WhileLoop(self, node):
+        loop = _Loop(node, self.slot)
+        self.loops.append(loop)
+        self._expression((node, 'expr',))
+        yield self._statement((node, 'statement',))
+        self.loops.pop()
+
+        self.transform_loop(loop)
+        if loop.hoisted:
+            loop.statements = token.StatementList()
+            loop.statements.nodes = [a for _, a in loop.hoisted] + [loop.node]
+        if loop.statements is not None:
+            self.replaced[loop.node] = loop.statements
+        if self.loops:
+            self.merge_loop(self.loops[-1], loop)
+
+    def transform_loop(self, loop):
+        """内側のループを処理した後に, loop を書き換える"""
+        raise NotImplementedError
+
+    def merge_loop(self, outer, loop):
+        """内側のループ loop の情報を外側のループ outer に加える"""
+        outer.assigned |= loop.assigned
+        outer.declared |= loop.declared
+        outer.calls = outer.calls or loop.calls
+        outer.assignments.extend(loop.assignments)
+        outer.expression_statements.extend(loop.expression_statements)
+        # ループの前の一時変数への代入は外側のループの本体の文になる
+        for temporary, assignment in loop.hoisted:
+            outer.assigned.add(temporary)
+            outer.assignments.append(assignment)
+
+    def _statement(self, slot):
+        """slot の文を訪問し, 書き換えたループを置き換える"""
+        statement = _get(slot)
+        if not isinstance(statement, STATEMENTS):
+            # 式文
+            if self.loops:
+                self.loops[-1].expression_statements.append(
+                    (slot, statement,))
+            self._expression(slot)
+            return
+        # a_WhileLoop で用いる
+        self.slot = slot
+        yield statement
+        if isinstance(statement, token.WhileLoop):
+            statements = self.replaced.pop(statement, None)
+            if statements is not None:
+                _set(slot, token.CompoundStatement(
+                    token.DeclarationList(), statements))
+
+    def _expression(self, slot):
+        """ループ内で評価する式を記録し, 代入される変数と関数呼び出しを調べる"""
+        if not self.loops:
+            return
+        loop = self.loops[-1]
+        loop.roots.append(slot)
+        for node in _walk(_get(slot)):
+            if isinstance(node, token.BinaryOperator):
+                if node.op in ASSIGNMENTS:
+                    loop.assigned.add(node.left)
+                    loop.assignments.append(node)
+            elif isinstance(node, (token.Increment, token.Decrement,)):
+                loop.assigned.add(node.expr)
+                loop.assignments.append(node)
+            elif isinstance(node, token.FunctionExpression):
+                loop.calls = True
+
+    def _invariant_variable(self, loop, node):
+        if node.kind not in (Kinds.variable, Kinds.parameter):
+            return False
+        if node in loop.assigned or node in loop.declared:
+            return False
+        # 呼び出した関数がグローバル変数に代入するかもしれない
+        return not (loop.calls and node.kind == Kinds.variable
+                    and getattr(node, 'level', None) == 0)
+
+
+class LoopInvariantMotion(_LoopTransformer):
+    """ループ不変式の移動 (LICM)
+
+    while ループの本体と条件式のうち, ループ内で代入されない変数と定数だけから
+    なる算術式を, ループの直前で一時変数に代入し, ループ内ではその一時変数を
+    読み出す. 副作用のある式 (代入, ++, --, 関数呼び出し) は移動せず,
+    ループ内に関数呼び出しがある場合はグローバル変数を不変とみなさない.
+    除算はループを 1 回も実行しない場合にも評価されるため, 0 と -1 以外の
+    定数で割る場合だけ移動する.
+
+    内側のループから順に処理し, 内側のループの前に移した代入の式も
+    外側のループで不変であればさらに外に移す. 一時変数は関数の先頭で宣言する.
+    移した式の数を optimized に数える
+    """
+    prefix = 'licm'
+
+    def merge_loop(self, outer, loop):
+        super(LoopInvariantMotion, self).merge_loop(outer, loop)
+        for temporary, assignment in loop.hoisted:
+            outer.preheaders.append(
+                (temporary, assignment, loop.statements,))
+
+    def transform_loop(self, loop):
+        for temporary, assignment, statements in loop.preheaders:
+            invariant, variables = self._invariance(loop, assignment.right)
+            if self._hoistable(assignment.right, invariant, variables):
+                # 内側のループの前の代入ごとこのループの前に移す
+                statements.nodes.remove(assignment)
+                loop.hoisted.append((temporary, assignment,))
+            else:
+                self._replace(loop, (assignment, 'right',), invariant, variables)
+        for slot in loop.roots:
+            invariant, variables = self._invariance(loop, _get(slot))
+            self._replace(loop, slot, invariant, variables)
+
+    def _invariance(self, loop, root):
+        """式の各ノードがループ不変か (invariant) と変数を含むか (variables) の表
+
+        表のキーはノードの id で, 子ノードから順に (帰りがけ順に) 求める
+        """
+        invariant = {}
+        variables = {}
+        for node in reversed(list(_walk(root))):
+            key = id(node)
+            if isinstance(node, token.Constant):
+                invariant[key] = True
+                variables[key] = False
+            elif isinstance(node, token.Identifier):
+                invariant[key] = self._invariant_variable(loop, node)
+                variables[key] = True
+            elif (isinstance(node, token.BinaryOperator)
+                    and node.op not in ASSIGNMENTS):
+                left, right = id(node.left), id(node.right)
+                invariant[key] = invariant[left] and invariant[right]
+                if node.op == 'DIV':
+                    invariant[key] = (invariant[key]
+                                      and isinstance(node.right, token.Constant)
+                                      and node.right.value not in (0, -1))
+                variables[key] = variables[left] or variables[right]
+            elif isinstance(node, token.Negative):
+                invariant[key] = invariant[id(node.expr)]
+                variables[key] = variables[id(node.expr)]
+            else:
+                invariant[key] = False
+                variables[key] = True
+        return invariant, variables
+
+    def _hoistable(self, node, invariant, variables):
+        """ループの前に移す算術式か
+
+        比較と論理演算はもともと条件分岐になるため移さない
+        """
+        key = id(node)
+        return (invariant[key] and variables[key]
+                and (isinstance(node, token.Negative)
+                     or (isinstance(node, token.BinaryOperator)
+                         and node.op in ARITHMETIC)))
+
+    def _replace(self, loop, slot, invariant, variables):
+        """slot の式の, ループ不変な極大の算術式を一時変数に置き換える"""
+        # 行きがけ順に, 移せる式を置き換えて, その子ノードは辿らない
+        stack = [slot]
+        while stack:
+            slot = stack.pop()
+            node = _get(slot)
+            if self._hoistable(node, invariant, variables):
+                _set(slot, self._temporary(loop, node))
+            else:
+                stack.extend(reversed(_children(node)))
+
+    def _temporary(self, loop, node):
+        """node の値を代入する一時変数を作り, 一時変数の識別子を返す
+
+        同じループから移した等しい式には同じ一時変数を用いる
+        """
+        key = _key(node)
+        temporary = loop.temporaries.get(key)
+        if temporary is None:
+            temporary = loop.temporaries[key] = self._new_temporary()
+            loop.hoisted.append(
+                (temporary, token.BinaryOperator('ASSIGN', temporary, node),))
+        self.optimized += 1
+        self.logger.info('Hoist: loop invariant expression to ' +
+                         temporary.name)
+        return temporary
+
+
+def _signed(value):
+    """32 ビットの符号付き整数に丸めた値"""
+    return (value + 0x80000000) % 0x100000000 - 0x80000000
+
+
+def _step(node):
+    """帰納変数を更新する式 (++i, --i, i += c, i -= c) の増分 (それ以外は None)"""
+    if isinstance(node, token.Increment):
+        return 1
+    elif isinstance(node, token.Decrement):
+        return -1
+    elif isinstance(node.right, token.Constant):
+        if node.op == 'ASSIGN_PLUS':
+            return node.right.value
+        elif node.op == 'ASSIGN_MINUS':
+            return -node.right.value
+    return None
+
+
+class StrengthReduction(_LoopTransformer):
+    """帰納変数の強さの低減
+
+    while ループ内で ++i, --i, i += c, i -= c (c は定数) の式文だけで
+    更新される変数 i を帰納変数とし, i * k (k は定数かループ内で代入されない
+    変数) と, それに定数か不変な変数 a を加減した a + i * k, i * k + a,
+    i * k - a, a - i * k を, ループの直前で一時変数に代入する.
+    ループ内では式を一時変数の読み出しに置き換え, i を更新する文の直後で
+    一時変数に c * k を加えるため, 繰り返しごとの乗算が加算になる.
+
+    外側のループの帰納変数を用いる内側のループの式も置き換える.
+    置き換えた式の数を optimized に数える
+    """
+    prefix = 'sr'
+
+    def a_FunctionDefinition(self, node):
+        # 帰納変数を更新する式文のノードから, その式文を置き換えた
+        # 複文の文のリスト (一時変数の更新を後ろに加える) への表
+        self.updates = {}
+        return super(StrengthReduction, self).a_FunctionDefinition(node)
+
+    def merge_loop(self, outer, loop):
+        super(StrengthReduction, self).merge_loop(outer, loop)
+        # 外側のループの帰納変数は内側のループの中でも一時変数と対応する
+        outer.roots.extend(loop.roots)
+
+    def transform_loop(self, loop):
+        variables = self._induction_variables(loop)
+        if not variables:
+            return
+        for slot in loop.roots:
+            # 行きがけ順に, 置き換えた式の子ノードは辿らない
+            stack = [slot]
+            while stack:
+                slot = stack.pop()
+                node = _get(slot)
+                linear = self._linear(loop, node, variables)
+                if linear is None:
+                    stack.extend(reversed(_children(node)))
+                else:
+                    _set(slot, self._temporary(loop, node, variables, *linear))
+
+    def _induction_variables(self, loop):
+        """帰納変数から, 更新する式文の (slot, 式, 増分) のリストへの表"""
+        slots = dict((id(node), slot)
+                     for slot, node in loop.expression_statements)
+        updates = {}
+        excluded = set()
+        for node in loop.assignments:
+            if isinstance(node, token.BinaryOperator):
+                variable = node.left
+            else:
+                variable = node.expr
+            step = _step(node)
+            if step is None or id(node) not in slots:
+                excluded.add(variable)
+            else:
+                updates.setdefault(variable, []).append(
+                    (slots[id(node)], node, step,))
+        variables = {}
+        for variable, steps in updates.items():
+            if (variable not in excluded and variable not in loop.declared
+                    and variable.kind in (Kinds.variable, Kinds.parameter)
+                    and not (loop.calls and variable.kind == Kinds.variable
+                             and getattr(variable, 'level', None) == 0)):
+                variables[variable] = steps
+        return variables
+
+    def _factor(self, loop, node):
+        """ループ内で値の変わらない定数か変数か"""
+        return (isinstance(node, token.Constant)
+                or (isinstance(node, token.Identifier)
+                    and self._invariant_variable(loop, node)))
+
+    def _product(self, loop, node, variables):
+        """node が i * k, k * i ならば (i, k), それ以外は None"""
+        if not (isinstance(node, token.BinaryOperator) and node.op == 'MULT'):
+            return None
+        if node.left in variables and self._factor(loop, node.right):
+            return (node.left, node.right,)
+        if node.right in variables and self._factor(loop, node.left):
+            return (node.right, node.left,)
+        return None
+
+    def _linear(self, loop, node, variables):
+        """node が帰納変数の 1 次式ならば (帰納変数, 係数, 符号), それ以外は None
+
+        1 次式の値は (符号) * (係数) * (帰納変数) + (定数項) となる
+        """
+        product = self._product(loop, node, variables)
+        if product is not None:
+            return product + (1,)
+        if not (isinstance(node, token.BinaryOperator)
+                and node.op in ('PLUS', 'MINUS',)):
+            return None
+        if self._factor(loop, node.right):
+            product = self._product(loop, node.left, variables)
+            if product is not None:
+                return product + (1,)
+        if self._factor(loop, node.left):
+            product = self._product(loop, node.right, variables)
+            if product is not None:
+                return product + ((1 if node.op == 'PLUS' else -1),)
+        return None
+
+    def _temporary(self, loop, node, variables, variable, factor, sign):
+        """1 次式 node の値を保持する一時変数を作り, 一時変数の識別子を返す
+
+        同じループの等しい式には同じ一時変数を用いる
+        """
+        key = _key(node)
+        temporary = loop.temporaries.get(key)
+        if temporary is None:
+            temporary = loop.temporaries[key] = self._new_temporary()
+            loop.hoisted.append(
+                (temporary, token.BinaryOperator('ASSIGN', temporary, node),))
+            for slot, update, step in variables[variable]:
+                increment = self._increment(loop, sign * step, factor)
+                if increment is not None:
+                    self._add_update(slot, update, token.BinaryOperator(
+                        increment[0], temporary, increment[1]))
+        self.optimized += 1
+        self.logger.info('Reduce: induction variable expression to ' +
+                         temporary.name)
+        return temporary
+
+    def _increment(self, loop, step, factor):
+        """帰納変数が step 増えたときの一時変数の更新 (演算子, 式) の組
+
+        係数 factor が変数で step が 1, -1 でない場合は, step * factor を
+        ループの前で別の一時変数に求めておく. 更新が不要な場合は None
+        """
+        if isinstance(factor, token.Constant):
+            value = _signed(step * factor.value)
+            if value == 0:
+                return None
+            return ('ASSIGN_PLUS', token.Constant(value),)
+        if step == 1:
+            return ('ASSIGN_PLUS', factor,)
+        elif step == -1:
+            return ('ASSIGN_MINUS', factor,)
+        key = ('step', id(factor), step,)
+        temporary = loop.temporaries.get(key)
+        if temporary is None:
+            temporary = loop.temporaries[key] = self._new_temporary()
+            loop.hoisted.append((temporary, token.BinaryOperator(
+                'ASSIGN', temporary, token.BinaryOperator(
+                    'MULT', token.Constant(_signed(step)), factor)),))
+        return ('ASSIGN_PLUS', temporary,)
+
+    def _add_update(self, slot, update, statement):
+        """帰納変数を更新する式文 update の直後に statement を加える
+
+        式文は文のリストの添字をずらさないように, 式文と追加する文からなる
+        複文で置き換える
+        """
+        statements = self.updates.get(update)
+        if statements is None:
+            statements = self.updates[update] = token.StatementList(update)
+            _set(slot, token.CompoundStatement(
+                token.DeclarationList(), statements))
+        statements.add(statement)
+
+
+# 比較演算子の左右を入れ替えた演算子
+MIRRORED = {'LT': 'GT', 'LTE': 'GTE', 'GT': 'LT', 'GTE': 'LTE'}
+
+
+class LoopUnrolling(_LoopTransformer):
+    """繰り返し回数の決まったループの展開
+
+    while (i < N) { ...; ++i; } の形 (比較は <, <=, >, >=, 最後の文は
+    ++i, --i, i += c, i -= c のいずれか) で, i がその文でだけ更新され,
+    N が定数かループ内で代入されない変数のループを展開する.
+    ループ内で変数を宣言する場合は展開しない.
+
+    直前の文が i = C で N が定数ならば繰り返し回数が分かるため, full 回以下
+    ならループを本体の複製の並びに置き換え, それより多ければ本体を factor 個
+    並べたループと, 残りの回数の本体の複製にする. 繰り返し回数が分からない
+    場合は, 残りの繰り返しが factor 回以上ある間 (i < N && N - i > (factor - 1) * c)
+    だけ繰り返す展開したループの後に, 残りを行う元のループを置く.
+    N - i がオーバーフローする場合は元のループがすべての繰り返しを行う.
+
+    展開後の本体の大きさ (構文木のノード数) が budget を超えないように
+    factor を減らし, 2 未満になれば展開しない. 展開したループの数を
+    optimized に数える
+    """
+    def __init__(self, factor=4, full=8, budget=256):
+        super(LoopUnrolling, self).__init__()
+        self.factor = factor
+        self.full = full
+        self.budget = budget
+
+    def transform_loop(self, loop):
+        counted = self._counted(loop)
+        if counted is None:
+            return
+        variable, op, limit, step = counted
+        body = loop.node.statement
+        size = _size(body.statement_list)
+        trips = self._trip_count(loop, variable, op, limit, step)
+
+        if (trips is not None and trips <= self.full
+                and size * trips <= self.budget):
+            loop.statements = self._copies(body, trips)
+            self.optimized += 1
+            self.logger.info(
+                'Unroll: loop completely ({0} iterations)'.format(trips))
+            return
+
+        factor = min(self.factor, self.budget // size)
+        if factor < 2:
+            return
+        if trips is not None:
+            # 展開したループで factor * (trips // factor) 回繰り返す
+            main, remainder = divmod(trips, factor)
+            statements = token.StatementList()
+            if main > 0:
+                end = _signed(self._start(loop, variable).value
+                              + main * factor * step)
+                statements.add(token.WhileLoop(
+                    token.BinaryOperator(
+                        'LT' if step > 0 else 'GT', variable,
+                        token.Constant(end)),
+                    token.CompoundStatement(
+                        token.DeclarationList(),
+                        self._copies(body, factor, share=False))))
+            statements.nodes.extend(self._copies(body, remainder).nodes)
+        else:
+            distance = abs(step) * (factor - 1)
+            if distance > 0x7fffffff:
+                return
+            if step > 0:
+                difference = token.BinaryOperator('MINUS', limit, variable)
+            else:
+                difference = token.BinaryOperator('MINUS', variable, limit)
+            expr = token.BinaryOperator(
+                'LAND', token.BinaryOperator(op, variable, limit),
+                token.BinaryOperator('GT' if op in ('LT', 'GT',) else 'GTE',
+                                     difference, token.Constant(distance)))
+            statements = token.StatementList(token.WhileLoop(
+                expr, token.CompoundStatement(
+                    token.DeclarationList(),
+                    self._copies(body, factor, share=False))))
+            # 残りの繰り返し
+            statements.add(loop.node)
+        loop.statements = statements
+        self.optimized += 1
+        self.logger.info('Unroll: loop by {0}'.format(factor))
+
+    def _counted(self, loop):
+        """繰り返し回数の決まったループならば (i, 比較演算子, N, 増分) を返す
+
+        比較演算子は i を左辺にした場合のもの. それ以外は None を返す
+        """
+        node = loop.node
+        body = node.statement
+        if loop.declared or not isinstance(body, token.CompoundStatement):
+            return None
+        statements = body.statement_list
+        if statements.is_null() or not statements.nodes:
+            return None
+        update = statements.nodes[-1]
+        if isinstance(update, (token.Increment, token.Decrement,)):
+            variable = update.expr
+        elif (isinstance(update, token.BinaryOperator)
+                and update.op in ASSIGNMENTS):
+            variable = update.left
+        else:
+            return None
+        step = _step(update)
+        if not step:
+            return None
+        for assignment in loop.assignments:
+            if assignment is not update and variable is (
+                    assignment.left
+                    if isinstance(assignment, token.BinaryOperator)
+                    else assignment.expr):
+                return None
+        if (variable.kind not in (Kinds.variable, Kinds.parameter)
+                or (loop.calls and variable.kind == Kinds.variable
+                    and getattr(variable, 'level', None) == 0)):
+            return None
+
+        expr = node.expr
+        if not (isinstance(expr, token.BinaryOperator)
+                and expr.op in MIRRORED):
+            return None
+        if expr.left is variable:
+            op, limit = expr.op, expr.right
+        elif expr.right is variable:
+            op, limit = MIRRORED[expr.op], expr.left
+        else:
+            return None
+        if not (isinstance(limit, token.Constant)
+                or (isinstance(limit, token.Identifier)
+                    and self._invariant_variable(loop, limit))):
+            return None
+        if (step > 0) != (op in ('LT', 'LTE',)):
+            return None
+        return variable, op, limit, step
+
+    def _start(self, loop, variable):
+        """ループの直前の文が i = C ならば定数 C を返す (それ以外は None)"""
+        nodes, index = loop.slot
+        if not isinstance(index, int) or index == 0:
+            return None
+        init = nodes[index - 1]
+        if (isinstance(init, token.BinaryOperator) and init.op == 'ASSIGN'
+                and init.left is variable
+                and isinstance(init.right, token.Constant)):
+            return init.right
+        return None
+
+    def _trip_count(self, loop, variable, op, limit, step):
+        """繰り返し回数 (分からない場合, i がオーバーフローする場合は None)"""
+        start = self._start(loop, variable)
+        if start is None or not isinstance(limit, token.Constant):
+            return None
+        start, end = start.value, limit.value
+        if step < 0:
+            # 増える場合に直す
+            start, end, step = -start, -end, -step
+        if op in ('LT', 'GT',):
+            trips = max(0, -((start - end) // step))
+        else:
+            trips = max(0, (end - start) // step + 1)
+        last = start + trips * step
+        if _signed(last) != last or _signed(-last) != -last:
+            return None
+        return trips
+
+    def _copies(self, body, count, share=True):
+        """本体の文を count 回並べた文のリスト
+
+        share が真ならば 1 つ目には元の本体の文を用いる
+        """
+        statements = token.StatementList()
+        for i in range(count):
+            if share and i == 0:
+                copy = body.statement_list
+            else:
+                copy = _clone(body.statement_list)
+            statements.nodes.extend(copy.nodes)
+        return statements
+
+
+class TailRecursion(_Transformer):
+    """自身への末尾呼び出しのループへの変換
+
+    return f(...); (f は定義中の関数) を, 引数をパラメータに代入して
+    関数の先頭に戻る文 (token.TailJump) に置き換える. 呼び出しごとに
+    スタックフレームを積まないため, 再帰の深さによらずスタックを使わない.
+
+    引数は NASMx86Generator と同じく右から順に評価する. 後で評価する引数が
+    読むパラメータには, 引数の値を一時変数に保持しておき, すべての引数を
+    評価してから代入する. 引数に代入 (++, -- を含む) がある呼び出しは
+    置き換えない. 関数定義の tail_calls と optimized に置き換えた数を数える
+    """
+    prefix = 'tail'
+
+    def a_FunctionDefinition(self, node):
+        self.function = node
+        self.parameters = [parameter.declarator.identifier
+                           for parameter in node.parameter_type_list.nodes]
+        self.calls = 0
+        # 引数を保持する一時変数 (呼び出しごとに使い回す)
+        self.pool = []
+        yield super(TailRecursion, self).a_FunctionDefinition(node)
+        if self.calls:
+            node.tail_calls = self.calls
+
+    def a_CompoundStatement(self, node):
+        return (node.statement_list,)
+
+    def a_StatementList(self, node):
+        return [self._statement((node.nodes, i,))
+                for i in range(len(node.nodes))]
+
+    def a_IfStatement(self, node):
+        return (self._statement((node, 'then_statement',)),
+                self._statement((node, 'else_statement',)),)
+
+    def a_WhileLoop(self, node):
+        return (self._statement((node, 'statement',)),)
+
+    def _statement(self, slot):
+        """slot の文が末尾呼び出しならば置き換え, それ以外の文ならば返す"""
+        statement = _get(slot)
+        if isinstance(statement, token.ReturnStatement):
+            self._replace(slot, statement.expr)
+        elif isinstance(statement, STATEMENTS):
+            return statement
+        return None
+
+    def _replace(self, slot, call):
+        identifier = self.function.declarator.identifier
+        if not (isinstance(call, token.FunctionExpression)
+                and call.function is identifier
+                and len(call.argument_list.nodes) == len(self.parameters)):
+            return
+        arguments = call.argument_list.nodes
+        for argument in arguments:
+            for node in _walk(argument):
+                if ((isinstance(node, token.BinaryOperator)
+                        and node.op in ASSIGNMENTS)
+                        or isinstance(node, (token.Increment,
+                                             token.Decrement,))):
+                    return
+
+        statements = token.StatementList()
+        assignments = []
+        order = list(reversed(range(len(arguments))))
+        for position, i in enumerate(order):
+            parameter, argument = self.parameters[i], arguments[i]
+            if argument is parameter:
+                continue
+            if any(node is parameter for j in order[position + 1:]
+                   for node in _walk(arguments[j])):
+                # 後で評価する引数が読むため, 値を一時変数に保持する
+                if len(assignments) == len(self.pool):
+                    self.pool.append(self._new_temporary())
+                temporary = self.pool[len(assignments)]
+                statements.add(
+                    token.BinaryOperator('ASSIGN', temporary, argument))
+                assignments.append(
+                    token.BinaryOperator('ASSIGN', parameter, temporary))
+            else:
+                statements.add(
+                    token.BinaryOperator('ASSIGN', parameter, argument))
+        statements.nodes.extend(assignments)
+        statements.add(token.TailJump())
+        _set(slot, token.CompoundStatement(token.DeclarationList(), statements))
+        self.calls += 1
+        self.optimized += 1
+        self.logger.info(
+            'Replace: tail call of {0} with a jump'.format(identifier.name))